@@ -0,0 +1,58 @@
+from collections import namedtuple
+
+from .cards import normalize_uid
+from .liveness import check_liveness, liveness_ok
+from .metrics import span, inc
+
+# Regras de acesso de um rosto reconhecido, sem interface: usadas pelo App e
+# pela simulação de carga (src.simulation), que assim seguem o mesmo fluxo
+# (prova de vida -> cartão -> ENTRADA/SAÍDA ou NEGADO no diário). Quem chama
+# cuida da porta (OPEN) e das mensagens para o usuário.
+
+# Resultado da validação do cartão: "liberado", "negado", "sem_cartao"
+# (usuário ainda sem cartão; o App oferece o cadastro) ou "cartao_de_outro"
+# (no cadastro, o cartão já pertence a `owner`)
+CardDecision = namedtuple("CardDecision", ["result", "action", "uid", "expected_uid", "owner"])
+
+
+# Prova de vida antes do cartão; reprovada, o acesso é registrado como NEGADO
+def verify_liveness(access_log, name, rgb_image, box, history):
+    with span("prova_de_vida"):
+        liveness = check_liveness(rgb_image, box, history)
+    if not liveness_ok(liveness):
+        inc("prova_de_vida_reprovada")
+        access_log.record(name, "NEGADO", None, f"prova de vida: {liveness.reason}")
+    return liveness
+
+
+# Confere o cartão lido com o cadastrado para o usuário e registra o evento
+def check_card(cards, access_log, name, uid):
+    uid = normalize_uid(uid)
+    expected_uid = cards.uid_of(name)
+    if expected_uid is None:
+        return CardDecision("sem_cartao", None, uid, None, None)
+    if expected_uid != uid:
+        inc("acessos_negados")
+        with span("registro_acesso"):
+            access_log.record(name, "NEGADO", uid, "cartão não corresponde ao rosto")
+        return CardDecision("negado", "NEGADO", uid, expected_uid, None)
+    inc("acessos_liberados")
+    action = "ENTRADA" if access_log.status(name) == "fora" else "SAÍDA"
+    with span("registro_acesso"):
+        access_log.record(name, action, uid)
+    return CardDecision("liberado", action, uid, expected_uid, None)
+
+
+# Associa o cartão lido a um usuário sem cartão e registra a ENTRADA
+def register_card(cards, access_log, name, uid):
+    uid = normalize_uid(uid)
+    owner = cards.owner_of(uid)
+    if owner:
+        access_log.record(name, "NEGADO", uid, f"cartão pertence a {owner}")
+        return CardDecision("cartao_de_outro", "NEGADO", uid, None, owner)
+    with span("gravacao_cartoes"):
+        cards.bind(name, uid)
+    inc("acessos_liberados")
+    with span("registro_acesso"):
+        access_log.record(name, "ENTRADA", uid, "cartão registrado")
+    return CardDecision("liberado", "ENTRADA", uid, uid, None)
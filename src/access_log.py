@@ -0,0 +1,218 @@
+import os, json, time, queue, sqlite3, threading
+from datetime import datetime
+
+DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+# Ações que alteram o status dentro/fora do usuário
+STATUS_BY_ACTION = {"ENTRADA": "dentro", "SAÍDA": "fora"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    name TEXT,
+    action TEXT NOT NULL,
+    uid TEXT,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS idx_events_name_ts ON events(name, ts);
+CREATE TABLE IF NOT EXISTS user_state (
+    name TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    last_access REAL
+);
+"""
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def format_ts(ts):
+    return datetime.fromtimestamp(ts).strftime(DATE_FORMAT) if ts else "Nunca"
+
+
+# Diário de acessos somente-anexação (SQLite em modo WAL). Cada evento
+# (ENTRADA, SAÍDA, NEGADO...) é registrado; o status atual e o último acesso
+# por usuário ficam em uma tabela derivada e num cache em memória. As
+# gravações são feitas em lote por uma thread própria, fora da interface.
+# O status é sempre o do evento mais recente (pelo horário), mesmo que os
+# eventos cheguem fora de ordem (ex.: replicados de outra porta);
+# `on_record` é avisado de cada evento registrado localmente.
+class AccessLog:
+    def __init__(self, path, flush_interval=0.5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.on_error = None
+        self.on_record = None
+        created = not os.path.exists(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._read_conn = _connect(path)
+        self._read_conn.executescript(_SCHEMA)
+        self._read_lock = threading.Lock()
+        self._state = {
+            name: [status, last]
+            for name, status, last in self._read_conn.execute("SELECT name, status, last_access FROM user_state")
+        }
+        self.is_new = created
+        self._queue = queue.Queue()
+        # eventos na fila ainda não gravados, na mesma ordem da fila (as
+        # consultas juntam estes aos do banco em vez de esperar o gravador)
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Registra um evento; o cache é atualizado na hora e o disco em lote
+    def record(self, name, action, uid=None, detail=None, ts=None, notify=True):
+        ts = time.time() if ts is None else ts
+        status = STATUS_BY_ACTION.get(action)
+        if status is not None:
+            state = self._state.get(name)
+            if state is None or state[1] is None or ts >= state[1]:
+                self._state[name] = [status, ts]
+        event = (ts, name, action, uid, detail)
+        with self._pending_lock:
+            self._pending.append(event)
+            self._queue.put(event)
+        if notify and self.on_record:
+            self.on_record(ts, name, action, uid, detail)
+        return ts
+
+    # {nome: (status, último acesso)}
+    def states(self):
+        return {name: tuple(state) for name, state in list(self._state.items())}
+
+    # Aplica um status vindo de fora (retrato de outro nó) se for mais recente
+    def merge_state(self, name, status, ts):
+        state = self._state.get(name)
+        if state is not None and state[1] is not None and (ts is None or ts < state[1]):
+            return False
+        self._state[name] = [status, ts]
+        with self._read_lock, self._read_conn:
+            self._read_conn.execute(
+                "INSERT OR REPLACE INTO user_state (name, status, last_access) VALUES (?, ?, ?)", (name, status, ts)
+            )
+        return True
+
+    def status(self, name, default="fora"):
+        state = self._state.get(name)
+        return state[0] if state else default
+
+    def last_access(self, name):
+        state = self._state.get(name)
+        return state[1] if state else None
+
+    def last_access_str(self, name):
+        return format_ts(self.last_access(name))
+
+    def current_status(self):
+        return {name: state[0] for name, state in self._state.items()}
+
+    # Consulta de eventos por intervalo de tempo (e opcionalmente usuário),
+    # do mais recente para o mais antigo
+    def events(self, start=None, end=None, name=None, limit=None):
+        lo = start if start is not None else 0
+        hi = end if end is not None else float("inf")
+        # a cópia dos pendentes vem antes da consulta: um evento gravado no
+        # meio aparece nas duas (e é descartado como repetido), nunca em nenhuma
+        with self._pending_lock:
+            pending = [e for e in self._pending if lo <= e[0] <= hi and (name is None or e[1] == name)]
+        sql = "SELECT ts, name, action, uid, detail FROM events WHERE ts >= ? AND ts <= ?"
+        params = [lo, hi]
+        if name is not None:
+            sql += " AND name = ?"
+            params.append(name)
+        sql += " ORDER BY ts DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._read_lock:
+            rows = self._read_conn.execute(sql, params).fetchall()
+        if not pending:
+            return rows
+        rows = sorted(set(rows) | set(pending), key=lambda e: e[0], reverse=True)
+        return rows[:limit] if limit else rows
+
+    # Espera até que todos os eventos pendentes estejam gravados
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        with self._read_lock:
+            self._read_conn.close()
+
+    def _run(self):
+        conn = _connect(self.path)
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            events = [e for e in batch if e is not None]
+            running = len(events) == len(batch)
+            try:
+                self._write(conn, events)
+            except Exception as e:
+                message = f"[ERRO] Falha ao gravar o diário de acessos: {e}"
+                if self.on_error:
+                    self.on_error(message)
+                else:
+                    print(message)
+            with self._pending_lock:
+                del self._pending[:len(events)]
+            for _ in batch:
+                self._queue.task_done()
+        conn.close()
+
+    @staticmethod
+    def _write(conn, events):
+        if not events:
+            return
+        with conn:
+            conn.executemany("INSERT INTO events (ts, name, action, uid, detail) VALUES (?, ?, ?, ?, ?)", events)
+            conn.executemany(
+                "INSERT INTO user_state (name, status, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET status = excluded.status, last_access = excluded.last_access "
+                "WHERE excluded.last_access >= IFNULL(user_state.last_access, 0)",
+                [(name, STATUS_BY_ACTION[action], ts) for ts, name, action, _, _ in events if action in STATUS_BY_ACTION],
+            )
+
+    # Importação única dos antigos last_access.json e status.json
+    def import_json(self, last_access_file, status_file):
+        def read(path):
+            if not os.path.exists(path):
+                return {}
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception:
+                return {}
+
+        last_access, status = read(last_access_file), read(status_file)
+        rows = []
+        for name in set(last_access) | set(status):
+            try:
+                ts = datetime.strptime(last_access[name], DATE_FORMAT).timestamp() if name in last_access else None
+            except ValueError:
+                ts = None
+            rows.append((name, status.get(name, "fora"), ts))
+            self._state[name] = [status.get(name, "fora"), ts]
+        with self._read_lock, self._read_conn:
+            self._read_conn.executemany(
+                "INSERT OR REPLACE INTO user_state (name, status, last_access) VALUES (?, ?, ?)", rows
+            )
+        return len(rows)
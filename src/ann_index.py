@@ -0,0 +1,186 @@
+import os, time, zlib
+import numpy as np
+
+# Índice aproximado (IVF): as codificações são particionadas por k-means e
+# a busca só percorre as `n_probe` partições mais próximas da consulta.
+# Quanto maior `n_probe`, maior o recall e maior a latência.
+class IVFIndex:
+    def __init__(self, n_lists=None, n_probe=8, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self.centroids = None
+        self.trained_count = 0
+        self._assign = np.empty(0, dtype=np.int32)
+        self._lists = []
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        return sum(len(lst) for lst in self._lists)
+
+    @staticmethod
+    def _sq_dists(vectors, centroids):
+        c_norms = np.einsum("ij,ij->i", centroids, centroids)
+        v_norms = np.einsum("ij,ij->i", vectors, vectors)
+        return v_norms[:, None] + c_norms[None, :] - 2.0 * (vectors @ centroids.T)
+
+    def _nearest_list(self, vectors, chunk=8192):
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk]
+            out[start:start + chunk] = np.argmin(self._sq_dists(block, self.centroids), axis=1)
+        return out
+
+    # Treina os centróides (k-means) e distribui todas as linhas da matriz
+    def build(self, matrix, iterations=10, sample_per_list=256):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        count = len(matrix)
+        if not count:
+            raise ValueError("Não é possível treinar o índice com a galeria vazia.")
+        n_lists = min(self.n_lists or max(1, int(4 * np.sqrt(count))), count)
+        rng = np.random.default_rng(self.seed)
+        sample = matrix[rng.choice(count, min(count, n_lists * sample_per_list), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            self.centroids = centroids
+            labels = self._nearest_list(sample)
+            sizes = np.bincount(labels, minlength=n_lists)
+            order = np.argsort(labels, kind="stable")
+            sums = np.zeros_like(centroids)
+            filled = sizes > 0
+            sums[filled] = np.add.reduceat(sample[order], np.concatenate(([0], np.cumsum(sizes)[:-1]))[filled])
+            empty = sizes == 0
+            if empty.any():
+                # partições vazias recebem pontos aleatórios da amostra
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+                sizes[empty] = 1
+            centroids = sums / sizes[:, None]
+        self.centroids = centroids.astype(np.float32)
+        self.n_lists = len(self.centroids)
+        self.trained_count = count
+        self._set_assignments(self._nearest_list(matrix))
+        return self
+
+    def _set_assignments(self, assign):
+        self._assign = np.asarray(assign, dtype=np.int32).copy()
+        order = np.argsort(self._assign, kind="stable")
+        bounds = np.searchsorted(self._assign[order], np.arange(self.n_lists + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]].tolist() for i in range(self.n_lists)]
+
+    # Inserção incremental de uma nova linha da galeria
+    def add(self, row, vector):
+        lst = int(self._nearest_list(np.asarray(vector, dtype=np.float32)[None, :])[0])
+        if row >= len(self._assign):
+            grown = np.full(max(row + 1, 2 * len(self._assign)), -1, dtype=np.int32)
+            grown[:len(self._assign)] = self._assign
+            self._assign = grown
+        self._assign[row] = lst
+        self._lists[lst].append(row)
+
+    def remove(self, row):
+        lst = self._assign[row]
+        if lst >= 0:
+            self._lists[lst].remove(row)
+            self._assign[row] = -1
+
+    # Atualiza o índice quando a galeria move uma linha de posição
+    def move(self, old_row, new_row):
+        lst = self._assign[old_row]
+        if lst < 0:
+            return
+        self._lists[lst][self._lists[lst].index(old_row)] = new_row
+        self._assign[new_row] = lst
+        self._assign[old_row] = -1
+
+    # Linhas candidatas para uma consulta (partições mais próximas)
+    def candidates(self, query, n_probe=None):
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        d = self._sq_dists(np.asarray(query, dtype=np.float32)[None, :], self.centroids)[0]
+        probes = np.argpartition(d, n_probe - 1)[:n_probe] if n_probe < self.n_lists else range(self.n_lists)
+        rows = [r for p in probes for r in self._lists[p]]
+        return np.fromiter(rows, dtype=np.intp, count=len(rows))
+
+    # O índice deve ser retreinado quando a galeria cresceu muito desde o k-means
+    def needs_rebuild(self, count):
+        return not self.is_trained or count > 4 * max(self.trained_count, 1)
+
+    def save(self, path, names):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f, centroids=self.centroids, assign=self._assign[:len(names)],
+                n_probe=self.n_probe, trained_count=self.trained_count,
+                fingerprint=names_fingerprint(names),
+            )
+        os.replace(tmp, path)
+
+    # Carrega um índice salvo. Se as linhas da galeria mudaram de ordem desde
+    # que ele foi salvo, os centróides são reaproveitados e as linhas de
+    # `matrix` redistribuídas; sem `matrix` o índice é descartado (None).
+    @classmethod
+    def load(cls, path, names, matrix=None):
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                index = cls(n_lists=len(data["centroids"]), n_probe=int(data["n_probe"]))
+                index.centroids = data["centroids"].astype(np.float32)
+                index.trained_count = int(data["trained_count"])
+                if int(data["fingerprint"]) == names_fingerprint(names):
+                    index._set_assignments(data["assign"])
+                elif matrix is not None and len(matrix):
+                    index._set_assignments(index._nearest_list(np.asarray(matrix, dtype=np.float32)))
+                else:
+                    return None
+        except Exception:
+            return None
+        return index
+
+
+def names_fingerprint(names):
+    return zlib.crc32("\n".join(names).encode("utf-8"))
+
+
+# Compara o top-1 do índice com a busca exaustiva para ajustar `n_probe`
+def measure_recall(gallery, index, n_queries=200, noise=0.02, n_probe=None, seed=0):
+    count = len(gallery)
+    if not count:
+        return {"recall": 1.0, "brute_ms": 0.0, "ann_ms": 0.0, "candidates": 0.0}
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(count, min(n_queries, count), replace=False)
+    queries = gallery.encodings[rows] + rng.normal(0, noise, (len(rows), gallery.encodings.shape[1])).astype(np.float32)
+    hits, brute_t, ann_t, n_cand = 0, 0.0, 0.0, 0
+    for q in queries:
+        t0 = time.perf_counter()
+        expected = int(np.argmin(gallery.distances(q)))
+        t1 = time.perf_counter()
+        cand = index.candidates(q, n_probe=n_probe)
+        got = int(cand[np.argmin(gallery.distances(q, rows=cand))]) if len(cand) else -1
+        t2 = time.perf_counter()
+        hits += got == expected
+        brute_t += t1 - t0
+        ann_t += t2 - t1
+        n_cand += len(cand)
+    n = len(queries)
+    return {
+        "recall": hits / n,
+        "brute_ms": 1000 * brute_t / n,
+        "ann_ms": 1000 * ann_t / n,
+        "candidates": n_cand / n,
+    }
+
+
+if __name__ == "__main__":
+    from .gallery import FaceGallery
+    from .utils import load_known_faces, index_file
+
+    gallery = FaceGallery(*load_known_faces())
+    index = IVFIndex.load(index_file, gallery.names) or IVFIndex().build(gallery.encodings)
+    print(f"{len(gallery)} rostos, {index.n_lists} partições")
+    for n_probe in (1, 2, 4, 8, 16, 32):
+        r = measure_recall(gallery, index, n_probe=n_probe)
+        print(f"n_probe={n_probe:3d} recall={r['recall']:.3f} candidatos={r['candidates']:.0f} "
+              f"exaustiva={r['brute_ms']:.2f}ms índice={r['ann_ms']:.2f}ms")
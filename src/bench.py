@@ -0,0 +1,219 @@
+import os, sys, json, time, shutil, argparse, platform, tempfile, tracemalloc
+import numpy as np
+
+from .gallery import FaceGallery, ENCODING_DIM
+from .ann_index import IVFIndex
+from .store import EncodingStore
+from .cards import CardRegistry
+from .access_log import AccessLog
+
+baseline_file = "bench_baseline.json"
+
+# Piora relativa (no p50) a partir da qual um caso é considerado regressão
+REGRESSION_LIMIT = 0.25
+
+
+# Galeria sintética: vetores aleatórios agrupados por "usuário" (3 amostras
+# cada), parecidos com codificações reais, sempre com a mesma semente
+def synthetic_gallery(size, seed=0):
+    rng = np.random.default_rng(seed)
+    users = max(1, size // 3)
+    centers = rng.normal(0, 0.09, (users, ENCODING_DIM)).astype(np.float32)
+    owner = np.arange(size) % users
+    matrix = centers[owner] + rng.normal(0, 0.02, (size, ENCODING_DIM)).astype(np.float32)
+    names = [f"usuario_{i:07d}.png" for i in owner]
+    return matrix, names
+
+
+def synthetic_queries(matrix, count, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(matrix), count)
+    return matrix[rows] + rng.normal(0, 0.02, (count, ENCODING_DIM)).astype(np.float32)
+
+
+# Imagem de teste com um "rosto" desenhado (elipse clara com olhos e boca);
+# serve para medir o custo da detecção/codificação sem câmera
+def fixture_frame(width, height, seed=0):
+    import cv2
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+    cx, cy, r = width // 2, height // 2, min(width, height) // 4
+    cv2.ellipse(frame, (cx, cy), (int(r * 0.8), r), 0, 0, 360, (150, 170, 210), -1)
+    for dx in (-r // 3, r // 3):
+        cv2.circle(frame, (cx + dx, cy - r // 4), max(2, r // 10), (40, 40, 40), -1)
+    cv2.ellipse(frame, (cx, cy + r // 2), (r // 3, max(2, r // 10)), 0, 0, 180, (60, 40, 120), -1)
+    location = (cy - r, cx + int(r * 0.8), cy + r, cx - int(r * 0.8))
+    return frame, location
+
+
+# Executa `fn` repetidas vezes e devolve percentis de latência, vazão e o
+# pico de memória alocada (medido numa execução separada com tracemalloc,
+# para não distorcer os tempos)
+def measure(fn, repeat=50, warmup=3, ops_per_call=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ms = np.array(times) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "media_ms": float(ms.mean()),
+        "ops_s": ops_per_call * len(times) / max(sum(times), 1e-12),
+        "pico_kb": peak / 1024,
+    }
+
+
+def bench_matching(sizes, repeat, results, progress):
+    for size in sizes:
+        matrix, names = synthetic_gallery(size)
+        gallery = FaceGallery(matrix, names)
+        queries = synthetic_queries(matrix, max(repeat, 64))
+        it = iter(range(1 << 62))
+        results[f"match/{size}"] = measure(lambda: gallery.match(queries[next(it) % len(queries)]), repeat)
+        results[f"match_batch64/{size}"] = measure(lambda: gallery.match_batch(queries[:64]), repeat,
+                                                   ops_per_call=64)
+        if size >= 10000:
+            t0 = time.perf_counter()
+            index = IVFIndex(n_probe=8).build(gallery.encodings)
+            results[f"ivf_build/{size}"] = {"p50_ms": 1000 * (time.perf_counter() - t0)}
+            gallery.attach_index(index)
+            results[f"match_ivf/{size}"] = measure(lambda: gallery.match(queries[next(it) % len(queries)]), repeat)
+        progress(f"correspondência com {size} rostos concluída")
+
+
+def bench_store(sizes, repeat, workdir, results, progress):
+    for size in sizes:
+        matrix, names = synthetic_gallery(size)
+        base = os.path.join(workdir, f"store_{size}")
+        store = EncodingStore(base)
+        n = max(3, min(repeat, 20))
+        results[f"store_rewrite/{size}"] = measure(lambda: store.rewrite(matrix, names), n, warmup=1)
+        results[f"store_load/{size}"] = measure(lambda: EncodingStore(base).load(), n, warmup=1)
+        vector = matrix[0]
+        results[f"store_append/{size}"] = measure(lambda: store.append("novo.png", vector), repeat, warmup=1)
+        progress(f"armazenamento com {size} rostos concluído")
+
+
+# Gravações de status: diário de acessos (que substituiu status.json e
+# last_access.json) e o registro de cartões
+def bench_status(repeat, workdir, results, progress):
+    # sem janela de agrupamento: o flush mede só o custo do commit em disco
+    log = AccessLog(os.path.join(workdir, "access_log.db"), flush_interval=0.0)
+    users = [f"usuario_{i}.png" for i in range(1000)]
+    it = iter(range(1 << 62))
+
+    def record_and_flush():
+        name = users[next(it) % len(users)]
+        log.record(name, "ENTRADA" if next(it) % 2 else "SAÍDA")
+        log.flush()
+
+    results["access_log_record"] = measure(lambda: log.record(users[next(it) % len(users)], "ENTRADA"), repeat)
+    results["access_log_record_flush"] = measure(record_and_flush, max(3, repeat // 5), warmup=1)
+    log.close()
+    registry = CardRegistry(os.path.join(workdir, "cards.pkl"))
+    for i, name in enumerate(users):
+        registry.bind(name, f"{i:08X}")
+    results["cards_save/1000"] = measure(registry.save, max(3, repeat // 5), warmup=1)
+    progress("gravações de status concluídas")
+
+
+def bench_vision(frame_sizes, repeat, results, progress):
+    import cv2
+    from .utils import detect_faces, encode_face, get_face_encoding
+    for width, height in frame_sizes:
+        frame, location = fixture_frame(width, height)
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        key = f"{width}x{height}"
+        results[f"conversao/{key}"] = measure(lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), repeat)
+        results[f"deteccao/{key}"] = measure(lambda: detect_faces(rgb), repeat)
+        results[f"codificacao/{key}"] = measure(lambda: encode_face(rgb, location), repeat)
+        results[f"get_face_encoding/{key}"] = measure(lambda: get_face_encoding(frame), repeat)
+        progress(f"visão em {key} concluída")
+
+
+# Compara com a linha de base; devolve a lista de casos que pioraram
+def compare(results, baseline, limit=REGRESSION_LIMIT):
+    regressions = []
+    for case, current in sorted(results.items()):
+        previous = baseline.get(case)
+        if not previous:
+            continue
+        before, after = previous["p50_ms"], current["p50_ms"]
+        if before > 0 and after > before * (1 + limit):
+            regressions.append((case, before, after))
+    return regressions
+
+
+def format_results(results):
+    lines = []
+    for case, r in sorted(results.items()):
+        extra = "".join(f"  {k}={r[k]:.3f}" for k in ("p95_ms", "p99_ms") if k in r)
+        extra += "".join(f"  {k}={r[k]:.1f}" for k in ("ops_s", "pico_kb") if k in r)
+        lines.append(f"{case:32s} p50_ms={r['p50_ms']:.3f}{extra}")
+    return "\n".join(lines)
+
+
+def _frame_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Medição de desempenho (offline, sem câmera nem Arduino).")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="tamanhos das galerias sintéticas (ex.: 1000 10000 1000000)")
+    parser.add_argument("--quadros", type=_frame_size, nargs="+", default=[(640, 480)],
+                        help="tamanhos de frame para detecção/codificação (ex.: 640x480 1280x720)")
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--casos", nargs="+", default=["correspondencia", "armazenamento", "status", "visao"],
+                        choices=["correspondencia", "armazenamento", "status", "visao"])
+    parser.add_argument("--linha-base", default=baseline_file, help="arquivo JSON com os resultados de referência")
+    parser.add_argument("--salvar-linha-base", action="store_true", help="grava os resultados como nova referência")
+    parser.add_argument("--limite", type=float, default=REGRESSION_LIMIT, help="piora relativa tolerada no p50")
+    args = parser.parse_args(argv)
+
+    progress = lambda message: print(f"... {message}", file=sys.stderr)
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="pfr_bench_")
+    try:
+        if "correspondencia" in args.casos:
+            bench_matching(args.tamanhos, args.repeticoes, results, progress)
+        if "armazenamento" in args.casos:
+            bench_store(args.tamanhos, args.repeticoes, workdir, results, progress)
+        if "status" in args.casos:
+            bench_status(args.repeticoes, workdir, results, progress)
+        if "visao" in args.casos:
+            bench_vision(args.quadros, max(3, args.repeticoes // 5), results, progress)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Python {platform.python_version()}, numpy {np.__version__}, {platform.machine()}")
+    print(format_results(results))
+
+    if args.salvar_linha_base:
+        with open(args.linha_base, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Linha de base gravada em {args.linha_base}")
+        return 0
+    if os.path.exists(args.linha_base):
+        with open(args.linha_base, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.limite)
+        for case, before, after in regressions:
+            print(f"[REGRESSÃO] {case}: p50 {before:.3f} ms -> {after:.3f} ms")
+        if regressions:
+            return 1
+        print("Nenhuma regressão em relação à linha de base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
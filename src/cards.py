@@ -0,0 +1,119 @@
+import os, re, pickle, threading
+
+from .persistence import atomic_write
+
+
+# Padroniza o UID lido do leitor: só dígitos hexadecimais, em maiúsculas
+def normalize_uid(uid):
+    return re.sub(r"[^0-9A-Fa-f]", "", uid or "").upper()
+
+
+# Cadastro de cartões mantido em memória com índices nos dois sentidos
+# (nome -> UID e UID -> nome). Cada alteração é gravada de forma atômica (na
+# hora ou, com um `writer`, em segundo plano e agrupada), e mudanças feitas por
+# outro processo/quiosque no arquivo são detectadas pela data de modificação
+# e tamanho antes de cada consulta. `on_change(nome, uid ou None)` é avisado
+# das alterações locais (notify=False nas que vêm de outro nó).
+class CardRegistry:
+    def __init__(self, path, writer=None):
+        self.path = path
+        self.writer = writer
+        self.on_change = None
+        self._lock = threading.RLock()
+        self._by_name = {}
+        self._by_uid = {}
+        self._stamp = None
+        self._version = 0
+        self._saved = 0
+        self.reload()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def reload(self):
+        with self._lock:
+            stamp = self._file_stamp()
+            data = {}
+            if stamp is not None:
+                with open(self.path, "rb") as f:
+                    data = pickle.load(f)
+            self._by_name = {name: normalize_uid(uid) for name, uid in data.items()}
+            self._by_uid = {uid: name for name, uid in self._by_name.items()}
+            self._stamp = stamp
+
+    def refresh_if_changed(self):
+        with self._lock:
+            # com gravação pendente o estado em memória é o mais recente
+            if self._saved != self._version:
+                return
+            if self._file_stamp() != self._stamp:
+                self.reload()
+
+    def __contains__(self, name):
+        self.refresh_if_changed()
+        return name in self._by_name
+
+    def __len__(self):
+        self.refresh_if_changed()
+        return len(self._by_name)
+
+    def uid_of(self, name):
+        self.refresh_if_changed()
+        return self._by_name.get(name)
+
+    def owner_of(self, uid):
+        self.refresh_if_changed()
+        return self._by_uid.get(normalize_uid(uid))
+
+    def items(self):
+        self.refresh_if_changed()
+        return list(self._by_name.items())
+
+    # Associa um cartão a um usuário; falha se o cartão já pertence a outro
+    def bind(self, name, uid, notify=True):
+        uid = normalize_uid(uid)
+        with self._lock:
+            self.refresh_if_changed()
+            owner = self._by_uid.get(uid)
+            if owner is not None and owner != name:
+                raise ValueError(f"Cartão {uid} já associado a {owner}")
+            previous = self._by_name.get(name)
+            if previous is not None:
+                self._by_uid.pop(previous, None)
+            self._by_name[name] = uid
+            self._by_uid[uid] = name
+            self.save()
+        if notify and self.on_change:
+            self.on_change(name, uid)
+
+    def unbind(self, name, notify=True):
+        with self._lock:
+            self.refresh_if_changed()
+            uid = self._by_name.pop(name, None)
+            if uid is None:
+                return None
+            self._by_uid.pop(uid, None)
+            self.save()
+        if notify and self.on_change:
+            self.on_change(name, None)
+        return uid
+
+    # Grava um retrato do cadastro (em arquivo temporário + rename atômico)
+    def save(self):
+        with self._lock:
+            self._version += 1
+            data, version = dict(self._by_name), self._version
+            if self.writer is None:
+                self._write(data, version)
+                return
+        self.writer.submit(self.path, lambda: self._write(data, version))
+
+    def _write(self, data, version):
+        atomic_write(self.path, pickle.dumps(data))
+        with self._lock:
+            self._saved = max(self._saved, version)
+            self._stamp = self._file_stamp()
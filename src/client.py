@@ -0,0 +1,222 @@
+import os, sys, hmac, json, time, uuid, base64, socket, hashlib, ipaddress, threading, argparse
+
+from .gallery import MatchResult
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5055
+# Segredo do serviço de reconhecimento; obrigatório quando ele escuta fora
+# da própria máquina. Com segredo toda mensagem (pedido e resposta) é
+# assinada com HMAC-SHA256, leva um identificador único também assinado e
+# só vale por AUTH_WINDOW segundos; dentro da janela cada identificador é
+# aceito uma única vez (ReplayGuard).
+SECRET_ENV = "PFR_SERVICO_SEGREDO"
+AUTH_WINDOW = 120.0
+
+
+# Protocolo do serviço: uma mensagem JSON por linha, nos dois sentidos
+def send_message(sock_file, message):
+    sock_file.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+    sock_file.flush()
+
+
+def read_message(sock_file):
+    line = sock_file.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+def _signature(secret, message):
+    body = {k: v for k, v in message.items() if k not in ("id", "ok", "auth")}
+    data = json.dumps(body, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hmac.new(secret.encode("utf-8"), data, hashlib.sha256).hexdigest()
+
+
+def sign(secret, message):
+    message["auth_ts"] = time.time()
+    message["auth_id"] = uuid.uuid4().hex
+    message["auth"] = _signature(secret, message)
+    return message
+
+
+# Com `guard`, uma mensagem já aceita (mesmo auth_id) é recusada
+def verify(secret, message, guard=None):
+    ts = message.get("auth_ts")
+    if not isinstance(ts, (int, float)) or abs(time.time() - ts) > AUTH_WINDOW \
+            or not isinstance(message.get("auth_id"), str):
+        raise PermissionError("Mensagem sem assinatura válida.")
+    if not hmac.compare_digest(_signature(secret, message), str(message.get("auth", ""))):
+        raise PermissionError("Mensagem sem assinatura válida.")
+    if guard is not None:
+        guard.check(message["auth_id"], ts)
+
+
+# Identificadores das mensagens aceitas, guardados enquanto a assinatura
+# delas ainda vale: uma mensagem capturada e reenviada dentro da janela é
+# recusada (depois dela, a verificação do horário já a recusa)
+class ReplayGuard:
+    def __init__(self, window=AUTH_WINDOW):
+        self.window = window
+        self._seen = {}
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def check(self, message_id, ts):
+        now = time.time()
+        with self._lock:
+            if now >= self._next_prune:
+                self._seen = {k: expires for k, expires in self._seen.items() if expires > now}
+                self._next_prune = now + self.window / 4
+            if message_id in self._seen:
+                raise PermissionError("Mensagem repetida recusada.")
+            self._seen[message_id] = ts + self.window
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def encode_image(frame):
+    import cv2
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise ValueError("Falha ao codificar a imagem.")
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+def decode_image(data):
+    import cv2, numpy as np
+    buf = np.frombuffer(base64.b64decode(data), dtype=np.uint8)
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+# Cliente do serviço de reconhecimento (src.server); usado pelo App no modo
+# cliente leve e para testes via loopback. Com `secret` os pedidos são
+# assinados e as respostas conferidas.
+class RecognitionClient:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=15.0, secret=None):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.secret = secret
+        self._guard = ReplayGuard()
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def _ensure_connected(self):
+        if self._sock is None:
+            self._sock = socket.create_connection(self.address, timeout=self.timeout)
+            self._file = self._sock.makefile("rwb")
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = self._file = None
+
+    def call(self, op, **payload):
+        with self._lock:
+            self._next_id += 1
+            message = dict(payload, op=op, id=self._next_id)
+            if self.secret:
+                sign(self.secret, message)
+            for attempt in (1, 2):
+                try:
+                    self._ensure_connected()
+                    send_message(self._file, message)
+                    reply = read_message(self._file)
+                    if reply is None:
+                        raise ConnectionError("Conexão encerrada pelo servidor.")
+                    break
+                except OSError:
+                    # reconecta uma vez (ex.: servidor reiniciado)
+                    self._disconnect()
+                    if attempt == 2:
+                        raise
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error", "Erro desconhecido no servidor."))
+        if self.secret:
+            verify(self.secret, reply, self._guard)
+        return reply
+
+    # Retorna (rosto_detectado, MatchResult ou None)
+    def identify(self, frame=None, encoding=None, tolerance=None):
+        payload = {"tolerance": tolerance} if tolerance is not None else {}
+        if encoding is not None:
+            payload["encoding"] = [float(v) for v in encoding]
+        else:
+            payload["image"] = encode_image(frame)
+        reply = self.call("identify", **payload)
+        match = reply.get("match")
+        return reply["face"], MatchResult(**match) if match else None
+
+    # Com `frames` (rajada do cadastro) o serviço escolhe os modelos
+    def enroll(self, name, frame=None, encoding=None, frames=None):
+        payload = {"name": name}
+        if encoding is not None:
+            payload["encoding"] = [float(v) for v in encoding]
+        if frame is not None:
+            payload["image"] = encode_image(frame)
+        if frames:
+            payload["images"] = [encode_image(f) for f in frames]
+        return self.call("enroll", **payload)["face"]
+
+    def remove(self, name):
+        return self.call("remove", name=name)["removed"]
+
+    def names(self):
+        return self.call("names")["names"]
+
+    def stats(self):
+        return self.call("stats")["stats"]
+
+
+def main(argv=None):
+    import cv2
+    parser = argparse.ArgumentParser(description="Cliente de teste do serviço de reconhecimento.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--porta", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--segredo", default=os.environ.get(SECRET_ENV),
+                        help=f"segredo do serviço (padrão: variável {SECRET_ENV})")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("identificar")
+    p.add_argument("imagem")
+    p = sub.add_parser("cadastrar")
+    p.add_argument("nome")
+    p.add_argument("imagem")
+    p = sub.add_parser("remover")
+    p.add_argument("nome")
+    sub.add_parser("usuarios")
+    sub.add_parser("estatisticas")
+    args = parser.parse_args(argv)
+
+    client = RecognitionClient(args.host, args.porta, secret=args.segredo)
+    if args.comando == "identificar":
+        print(client.identify(cv2.imread(args.imagem)))
+    elif args.comando == "cadastrar":
+        print(client.enroll(args.nome, cv2.imread(args.imagem)))
+    elif args.comando == "remover":
+        print(client.remove(args.nome))
+    elif args.comando == "usuarios":
+        print("\n".join(client.names()))
+    else:
+        print(client.stats())
+    client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
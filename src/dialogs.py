@@ -1,12 +1,29 @@
-import cv2, time, re
+import time
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QDialogButtonBox, QMessageBox
 from PyQt5.QtGui import QPixmap, QImage
-from PyQt5.QtCore import Qt, QTimer, QEventLoop
+from PyQt5.QtCore import Qt, QTimer, QEventLoop, QObject, pyqtSignal
+
+from .serial_io import SerialEvent, CardEvent
+from .metrics import span, inc
+from .frames import FrameBuffer, open_source
+from .liveness import FrameHistory
+
+# Tamanho e intervalo mínimo (segundos) da pré-visualização; a câmera
+# continua sendo lida a cada 30 ms, independente da prévia
+PREVIEW_SIZE = (600, 400)
+PREVIEW_INTERVAL = 0.066
+
+# Na captura em rajada, um frame a cada BURST_STEP leituras (~90 ms), para
+# que as amostras não sejam quase idênticas
+BURST_STEP = 3
 
 # --- Janela de pré-visualização ---
+# Com burst > 1, ao confirmar o diálogo continua lendo a câmera e guarda
+# `burst` frames (usado no cadastro com várias amostras)
 class CaptureDialog(QDialog):
-    def __init__(self):
+    def __init__(self, burst=1, source=0):
         super().__init__()
+        self.burst = burst
         self.setWindowTitle("Pré-visualização do Rosto")
         self.setGeometry(500, 250, 640, 480)
 
@@ -15,33 +32,81 @@ class CaptureDialog(QDialog):
         self.label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.label)
 
-        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-        buttons.accepted.connect(self.accept)
-        buttons.rejected.connect(self.reject)
-        layout.addWidget(buttons)
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.buttons.accepted.connect(self.accept)
+        self.buttons.rejected.connect(self.reject)
+        layout.addWidget(self.buttons)
 
         self.setLayout(layout)
 
-        self.cap = cv2.VideoCapture(0)
+        self.cap = open_source(source)
+        self.buffer = FrameBuffer()
+        # miniaturas dos últimos frames, reaproveitadas pela prova de vida
+        self.history = FrameHistory()
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
         self.timer.start(30)
 
-        self.captured_frame = None
+        self.captured = []
+        self._burst = None
+        self._last_preview = 0.0
 
-    def update_frame(self):
-        ret, frame = self.cap.read()
-        if ret:
-            self.captured_frame = frame
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb.shape
-            qimg = QImage(rgb.data, w, h, ch * w, QImage.Format_RGB888)
-            self.label.setPixmap(QPixmap.fromImage(qimg).scaled(600, 400, Qt.KeepAspectRatio))
+    # Último frame aceito, em BGR e em RGB
+    @property
+    def captured_frame(self):
+        return self.captured[-1][0] if self.captured else None
+
+    @property
+    def captured_rgb(self):
+        return self.captured[-1][1] if self.captured else None
 
+    def update_frame(self):
+        with span("camera_leitura"):
+            ret = self.buffer.read(self.cap)
+        if not ret:
+            inc("camera_falhas")
+            return
+        inc("camera_frames")
+        self.history.push(self.buffer.bgr)
+        if self._burst is not None:
+            self._collect_burst()
+        now = time.monotonic()
+        if now - self._last_preview < PREVIEW_INTERVAL:
+            return
+        self._last_preview = now
+        with span("previa"):
+            small = self.buffer.preview(*PREVIEW_SIZE)
+            h, w, ch = small.shape
+            qimg = QImage(small.data, w, h, ch * w, QImage.Format_RGB888)
+            self.label.setPixmap(QPixmap.fromImage(qimg))
+
+    # Os frames da rajada são copiados, pois o buffer é reaproveitado
+    def _collect_burst(self):
+        self._burst_reads += 1
+        if (self._burst_reads - 1) % BURST_STEP:
+            return
+        self._burst.append((self.buffer.bgr.copy(), self.buffer.rgb().copy()))
+        self.setWindowTitle(f"Capturando amostras... {len(self._burst)}/{self.burst}")
+        if len(self._burst) >= self.burst:
+            self.captured, self._burst = self._burst, None
+            self._finish()
+
+    # Com a câmera parada o buffer não é mais sobrescrito, então o frame
+    # aceito (BGR) e sua versão RGB são entregues sem cópia
     def accept(self):
-        if self.captured_frame is None:
+        if self.buffer.bgr is None:
             QMessageBox.warning(self, "Erro", "Nenhum frame capturado.")
             return
+        if self.burst > 1:
+            if self._burst is None:
+                self.buttons.button(QDialogButtonBox.Ok).setEnabled(False)
+                self._burst = []
+                self._burst_reads = 0
+            return
+        self.captured = [(self.buffer.bgr, self.buffer.rgb())]
+        self._finish()
+
+    def _finish(self):
         self.timer.stop()
         self.cap.release()
         super().accept()
@@ -51,8 +116,29 @@ class CaptureDialog(QDialog):
         self.cap.release()
         super().reject()
 
+# --- Ponte entre a thread da serial e a thread da interface ---
+# Reemite cada evento do SerialLink como sinal Qt, entregue na thread da GUI
+class SerialBridge(QObject):
+    evento = pyqtSignal(object)
+
+    def __init__(self, link, parent=None):
+        super().__init__(parent)
+        self.link = link
+        self._unsubscribe = link.subscribe(SerialEvent, self.evento.emit)
+
+    @property
+    def connected(self):
+        return self.link.connected
+
+    def write(self, data):
+        return self.link.write(data)
+
+    def close(self):
+        self._unsubscribe()
+
+
 # --- Esperar cartão RFID ---
-def aguardar_cartao_dialog(parent, arduino, message="Aproxime o cartão do leitor"):
+def aguardar_cartao_dialog(parent, bridge, message="Aproxime o cartão do leitor"):
     dialog = QMessageBox(parent)
     dialog.setWindowTitle("Aguardando Cartão")
     dialog.setText(message)
@@ -63,39 +149,23 @@ def aguardar_cartao_dialog(parent, arduino, message="Aproxime o cartão do leito
     uid_container = {"uid": None}
     loop = QEventLoop()
 
-    if arduino:
-        try:
-            arduino.reset_input_buffer()
-            arduino.reset_output_buffer()
-            time.sleep(0.05)
-        except Exception:
-            pass
-
-    def check_serial():
-        if arduino:
-            try:
-                while arduino.in_waiting > 0:
-                    raw_line = arduino.readline().decode(errors="ignore").strip()
-                    if not raw_line:
-                        continue
-                    m = re.search(r'([0-9A-Fa-f:\-\.]{4,})', raw_line)
-                    if m:
-                        uid_container["uid"] = m.group(1)
-                        loop.quit()
-                        return
-            except Exception:
-                loop.quit()
+    # só vale o cartão aproximado depois que o diálogo foi aberto
+    def on_evento(event):
+        if isinstance(event, CardEvent):
+            uid_container["uid"] = event.uid
+            loop.quit()
 
     cancel_button = dialog.button(QMessageBox.Cancel)
     cancel_button.clicked.connect(loop.quit)
+    if bridge:
+        bridge.evento.connect(on_evento)
 
-    timer_serial = QTimer()
-    timer_serial.timeout.connect(check_serial)
-    timer_serial.start(50)
-
-    loop.exec_()
+    with span("espera_cartao"):
+        loop.exec_()
+    inc("cartoes_lidos" if uid_container["uid"] else "espera_cartao_cancelada")
 
-    timer_serial.stop()
+    if bridge:
+        bridge.evento.disconnect(on_evento)
     dialog.close()
 
     return uid_container["uid"]
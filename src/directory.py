@@ -0,0 +1,268 @@
+import os, queue, threading, unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict, namedtuple
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QObject, QSize, pyqtSignal
+from PyQt5.QtGui import QImageReader, QPixmap
+
+# Lado máximo (px) das miniaturas e quantas ficam em memória
+THUMB_SIZE = 200
+THUMB_CAPACITY = 512
+# Tamanho dos ícones na lista (as miniaturas são reduzidas na hora de pintar)
+LIST_ICON_SIZE = QSize(32, 32)
+
+# Usuário da lista: nome do arquivo (chave da galeria), nome exibido e a
+# versão normalizada usada na busca
+UserRecord = namedtuple("UserRecord", ["name", "display", "key"])
+
+
+# Normaliza para a busca: sem acentos e sem diferença de maiúsculas
+# ("João" e "joao" são iguais)
+def fold(text):
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+# Miniaturas das fotos de faces/ geradas por uma thread em segundo plano e
+# mantidas num LRU limitado. get() nunca lê o disco: sem miniatura em cache,
+# o pedido entra na fila e `pronta` avisa quando ela existir. Os pedidos mais
+# recentes são atendidos primeiro (as linhas visíveis ao rolar a lista).
+class ThumbnailCache(QObject):
+    pronta = pyqtSignal(str)
+
+    def __init__(self, faces_dir, size=THUMB_SIZE, capacity=THUMB_CAPACITY, parent=None):
+        super().__init__(parent)
+        self.faces_dir = faces_dir
+        self.size = size
+        self.capacity = capacity
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._queue = queue.LifoQueue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def get(self, name):
+        with self._lock:
+            image = self._images.get(name)
+            if image is not None:
+                self._images.move_to_end(name)
+                return image
+            if name in self._queued:
+                return None
+            self._queued.add(name)
+        self._queue.put(name)
+        return None
+
+    # Miniatura na hora (para quem não pode esperar o sinal, ex.: o diálogo
+    # de detalhes); o resultado também vai para o cache
+    def get_now(self, name):
+        image = self.get(name)
+        if image is None:
+            image = self._load(name)
+            if image is not None:
+                self._store(name, image)
+        return image
+
+    # A foto mudou ou o usuário foi removido
+    def invalidate(self, name):
+        with self._lock:
+            self._images.pop(name, None)
+
+    def close(self):
+        self._queue.put(None)
+
+    # Lê a foto já reduzida (o decodificador faz a escala) num QImage, que,
+    # ao contrário do QPixmap, pode ser criado fora da thread da interface
+    def _load(self, name):
+        path = os.path.join(self.faces_dir, name)
+        if not os.path.exists(path):
+            return None
+        reader = QImageReader(path)
+        size = reader.size()
+        if size.isValid():
+            reader.setScaledSize(size.scaled(self.size, self.size, Qt.KeepAspectRatio))
+        image = reader.read()
+        return None if image.isNull() else image
+
+    def _store(self, name, image):
+        with self._lock:
+            self._images[name] = image
+            self._images.move_to_end(name)
+            while len(self._images) > self.capacity:
+                self._images.popitem(last=False)
+
+    def _run(self):
+        while True:
+            name = self._queue.get()
+            if name is None:
+                return
+            image = self._load(name)
+            with self._lock:
+                self._queued.discard(name)
+            if image is not None:
+                self._store(name, image)
+                self.pronta.emit(name)
+
+
+# Modelo da lista de usuários para um QListView: a view só pede os dados das
+# linhas visíveis, então dezenas de milhares de usuários não criam um widget
+# por item. Os registros ficam num dicionário nome -> UserRecord e numa lista
+# ordenada pela chave normalizada, que serve de índice para a busca:
+#  - prefixo: faixa contígua encontrada por busca binária;
+#  - trecho no meio do nome: varredura apenas sobre o resultado anterior
+#    quando o texto digitado só cresceu (cada tecla refina a busca).
+# Os resultados mostram primeiro quem começa com o texto, depois os demais.
+class UserListModel(QAbstractListModel):
+    def __init__(self, thumbnails=None, parent=None):
+        super().__init__(parent)
+        self.thumbnails = thumbnails
+        self._records = {}
+        self._sorted = []
+        self._visible = []
+        self._n_prefix = 0
+        self._query = ""
+        self._pixmaps = OrderedDict()
+        if thumbnails is not None:
+            thumbnails.pronta.connect(self._on_thumbnail)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._visible)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._visible):
+            return None
+        record = self._records[self._visible[index.row()][1]]
+        if role == Qt.DisplayRole:
+            return record.display
+        if role == Qt.UserRole:
+            return record.name
+        if role == Qt.DecorationRole and self.thumbnails is not None:
+            return self._pixmap(record.name)
+        return None
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, name):
+        return name in self._records
+
+    def record(self, name):
+        return self._records.get(name)
+
+    def name_at(self, row):
+        if 0 <= row < len(self._visible):
+            return self._visible[row][1]
+        return None
+
+    def row_of(self, name):
+        record = self._records.get(name)
+        if record is None:
+            return -1
+        entry = (record.key, name)
+        for start, end in ((0, self._n_prefix), (self._n_prefix, len(self._visible))):
+            row = bisect_left(self._visible, entry, start, end)
+            if row < end and self._visible[row] == entry:
+                return row
+        return -1
+
+    # Substitui todos os usuários (carga inicial ou lista vinda do serviço)
+    def set_names(self, names):
+        self.beginResetModel()
+        self._records = {}
+        for name in names:
+            display = os.path.splitext(name)[0]
+            self._records[name] = UserRecord(name, display, fold(display))
+        self._sorted = sorted((r.key, r.name) for r in self._records.values())
+        self._pixmaps.clear()
+        self._visible, self._n_prefix = self._search(self._query, self._sorted)
+        self.endResetModel()
+
+    def add(self, name):
+        if name in self._records:
+            self._invalidate(name)
+            return
+        display = os.path.splitext(name)[0]
+        record = UserRecord(name, display, fold(display))
+        self._records[name] = record
+        entry = (record.key, name)
+        insort(self._sorted, entry)
+        if not self._query or record.key.startswith(self._query):
+            start, end = 0, self._n_prefix
+            self._n_prefix += 1
+        elif self._query in record.key:
+            start, end = self._n_prefix, len(self._visible)
+        else:
+            return
+        row = bisect_left(self._visible, entry, start, end)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._visible.insert(row, entry)
+        self.endInsertRows()
+
+    def remove(self, name):
+        row = self.row_of(name)
+        record = self._records.pop(name, None)
+        if record is None:
+            return False
+        entry = (record.key, name)
+        del self._sorted[bisect_left(self._sorted, entry)]
+        self._pixmaps.pop(name, None)
+        if self.thumbnails is not None:
+            self.thumbnails.invalidate(name)
+        if row >= 0:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._visible[row]
+            if row < self._n_prefix:
+                self._n_prefix -= 1
+            self.endRemoveRows()
+        return True
+
+    def set_filter(self, text):
+        query = fold(text.strip())
+        if query == self._query:
+            return
+        # texto só cresceu: o novo resultado está contido no anterior
+        narrowing = self._query and query.startswith(self._query)
+        candidates = self._visible if narrowing else self._sorted
+        self.beginResetModel()
+        self._query = query
+        self._visible, self._n_prefix = self._search(query, candidates)
+        self.endResetModel()
+
+    # Retorna (resultado, quantos do início são correspondências de prefixo)
+    def _search(self, query, candidates):
+        if not query:
+            return list(self._sorted), len(self._sorted)
+        start = bisect_left(self._sorted, (query,))
+        end = bisect_left(self._sorted, (query + "\uffff",))
+        prefix = self._sorted[start:end]
+        others = sorted(e for e in candidates if query in e[0] and not e[0].startswith(query))
+        return prefix + others, len(prefix)
+
+    # Pixmaps só podem ser criados na thread da interface; os já convertidos
+    # são guardados (mesmo limite do cache de miniaturas)
+    def _pixmap(self, name):
+        pixmap = self._pixmaps.get(name)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(name)
+            return pixmap
+        image = self.thumbnails.get(name)
+        if image is None:
+            return None
+        pixmap = QPixmap.fromImage(image)
+        self._pixmaps[name] = pixmap
+        while len(self._pixmaps) > self.thumbnails.capacity:
+            self._pixmaps.popitem(last=False)
+        return pixmap
+
+    def _invalidate(self, name):
+        self._pixmaps.pop(name, None)
+        if self.thumbnails is not None:
+            self.thumbnails.invalidate(name)
+        self._on_thumbnail(name)
+
+    def _on_thumbnail(self, name):
+        row = self.row_of(name)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
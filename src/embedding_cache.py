@@ -0,0 +1,227 @@
+import os, sys, pickle, hashlib, argparse, threading
+from collections import OrderedDict
+import cv2, numpy as np
+
+from .utils import (
+    faces_dir, detect_faces, select_face, encode_face, load_known_faces, save_known_faces,
+    DETECTION_SCALE, FACE_SELECTION
+)
+
+cache_file = os.path.join(faces_dir, "embeddings.cache")
+
+# Identifica o modelo de codificação; mudar este valor invalida o cache
+MODEL_TAG = "dlib_face_recognition_resnet_model_v1"
+
+
+def encoding_params(detection_scale=DETECTION_SCALE, select=FACE_SELECTION):
+    return (MODEL_TAG, float(detection_scale), select)
+
+
+# Chave do cache: blake2b dos pixels + formato + parâmetros do modelo
+def image_key(image, params):
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((image.shape, str(image.dtype), params)).encode("utf-8"))
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+
+# Cache LRU de detecções e codificações por conteúdo de imagem, persistido em
+# disco. Também lembra (mtime, tamanho) -> chave de cada arquivo, então uma
+# verificação de faces/ nem precisa decodificar os PNGs que não mudaram.
+class EmbeddingCache:
+    def __init__(self, path=cache_file, capacity=20000):
+        self.path = path
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._files = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+            self._entries = OrderedDict(data.get("entries", ()))
+            self._files = data.get("files", {})
+        except Exception:
+            # cache corrompido: começa vazio, ele será reconstruído
+            self._entries, self._files = OrderedDict(), {}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump({"entries": list(self._entries.items()), "files": self._files}, f)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, location, encoding):
+        with self._lock:
+            enc = None if encoding is None else np.asarray(encoding, dtype=np.float32)
+            self._entries[key] = (location, enc)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    # (localização, codificação) de uma imagem BGR, calculando só se necessário
+    def encode_image(self, image, params=None):
+        params = params or encoding_params()
+        key = image_key(image, params)
+        cached = self.get(key)
+        if cached is not None:
+            return cached, key, True
+        _, detection_scale, select = params
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        location = select_face(detect_faces(rgb, detection_scale), rgb.shape, select)
+        encoding = encode_face(rgb, location) if location is not None else None
+        self.put(key, location, encoding)
+        return (location, encoding), key, False
+
+    # Igual a encode_image, mas para um arquivo: se o arquivo não mudou desde a
+    # última vez (mtime e tamanho), a imagem nem é lida do disco
+    def encode_file(self, path, params=None):
+        params = params or encoding_params()
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size, params)
+        known = self._files.get(path)
+        if known is not None and known[0] == stamp:
+            cached = self.get(known[1])
+            if cached is not None:
+                return cached, True
+        image = cv2.imread(path)
+        if image is None:
+            return (None, None), False
+        value, key, hit = self.encode_image(image, params)
+        with self._lock:
+            self._files[path] = (stamp, key)
+            self._dirty = True
+        return value, hit
+
+
+def gallery_images():
+    if not os.path.isdir(faces_dir):
+        return []
+    return sorted(f for f in os.listdir(faces_dir) if f.lower().endswith(".png"))
+
+
+# Codificações gravadas agrupadas por usuário ({nome: matriz (n, 128)}); o
+# cadastro guarda vários modelos por pessoa (um deles vem da foto)
+def stored_templates():
+    matrix, names = load_known_faces()
+    rows = {}
+    for i, name in enumerate(names):
+        rows.setdefault(name, []).append(i)
+    return {name: np.asarray(matrix[idx], dtype=np.float32) for name, idx in rows.items()}
+
+
+# Recalcula a galeria a partir dos PNGs de faces/, reaproveitando o cache.
+# Dos modelos gravados de cada usuário, o mais próximo da foto é trocado pela
+# codificação recalculada e os demais (da rajada do cadastro) são mantidos.
+# Usuários sem foto, ou cuja foto não tem rosto detectável, mantêm os modelos
+# gravados e aparecem no relatório ("sem_rosto", "sem_imagem"); só uma foto
+# sem rosto e sem nenhum modelo gravado fica de fora ("descartados").
+def rebuild_gallery(cache, params=None, progress=print):
+    encodings, names = [], []
+    report = {"em_cache": 0, "recalculados": 0, "sem_rosto": [], "sem_imagem": [], "descartados": [],
+              "modelos_mantidos": 0}
+    try:
+        stored = stored_templates()
+    except (OSError, ValueError) as e:
+        progress(f"[AVISO] Galeria gravada ilegível ({e}); só as fotos serão usadas.")
+        stored = {}
+
+    def keep(fname, templates):
+        encodings.extend(templates)
+        names.extend([fname] * len(templates))
+        report["modelos_mantidos"] += len(templates)
+
+    images = gallery_images()
+    for fname in images:
+        (_, encoding), hit = cache.encode_file(os.path.join(faces_dir, fname), params)
+        report["em_cache" if hit else "recalculados"] += 1
+        templates = stored.get(fname)
+        if encoding is None:
+            report["sem_rosto" if templates is not None else "descartados"].append(fname)
+            if templates is not None:
+                keep(fname, templates)
+            continue
+        if templates is not None and len(templates) > 1:
+            nearest = int(np.argmin(np.linalg.norm(templates - encoding, axis=1)))
+            keep(fname, np.delete(templates, nearest, axis=0))
+        encodings.append(encoding)
+        names.append(fname)
+    for fname in sorted(set(stored) - set(images)):
+        report["sem_imagem"].append(fname)
+        keep(fname, stored[fname])
+    cache.save()
+    save_known_faces(np.array(encodings, dtype=np.float32).reshape(-1, 128), names)
+    progress(f"Galeria reconstruída: {len(names)} modelo(s), {report['em_cache']} do cache, "
+             f"{report['recalculados']} recalculado(s), {report['modelos_mantidos']} mantido(s) do cadastro.")
+    for key, label in (("sem_rosto", "Foto sem rosto detectável (modelos gravados mantidos)"),
+                       ("sem_imagem", "Usuário sem foto (modelos gravados mantidos)"),
+                       ("descartados", "Foto sem rosto e sem modelos gravados (fora da galeria)")):
+        for fname in report[key]:
+            progress(f"[AVISO] {label}: {fname}")
+    return report
+
+
+# Confere se cada PNG de faces/ corresponde a um dos modelos gravados do
+# usuário (a menor distância entre eles)
+def verify_gallery(cache, tolerance=1e-3, params=None, progress=print):
+    stored = stored_templates()
+    report = {"ok": 0, "divergentes": [], "sem_imagem": [], "sem_codificacao": []}
+    images = set(gallery_images())
+    for fname in sorted(images):
+        if fname not in stored:
+            report["sem_codificacao"].append(fname)
+            continue
+        (_, encoding), _ = cache.encode_file(os.path.join(faces_dir, fname), params)
+        if encoding is None or float(np.linalg.norm(stored[fname] - encoding, axis=1).min()) > tolerance:
+            report["divergentes"].append(fname)
+        else:
+            report["ok"] += 1
+    report["sem_imagem"] = sorted(set(stored) - images)
+    cache.save()
+    progress(f"Verificação: {report['ok']} ok, {len(report['divergentes'])} divergente(s), "
+             f"{len(report['sem_codificacao'])} sem codificação, {len(report['sem_imagem'])} sem imagem.")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cache de codificações das imagens cadastradas em faces/.")
+    parser.add_argument("acao", choices=["reconstruir", "verificar"])
+    parser.add_argument("--escala", type=float, default=DETECTION_SCALE, help="escala de detecção")
+    args = parser.parse_args(argv)
+    cache = EmbeddingCache()
+    params = encoding_params(args.escala)
+    if args.acao == "reconstruir":
+        rebuild_gallery(cache, params)
+    else:
+        verify_gallery(cache, params=params)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import os, sys, json, zlib, argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2, numpy as np
+
+from .gallery import FaceGallery
+from .utils import (
+    faces_dir, ensure_faces_dir, detect_faces, encode_face, load_known_faces, save_face_index, face_store
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# Executado nos processos filhos: detecta e codifica uma foto
+def _encode_photo(path):
+    image = cv2.imread(path)
+    if image is None:
+        return path, "ilegivel", None
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    locations = detect_faces(rgb)
+    if not locations:
+        return path, "sem_rosto", None
+    if len(locations) > 1:
+        return path, "varios_rostos", None
+    encoding = encode_face(rgb, locations[0])
+    if encoding is None:
+        return path, "sem_rosto", None
+    return path, "ok", encoding.tolist()
+
+
+def _progress_file(folder):
+    key = zlib.crc32(os.path.abspath(folder).encode("utf-8"))
+    return os.path.join(faces_dir, f"enroll_{key:08x}.jsonl")
+
+
+def _read_progress(path):
+    done = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                done[entry["file"]] = entry
+    return done
+
+
+def list_photos(folder):
+    photos = []
+    for root, _, files in os.walk(folder):
+        for fname in sorted(files):
+            if fname.lower().endswith(IMAGE_EXTENSIONS):
+                photos.append(os.path.join(root, fname))
+    return sorted(photos)
+
+
+# Cadastra em lote as fotos de uma pasta (o nome do usuário é o nome do
+# arquivo). O progresso é registrado em faces/enroll_<id>.jsonl, então um
+# job interrompido continua de onde parou; a galeria é gravada uma única vez.
+def enroll_directory(folder, workers=None, tolerance=0.5, progress=print):
+    photos = list_photos(folder)
+    ensure_faces_dir()
+    progress_path = _progress_file(folder)
+    done = _read_progress(progress_path)
+    pending = [p for p in photos if os.path.relpath(p, folder) not in done]
+    if done:
+        progress(f"Retomando: {len(done)} foto(s) já processada(s), {len(pending)} pendente(s).")
+
+    total = len(photos)
+    with open(progress_path, "a", encoding="utf-8") as journal, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_encode_photo, p) for p in pending]
+        for future in as_completed(futures):
+            path, status, encoding = future.result()
+            entry = {"file": os.path.relpath(path, folder), "status": status, "encoding": encoding}
+            journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            journal.flush()
+            done[entry["file"]] = entry
+            progress(f"[{len(done)}/{total}] {entry['file']}: {status}")
+
+    report = _commit(folder, done, tolerance, progress, progress_path)
+    os.remove(progress_path)
+    return report
+
+
+# Remove duplicatas (nome já cadastrado ou rosto já presente na galeria ou no
+# próprio lote) e grava as novas codificações de uma só vez. Fotos que não
+# puderam ser copiadas para faces/ viram falhas, também anotadas no diário.
+def _commit(folder, done, tolerance, progress, progress_path):
+    gallery = FaceGallery(*load_known_faces())
+    batch = FaceGallery()
+    report = {"cadastrados": [], "falhas": {}, "duplicados": {}}
+    for rel in sorted(done):
+        entry = done[rel]
+        if entry["status"] != "ok":
+            report["falhas"][rel] = entry["status"]
+            continue
+        name = os.path.splitext(os.path.basename(rel))[0].strip() + ".png"
+        encoding = np.asarray(entry["encoding"], dtype=np.float32)
+        if name in gallery or name in batch:
+            report["duplicados"][rel] = f"nome já cadastrado: {name}"
+            continue
+        match = gallery.match(encoding, tolerance) or batch.match(encoding, tolerance)
+        if match:
+            report["duplicados"][rel] = f"mesmo rosto de {os.path.splitext(match.name)[0]}"
+            continue
+        image = cv2.imread(os.path.join(folder, rel))
+        if image is None or not cv2.imwrite(os.path.join(faces_dir, name), image):
+            entry = {"file": rel, "status": "ilegivel", "encoding": None}
+            with open(progress_path, "a", encoding="utf-8") as journal:
+                journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            done[rel] = entry
+            report["falhas"][rel] = entry["status"]
+            continue
+        batch.add(name, encoding)
+        report["cadastrados"].append(name)
+
+    if len(batch):
+        face_store.extend(batch.names, batch.encodings)
+        gallery.extend(batch.names, batch.encodings)
+        save_face_index(gallery)
+    progress(
+        f"Concluído: {len(report['cadastrados'])} cadastrado(s), "
+        f"{len(report['falhas'])} falha(s), {len(report['duplicados'])} duplicado(s)."
+    )
+    for rel, reason in sorted(report["falhas"].items()):
+        progress(f"  falha: {rel} ({reason})")
+    for rel, reason in sorted(report["duplicados"].items()):
+        progress(f"  ignorado: {rel} ({reason})")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cadastro em lote de rostos a partir de uma pasta de fotos.")
+    parser.add_argument("pasta", help="pasta com as fotos (o nome do arquivo é o nome do usuário)")
+    parser.add_argument("--processos", type=int, default=None, help="número de processos (padrão: todos os núcleos)")
+    parser.add_argument("--tolerancia", type=float, default=0.5, help="distância máxima para considerar rosto duplicado")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.pasta):
+        print(f"Pasta não encontrada: {args.pasta}")
+        return 1
+    enroll_directory(args.pasta, workers=args.processos, tolerance=args.tolerancia)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import cv2, numpy as np
+
+from .utils import detect_faces, select_face, encode_face
+
+# Cadastro com várias amostras: quantos frames a rajada captura, quantos
+# modelos no máximo ficam na galeria e o mínimo de nitidez aceito
+ENROLL_BURST = 8
+MAX_TEMPLATES = 5
+MIN_SHARPNESS = 60.0
+# Amostras mais distantes que isto do centroide são descartadas (outra
+# pessoa entrou no quadro, rosto parcialmente coberto...)
+MAX_TEMPLATE_SPREAD = 0.35
+
+
+# Nitidez pela variância do Laplaciano numa versão reduzida (largura 320);
+# valores baixos indicam frame borrado ou tremido
+def sharpness(rgb_image):
+    h, w = rgb_image.shape[:2]
+    gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+    if w > 320:
+        gray = cv2.resize(gray, (320, max(1, h * 320 // w)), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def sharpest(rgb_frames):
+    return int(np.argmax([sharpness(rgb) for rgb in rgb_frames]))
+
+
+# Escolhe os modelos de um cadastro a partir de uma rajada de frames RGB:
+# descarta os borrados, codifica os mais nítidos (até MAX_TEMPLATES com
+# rosto) e remove os que destoam do centroide. Retorna (codificações, índice
+# do frame mais nítido aproveitado) ou ([], None).
+def select_templates(rgb_frames, max_templates=MAX_TEMPLATES, min_sharpness=MIN_SHARPNESS,
+                     max_spread=MAX_TEMPLATE_SPREAD):
+    scores = [sharpness(rgb) for rgb in rgb_frames]
+    order = [i for i in np.argsort(scores)[::-1] if scores[i] >= min_sharpness]
+    encodings, used = [], []
+    for i in order:
+        rgb = rgb_frames[i]
+        location = select_face(detect_faces(rgb), rgb.shape)
+        encoding = encode_face(rgb, location) if location is not None else None
+        if encoding is None:
+            continue
+        encodings.append(np.asarray(encoding, dtype=np.float32))
+        used.append(i)
+        if len(encodings) >= max_templates:
+            break
+    if not encodings:
+        return [], None
+    block = np.stack(encodings)
+    center = np.median(block, axis=0)
+    keep = np.linalg.norm(block - center, axis=1) <= max_spread
+    if not keep.any():
+        return [], None
+    encodings = [e for e, k in zip(encodings, keep) if k]
+    used = [i for i, k in zip(used, keep) if k]
+    return encodings, used[0]
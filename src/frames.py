@@ -0,0 +1,140 @@
+import os, time, cv2, numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# Buffer do último frame da câmera, reaproveitado a cada leitura:
+#  - cap.read grava direto no mesmo array BGR (sem alocar por frame);
+#  - a versão RGB é convertida sob demanda, uma única vez por frame, num
+#    array também reaproveitado, e é a mesma entregue ao reconhecimento;
+#  - a pré-visualização reduz o frame antes de converter, então a conversão
+#    de cor da prévia é feita só sobre a miniatura.
+# Os arrays devolvidos são sobrescritos na próxima leitura: quem precisar
+# guardá-los depois disso deve copiá-los.
+class FrameBuffer:
+    def __init__(self):
+        self.bgr = None
+        self.index = 0
+        self._rgb = None
+        self._rgb_index = -1
+        self._small_bgr = None
+        self._small_rgb = None
+        self._preview_index = -1
+
+    def read(self, cap):
+        ret, frame = cap.read(self.bgr)
+        if not ret or frame is None:
+            return False
+        self.bgr = frame
+        self.index += 1
+        return True
+
+    def rgb(self):
+        if self.bgr is None:
+            return None
+        if self._rgb_index != self.index:
+            if self._rgb is None or self._rgb.shape != self.bgr.shape:
+                self._rgb = np.empty_like(self.bgr)
+            cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB, dst=self._rgb)
+            self._rgb_index = self.index
+        return self._rgb
+
+    # Miniatura RGB que cabe em (width, height), mantendo a proporção
+    def preview(self, width, height):
+        if self.bgr is None:
+            return None
+        if self._preview_index == self.index:
+            return self._small_rgb
+        h, w = self.bgr.shape[:2]
+        scale = min(width / w, height / h, 1.0)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        if self._small_bgr is None or self._small_bgr.shape[:2] != (size[1], size[0]):
+            self._small_bgr = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self._small_rgb = np.empty_like(self._small_bgr)
+        if size == (w, h):
+            cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB, dst=self._small_rgb)
+        else:
+            cv2.resize(self.bgr, size, dst=self._small_bgr, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self._small_bgr, cv2.COLOR_BGR2RGB, dst=self._small_rgb)
+        self._preview_index = self.index
+        return self._small_rgb
+
+
+# Fontes de frames com a mesma interface do cv2.VideoCapture (read, isOpened,
+# release), para rodar o sistema e as simulações sem câmera. `fps` limita o
+# ritmo de leitura como uma câmera real; None lê o mais rápido possível.
+class ImageDirectorySource:
+    def __init__(self, path, fps=30.0, loop=True):
+        self.paths = sorted(
+            os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self.fps = fps
+        self.loop = loop
+        self._next = 0
+        self._due = 0.0
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def _pace(self):
+        if not self.fps:
+            return
+        now = time.monotonic()
+        if now < self._due:
+            time.sleep(self._due - now)
+        self._due = max(now, self._due) + 1.0 / self.fps
+
+    def read(self, image=None):
+        if self._next >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False, None
+            self._next = 0
+        self._pace()
+        frame = cv2.imread(self.paths[self._next])
+        self._next += 1
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            image[...] = frame
+            frame = image
+        return True, frame
+
+    def release(self):
+        self._next = len(self.paths)
+        self.loop = False
+
+
+# Arquivo de vídeo reproduzido no ritmo dele (ou em `fps`) e, com loop,
+# reiniciado ao terminar
+class VideoFileSource:
+    def __init__(self, path, fps=None, loop=True):
+        self.cap = cv2.VideoCapture(path)
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.loop = loop
+        self._due = 0.0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self, image=None):
+        now = time.monotonic()
+        if now < self._due:
+            time.sleep(self._due - now)
+        self._due = max(now, self._due) + 1.0 / self.fps
+        ret, frame = self.cap.read(image)
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(image)
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+# Abre uma câmera (índice), uma pasta de imagens ou um arquivo de vídeo
+def open_source(source):
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        return cv2.VideoCapture(int(source))
+    if os.path.isdir(source):
+        return ImageDirectorySource(source)
+    return VideoFileSource(source)
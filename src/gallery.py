@@ -0,0 +1,279 @@
+import functools, threading
+import numpy as np
+from collections import namedtuple
+
+ENCODING_DIM = 128
+
+# Resultado de uma busca na galeria: nome mais próximo, distância e margem
+# para o segundo colocado (de outro usuário)
+MatchResult = namedtuple("MatchResult", ["name", "distance", "margin", "row"])
+
+
+# Serializa o acesso à galeria: ela é consultada pela thread de reconhecimento
+# enquanto a interface cadastra e remove usuários
+def _locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+# Galeria de rostos conhecidos mantida em uma única matriz float32 (N, 128)
+class FaceGallery:
+    def __init__(self, encodings=(), names=(), capacity=64):
+        self._lock = threading.RLock()
+        self.index = None
+        self.load(encodings, names, capacity)
+
+    # Substitui todo o conteúdo da galeria; permite criar a galeria vazia e
+    # carregá-la depois, em segundo plano, sem trocar o objeto compartilhado
+    @_locked
+    def load(self, encodings=(), names=(), capacity=64):
+        names = list(names)
+        self._names = []
+        self._rows = {}
+        self._count = 0
+        self._centroids = None
+        self.index = None
+        if isinstance(encodings, np.ndarray) and encodings.dtype == np.float32 \
+                and encodings.ndim == 2 and encodings.shape[1] == ENCODING_DIM and len(encodings):
+            # adota a matriz recebida (ex.: np.memmap do arquivo da galeria) sem copiar;
+            # ela só é copiada quando a galeria precisar crescer
+            if len(names) != len(encodings):
+                raise ValueError("Quantidade de nomes e codificações não confere.")
+            self._matrix = encodings
+            self._sq_norms = np.einsum("ij,ij->i", encodings, encodings)
+            for row, name in enumerate(names):
+                self._names.append(name)
+                self._rows.setdefault(name, []).append(row)
+            self._count = len(encodings)
+            return
+        encodings = list(encodings)
+        capacity = max(capacity, len(encodings), 1)
+        self._matrix = np.empty((capacity, ENCODING_DIM), dtype=np.float32)
+        self._sq_norms = np.empty(capacity, dtype=np.float32)
+        if encodings:
+            self.extend(names, encodings)
+
+    def __len__(self):
+        return self._count
+
+    # Trava da galeria, para quem precisa de um retrato consistente de várias
+    # propriedades (ex.: gravar o índice junto com a ordem dos nomes)
+    @property
+    def lock(self):
+        return self._lock
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    # Matriz (N, 128) com as codificações válidas (view, sem cópia)
+    @property
+    def encodings(self):
+        return self._matrix[:self._count]
+
+    # Nomes na mesma ordem das linhas da matriz
+    @property
+    @_locked
+    def names(self):
+        return list(self._names)
+
+    # Nomes únicos, na ordem em que foram cadastrados
+    @_locked
+    def unique_names(self):
+        return list(self._rows)
+
+    @_locked
+    def rows_of(self, name):
+        return list(self._rows.get(name, ()))
+
+    # Associa um índice aproximado (ex.: IVFIndex) já construído sobre as
+    # linhas atuais; ele passa a ser atualizado a cada add/remove
+    def attach_index(self, index):
+        self.index = index
+
+    def detach_index(self):
+        self.index = None
+
+    def _reserve(self, extra):
+        needed = self._count + extra
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.empty((capacity, ENCODING_DIM), dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        matrix[:self._count] = self._matrix[:self._count]
+        sq_norms[:self._count] = self._sq_norms[:self._count]
+        self._matrix, self._sq_norms = matrix, sq_norms
+
+    @staticmethod
+    def _as_vector(encoding):
+        arr = np.asarray(encoding, dtype=np.float32)
+        if arr.shape != (ENCODING_DIM,):
+            raise ValueError(f"Codificação inválida: formato {arr.shape}, esperado ({ENCODING_DIM},)")
+        return arr
+
+    # Adiciona uma codificação; custo O(1) amortizado
+    @_locked
+    def add(self, name, encoding):
+        vec = self._as_vector(encoding)
+        self._reserve(1)
+        row = self._count
+        self._matrix[row] = vec
+        self._sq_norms[row] = vec @ vec
+        self._names.append(name)
+        self._rows.setdefault(name, []).append(row)
+        self._count += 1
+        self._centroids = None
+        if self.index is not None:
+            self.index.add(row, vec)
+        return row
+
+    # Adiciona várias codificações de uma vez
+    @_locked
+    def extend(self, names, encodings):
+        names = list(names)
+        block = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(names) != block.shape[0]:
+            raise ValueError("Quantidade de nomes e codificações não confere.")
+        self._reserve(len(names))
+        start = self._count
+        end = start + len(names)
+        self._matrix[start:end] = block
+        self._sq_norms[start:end] = np.einsum("ij,ij->i", block, block)
+        for offset, name in enumerate(names):
+            self._names.append(name)
+            self._rows.setdefault(name, []).append(start + offset)
+        self._count = end
+        self._centroids = None
+        if self.index is not None:
+            for row in range(start, end):
+                self.index.add(row, self._matrix[row])
+
+    # Remove todas as linhas de um usuário movendo a última linha para o
+    # espaço liberado (sem reconstruir a matriz)
+    @_locked
+    def remove(self, name):
+        rows = self._rows.pop(name, None)
+        if not rows:
+            return 0
+        self._centroids = None
+        for row in sorted(rows, reverse=True):
+            last = self._count - 1
+            if self.index is not None:
+                self.index.remove(row)
+                if row != last:
+                    self.index.move(last, row)
+            if row != last:
+                moved = self._names[last]
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._names[row] = moved
+                moved_rows = self._rows[moved]
+                moved_rows[moved_rows.index(last)] = row
+            self._names.pop()
+            self._count -= 1
+        return len(rows)
+
+    # Distâncias euclidianas de uma codificação para todas as linhas
+    # (ou apenas para as linhas informadas em `rows`)
+    @_locked
+    def distances(self, encoding, rows=None):
+        query = self._as_vector(encoding)
+        if rows is None:
+            matrix, sq_norms = self._matrix[:self._count], self._sq_norms[:self._count]
+        else:
+            matrix, sq_norms = self._matrix[rows], self._sq_norms[rows]
+        if not len(matrix):
+            return np.empty(0, dtype=np.float32)
+        sq = sq_norms + query @ query - 2.0 * (matrix @ query)
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    # Centroide e raio (maior distância de um modelo ao centroide) de cada
+    # usuário, recalculados sob demanda depois de add/extend/remove
+    def _refresh_centroids(self):
+        if self._centroids is not None:
+            return
+        names = list(self._rows)
+        counts = np.array([len(self._rows[n]) for n in names])
+        order = np.concatenate([self._rows[n] for n in names])
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        templates = self._matrix[order]
+        centroids = (np.add.reduceat(templates, starts, axis=0) / counts[:, None]).astype(np.float32)
+        spread = np.linalg.norm(templates - np.repeat(centroids, counts, axis=0), axis=1)
+        self._centroid_names = names
+        self._centroid_sq = np.einsum("ij,ij->i", centroids, centroids)
+        self._radii = np.maximum.reduceat(spread, starts)
+        self._centroids = centroids
+
+    # Com vários modelos por usuário, a primeira passada compara só os
+    # centroides; pela desigualdade triangular um usuário cujo
+    # (distância ao centroide - raio) passa da tolerância não tem nenhum modelo
+    # dentro dela, então só os modelos dos usuários restantes são comparados
+    # (o resultado é o mesmo da busca completa). Para os usuários descartados
+    # a margem usa o mesmo limite inferior (distância ao centroide - raio):
+    # pode subestimar a margem, nunca superestimar.
+    def _match_by_centroid(self, encoding, tolerance):
+        self._refresh_centroids()
+        query = self._as_vector(encoding)
+        sq = self._centroid_sq + query @ query - 2.0 * (self._centroids @ query)
+        np.maximum(sq, 0.0, out=sq)
+        centroid_dists = np.sqrt(sq, out=sq)
+        keep = centroid_dists - self._radii <= tolerance
+        if not keep.any():
+            return None
+        rows = np.concatenate([self._rows[self._centroid_names[u]] for u in np.flatnonzero(keep)])
+        result = self._best(self.distances(query, rows=rows), rows, tolerance)
+        if result is not None and not keep.all():
+            pruned = float((centroid_dists - self._radii)[~keep].min()) - result.distance
+            result = result._replace(margin=min(result.margin, pruned))
+        return result
+
+    # Retorna o rosto mais próximo dentro da tolerância (ou None). Com um
+    # índice associado, apenas as linhas candidatas do índice são comparadas.
+    @_locked
+    def match(self, encoding, tolerance=0.5):
+        if not self._count:
+            return None
+        if self.index is None and self._count >= 2 * len(self._rows):
+            return self._match_by_centroid(encoding, tolerance)
+        rows = self.index.candidates(encoding) if self.index is not None else None
+        if rows is not None and not len(rows):
+            return None
+        return self._best(self.distances(encoding, rows=rows), rows, tolerance)
+
+    # Compara várias consultas (B, 128) de uma vez, com uma única
+    # multiplicação de matrizes contra a galeria
+    @_locked
+    def match_batch(self, queries, tolerance=0.5):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if not self._count:
+            return [None] * len(queries)
+        if self.index is not None:
+            return [self.match(q, tolerance) for q in queries]
+        sq = (self._sq_norms[:self._count][None, :]
+              + np.einsum("ij,ij->i", queries, queries)[:, None]
+              - 2.0 * (queries @ self._matrix[:self._count].T))
+        np.maximum(sq, 0.0, out=sq)
+        dists = np.sqrt(sq, out=sq)
+        return [self._best(row, None, tolerance) for row in dists]
+
+    def _best(self, dists, rows, tolerance):
+        best = int(np.argmin(dists))
+        best_dist = float(dists[best])
+        if best_dist > tolerance:
+            return None
+        if rows is not None:
+            best = int(rows[best])
+        name = self._names[best]
+        if rows is None:
+            others = np.ones(self._count, dtype=bool)
+            others[self._rows[name]] = False
+        else:
+            others = ~np.isin(rows, self._rows[name])
+        margin = float(dists[others].min() - best_dist) if others.any() else float("inf")
+        return MatchResult(name, best_dist, margin, best)
@@ -0,0 +1,157 @@
+import sys, time, argparse
+from collections import deque, namedtuple
+import cv2, numpy as np
+
+# Orçamento (ms) da verificação de vivacidade; estourado, o resultado é
+# inconclusivo (live=None) e quem chama decide se libera ou não
+LIVENESS_BUDGET_MS = 40.0
+# Sem prova de vida conclusiva o acesso é negado apenas no modo estrito
+LIVENESS_STRICT = False
+
+# Limiares das duas pistas (dependem da câmera; calibre com python -m src.liveness)
+MIN_FACE_MOTION_PX = 0.6      # abaixo disso o rosto é considerado parado
+RIGID_BACKGROUND_PX = 0.5     # fundo seguindo o rosto com erro menor que isso -> foto
+MIN_NONRIGID_PX = 0.35        # deformação não rígida (piscar, fala, rotação 3D)
+MIN_TEXTURE = 0.08            # detalhe fino do recorte do rosto (fotos impressas/telas perdem)
+
+THUMB_WIDTH = 320
+
+LivenessResult = namedtuple("LivenessResult", ["live", "reason", "elapsed_ms", "motion", "texture"])
+
+
+# Miniaturas cinza dos últimos frames já lidos da câmera (a prévia ou o
+# reconhecimento contínuo alimentam o histórico, nenhum frame extra é lido)
+class FrameHistory:
+    def __init__(self, size=12, width=THUMB_WIDTH):
+        self.width = width
+        self.frames = deque(maxlen=size)
+
+    def push(self, image, rgb=False):
+        h, w = image.shape[:2]
+        scale = min(1.0, self.width / w)
+        small = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1.0 else image
+        gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY if rgb else cv2.COLOR_BGR2GRAY)
+        self.frames.append((scale, gray))
+
+    def clear(self):
+        self.frames.clear()
+
+    def __len__(self):
+        return len(self.frames)
+
+
+def _box_mask(shape, box, grow=0.0):
+    top, right, bottom, left = box
+    dh, dw = (bottom - top) * grow, (right - left) * grow
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[max(0, int(top - dh)):int(bottom + dh), max(0, int(left - dw)):int(right + dw)] = 255
+    return mask
+
+
+# Movimento entre o frame mais antigo e o mais recente do histórico: pontos
+# do rosto e de um anel de fundo em volta dele são seguidos por fluxo óptico.
+# Retorna (deslocamento do rosto, erro não rígido no rosto, erro do fundo sob
+# a transformação do rosto), em pixels da miniatura, ou None sem pontos.
+def motion_cues(history, box):
+    (scale, first), (_, last) = history.frames[0], history.frames[-1]
+    box = [v * scale for v in box]
+    face = _box_mask(first.shape, box)
+    ring = _box_mask(first.shape, box, 0.6)
+    ring[face > 0] = 0
+
+    def track(mask, n):
+        pts = cv2.goodFeaturesToTrack(first, n, 0.01, 3, mask=mask)
+        if pts is None or len(pts) < 6:
+            return None, None
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(first, last, pts, None, winSize=(15, 15), maxLevel=2)
+        ok = status.ravel() == 1
+        return pts[ok].reshape(-1, 2), moved[ok].reshape(-1, 2)
+
+    face_a, face_b = track(face, 40)
+    if face_a is None or len(face_a) < 6:
+        return None
+    transform, _ = cv2.estimateAffinePartial2D(face_a, face_b)
+    if transform is None:
+        return None
+    shift = float(np.median(np.linalg.norm(face_b - face_a, axis=1)))
+    predicted = face_a @ transform[:, :2].T + transform[:, 2]
+    nonrigid = float(np.median(np.linalg.norm(face_b - predicted, axis=1)))
+    background = None
+    ring_a, ring_b = track(ring, 30)
+    if ring_a is not None and len(ring_a) >= 6:
+        predicted = ring_a @ transform[:, :2].T + transform[:, 2]
+        background = float(np.median(np.linalg.norm(ring_b - predicted, axis=1)))
+    return shift, nonrigid, background
+
+
+# Energia de alta frequência relativa no recorte do rosto (128x128)
+def texture_cue(rgb_image, box):
+    top, right, bottom, left = box
+    crop = rgb_image[max(0, top):bottom, max(0, left):right]
+    if crop.size == 0:
+        return 0.0
+    gray = cv2.resize(cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY), (128, 128), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var() / (gray.astype(np.float32).var() + 1e-6))
+
+
+# Prova de vida só com CPU, sobre frames já capturados: uma foto ou tela
+# movida diante da câmera desloca o rosto e o "fundo" dela juntos, de forma
+# rígida; um rosto real se deforma (piscar, fala, rotação) e mostra textura
+# fina que impressões e telas perdem. Cada etapa só roda se sobrar orçamento.
+def check_liveness(rgb_image, box, history, budget_ms=LIVENESS_BUDGET_MS):
+    t0 = time.perf_counter()
+    elapsed = lambda: 1000 * (time.perf_counter() - t0)
+    texture = texture_cue(rgb_image, box)
+    if len(history) < 2:
+        live = texture >= MIN_TEXTURE
+        return LivenessResult(live, "textura" if live else "textura insuficiente", elapsed(), None, texture)
+    if elapsed() > budget_ms:
+        return LivenessResult(None, "orçamento esgotado", elapsed(), None, texture)
+    motion = motion_cues(history, box)
+    if elapsed() > budget_ms:
+        return LivenessResult(None, "orçamento esgotado", elapsed(), motion, texture)
+    if motion is not None:
+        shift, nonrigid, background = motion
+        if shift >= MIN_FACE_MOTION_PX and background is not None and background < RIGID_BACKGROUND_PX \
+                and nonrigid < MIN_NONRIGID_PX:
+            return LivenessResult(False, "rosto e fundo se movem juntos", elapsed(), motion, texture)
+        if nonrigid >= MIN_NONRIGID_PX:
+            return LivenessResult(True, "movimento não rígido", elapsed(), motion, texture)
+    live = texture >= MIN_TEXTURE
+    return LivenessResult(live, "textura" if live else "textura insuficiente", elapsed(), motion, texture)
+
+
+# Decide o acesso a partir do resultado (inconclusivo só bloqueia no modo estrito)
+def liveness_ok(result, strict=LIVENESS_STRICT):
+    if result.live is None:
+        return not strict
+    return result.live
+
+
+def main(argv=None):
+    from .utils import detect_faces, select_face
+    parser = argparse.ArgumentParser(description="Mostra as pistas de vivacidade da câmera, para calibrar os limiares.")
+    parser.add_argument("--camera", default="0")
+    parser.add_argument("--orcamento-ms", type=float, default=LIVENESS_BUDGET_MS)
+    args = parser.parse_args(argv)
+    cap = cv2.VideoCapture(int(args.camera) if args.camera.isdigit() else args.camera)
+    history = FrameHistory()
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            history.push(frame)
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            box = select_face(detect_faces(rgb), rgb.shape)
+            if box is not None:
+                print(check_liveness(rgb, box, history, args.orcamento_ms))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cap.release()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,72 @@
-import sys
+import os, sys, time, argparse
+
+# Referência para o relatório de tempo de inicialização (antes dos imports pesados)
+STARTED_AT = time.perf_counter()
+
 from PyQt5.QtWidgets import QApplication
 
-from .arduino import conectar_arduino
+from .serial_io import SerialLink
+from .client import RecognitionClient, SECRET_ENV as SERVICE_SECRET_ENV
 from .ui import App
+from .metrics import metrics
+from .replication import DEFAULT_REPLICATION_PORT, SECRET_ENV, parse_peer
 
 def main():
-    app = QApplication(sys.argv)
-    arduino = conectar_arduino()
-    window = App(arduino)
+    parser = argparse.ArgumentParser(description="Controle de acesso com reconhecimento facial e RFID.")
+    parser.add_argument("--servidor", metavar="HOST:PORTA",
+                        help="usa um serviço de reconhecimento (python -m src.server) em vez da galeria local")
+    parser.add_argument("--servidor-segredo", default=os.environ.get(SERVICE_SECRET_ENV), metavar="SEGREDO",
+                        help=f"segredo do serviço de reconhecimento (padrão: variável {SERVICE_SECRET_ENV})")
+    parser.add_argument("--camera", default="0",
+                        help="índice da câmera, arquivo de vídeo ou pasta de imagens (para testes sem câmera)")
+    parser.add_argument("--cartoes", metavar="ARQUIVO",
+                        help="usa um Arduino simulado que reproduz os cartões gravados (python -m src.simulation gravar)")
+    parser.add_argument("--metricas-porta", type=int, metavar="PORTA",
+                        help="publica métricas no formato Prometheus em http://127.0.0.1:PORTA/metrics")
+    parser.add_argument("--metricas-arquivo", metavar="ARQUIVO",
+                        help="grava as métricas no formato Prometheus neste arquivo a cada 10 s")
+    parser.add_argument("--replicacao-porta", type=int, nargs="?", const=DEFAULT_REPLICATION_PORT, metavar="PORTA",
+                        help="replica galeria, cartões e acessos com outros quiosques (python -m src.replication)")
+    parser.add_argument("--pares", nargs="*", default=[], metavar="HOST:PORTA",
+                        help="outros quiosques com quem sincronizar (com --replicacao-porta)")
+    parser.add_argument("--replicacao-endereco", default="127.0.0.1", metavar="HOST",
+                        help="endereço em que a replicação escuta (padrão: só esta máquina)")
+    parser.add_argument("--replicacao-segredo", default=os.environ.get(SECRET_ENV), metavar="SEGREDO",
+                        help=f"segredo compartilhado entre os quiosques (padrão: variável {SECRET_ENV})")
+    args, qt_args = parser.parse_known_args()
+    if args.metricas_porta or args.metricas_arquivo:
+        metrics.enabled = True
+    if args.metricas_porta:
+        metrics.serve(args.metricas_porta)
+    if args.metricas_arquivo:
+        metrics.export_to_file(args.metricas_arquivo)
+    app = QApplication(sys.argv[:1] + qt_args)
+    client = None
+    if args.servidor:
+        host, _, port = args.servidor.rpartition(":")
+        client = RecognitionClient(host or "127.0.0.1", int(port), secret=args.servidor_segredo)
+    # a conexão (e reconexão) com o Arduino acontece em segundo plano
+    if args.cartoes:
+        from .simulation import FakeArduino, load_card_taps
+        device = FakeArduino()
+        device.replay(load_card_taps(args.cartoes))
+        serial_link = SerialLink(connect=device.connect)
+    else:
+        serial_link = SerialLink()
+    serial_link.start()
+    replication = None
+    if args.replicacao_porta:
+        if not args.replicacao_segredo:
+            parser.error(f"a replicação exige um segredo compartilhado (--replicacao-segredo ou {SECRET_ENV})")
+        replication = (args.replicacao_endereco, args.replicacao_porta, [parse_peer(p) for p in args.pares],
+                       args.replicacao_segredo)
+    window = App(serial_link, client, STARTED_AT, args.camera, replication)
     window.show()
-    sys.exit(app.exec_())
+    code = app.exec_()
+    serial_link.stop()
+    if args.metricas_arquivo:
+        metrics.write_file(args.metricas_arquivo)
+    sys.exit(code)
 
 if __name__ == "__main__":
     main()
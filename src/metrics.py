@@ -0,0 +1,186 @@
+import os, time, bisect, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limites (em segundos) dos histogramas; a espera pelo cartão pode levar dezenas de segundos
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIX = "pfr_"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.last = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.last = value
+
+
+# Trecho cronometrado; ao sair, a duração vai para o histograma de mesmo nome
+class _Span:
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.monotonic() - self.start)
+        return False
+
+
+# Usado quando as métricas estão desligadas: não mede nem aloca nada
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+# Contadores e histogramas do processo. Desligado por padrão; com
+# `enabled = False` cada chamada custa apenas um teste de atributo.
+class MetricsRegistry:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._exporter = None
+
+    def span(self, name):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name)
+
+    def inc(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = Histogram()
+            hist.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # Marco para summary(since=...): contagem e soma atuais de cada histograma
+    def mark(self):
+        with self._lock:
+            return {n: (h.count, h.sum) for n, h in self._histograms.items()}
+
+    # Resumo legível para o painel de logs: tempo de cada trecho e a média.
+    # Com `since` (um mark()), só entram os trechos medidos depois do marco,
+    # com o tempo gasto neles desde então
+    def summary(self, names=None, since=None):
+        parts = []
+        with self._lock:
+            for n, h in sorted(self._histograms.items()):
+                if names is not None and n not in names:
+                    continue
+                count, total = since.get(n, (0, 0.0)) if since is not None else (h.count - 1, h.sum - h.last)
+                if h.count <= count:
+                    continue
+                parts.append(f"{n} {1000 * (h.sum - total):.0f} ms (média {1000 * h.sum / h.count:.0f} ms, n={h.count})")
+        return "; ".join(parts)
+
+    # Formato de texto do Prometheus
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                metric = f"{PREFIX}{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+            for name, hist in sorted(self._histograms.items()):
+                metric = f"{PREFIX}{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {hist.count}')
+                lines.append(f"{metric}_sum {hist.sum:.6f}")
+                lines.append(f"{metric}_count {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+    # Regrava o arquivo de métricas a cada `interval` segundos (para o
+    # coletor de arquivos de texto do node_exporter, por exemplo)
+    def export_to_file(self, path, interval=10.0):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_file(path)
+                except OSError as e:
+                    print(f"[ERRO] Falha ao gravar as métricas em {path}: {e}")
+
+        self._exporter = threading.Thread(target=run, daemon=True)
+        self._exporter.start()
+
+    # Endpoint HTTP local com GET /metrics
+    def serve(self, port, host="127.0.0.1"):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+metrics = MetricsRegistry(enabled=os.environ.get("PFR_METRICS", "") not in ("", "0"))
+span = metrics.span
+inc = metrics.inc
+observe = metrics.observe
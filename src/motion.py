@@ -0,0 +1,107 @@
+import time, cv2, numpy as np
+
+# Largura da miniatura cinza usada para detectar movimento
+MOTION_WIDTH = 64
+# Diferença mínima (0-255) de um pixel para o fundo e fração mínima da
+# miniatura alterada para considerar que há movimento
+PIXEL_THRESHOLD = 18
+MIN_CHANGED = 0.004
+# Velocidade de adaptação do fundo (mudanças lentas de luz são absorvidas)
+BACKGROUND_ALPHA = 0.05
+# Depois do último movimento/rosto a detecção continua a cada frame por
+# HOLD_SECONDS; em seguida o intervalo entre detecções dobra a cada rodada
+# vazia até IDLE_INTERVAL (conferência periódica, para quem chega parado)
+HOLD_SECONDS = 2.0
+IDLE_INTERVAL = 2.0
+MIN_INTERVAL = 0.1
+
+
+# Portão de movimento antes da detecção: compara uma miniatura cinza de cada
+# frame com um fundo médio e só libera a detecção HOG quando há movimento,
+# rostos sendo acompanhados ou uma conferência periódica vencida. Com a porta
+# vazia quase todo o trabalho é o resize da miniatura (~0,1 ms por frame).
+class MotionGate:
+    def __init__(self, width=MOTION_WIDTH, pixel_threshold=PIXEL_THRESHOLD, min_changed=MIN_CHANGED,
+                 alpha=BACKGROUND_ALPHA, hold=HOLD_SECONDS, idle_interval=IDLE_INTERVAL):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.alpha = alpha
+        self.hold = hold
+        self.idle_interval = idle_interval
+        self.frames = 0
+        self.woken = 0
+        self.motion_frames = 0
+        self.busy = 0.0
+        self.changed = 0.0
+        self._background = None
+        self._active_until = float("-inf")
+        self._interval = MIN_INTERVAL
+        self._next_check = float("-inf")
+        self._started = time.monotonic()
+
+    def reset(self):
+        self._background = None
+        self._active_until = float("-inf")
+        self._interval = MIN_INTERVAL
+        self._next_check = float("-inf")
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, h * self.width // w))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (3, 3), 0)
+
+    # Fração da miniatura que difere do fundo; o fundo é atualizado em seguida
+    def motion(self, frame):
+        gray = self._thumbnail(frame)
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            return 1.0
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        changed = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+        cv2.accumulateWeighted(gray, self._background, self.alpha)
+        return changed
+
+    # Decide se o frame (BGR) deve seguir para a detecção. `faces` indica se
+    # há rostos sendo acompanhados desde a última detecção.
+    def should_detect(self, frame, faces=False, now=None):
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+        self.changed = self.motion(frame)
+        if self.changed >= self.min_changed or faces:
+            if self.changed >= self.min_changed:
+                self.motion_frames += 1
+            self._active_until = now + self.hold
+            self._interval = MIN_INTERVAL
+        if now < self._active_until:
+            wake = True
+        elif now >= self._next_check:
+            # porta parada: conferências cada vez mais espaçadas
+            wake = True
+            self._next_check = now + self._interval
+            self._interval = min(self._interval * 2, self.idle_interval)
+        else:
+            wake = False
+        if wake:
+            self.woken += 1
+        return wake
+
+    # Tempo gasto no trabalho liberado pelo portão (detecção, codificação...)
+    def record(self, seconds):
+        self.busy += seconds
+
+    @property
+    def active(self):
+        return time.monotonic() < self._active_until
+
+    # Ciclo de trabalho: fração dos frames liberados e do tempo ocupado
+    def stats(self):
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "quadros_com_movimento": self.motion_frames,
+            "quadros_liberados": self.woken,
+            "liberados_%": round(100.0 * self.woken / max(self.frames, 1), 1),
+            "ciclo_de_trabalho_%": round(100.0 * self.busy / elapsed, 2),
+        }
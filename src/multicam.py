@@ -0,0 +1,209 @@
+import os, sys, time, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from .gallery import FaceGallery
+from .pipeline import CaptureThread
+from .utils import get_face_encoding, load_known_faces, load_face_index, CONTINUOUS_DETECTION_SCALE
+
+
+# Contadores de uma fonte (câmera) para o relatório de vazão
+class SourceStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.latencies = []
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        lat = np.array(self.latencies[-1000:]) * 1000 if self.latencies else np.zeros(1)
+        return {
+            "recebidos": self.submitted,
+            "processados": self.processed,
+            "descartados": self.dropped,
+            "fps": self.processed / elapsed,
+            "latencia_p50_ms": float(np.percentile(lat, 50)),
+            "latencia_p95_ms": float(np.percentile(lat, 95)),
+        }
+
+
+# Agenda o reconhecimento de várias câmeras: cada fonte guarda só o frame
+# mais recente, e um lote reúne no máximo um frame por fonte (justiça entre
+# portas). O lote sai quando todas as fontes têm frame ou quando o mais
+# antigo atinge `latency_budget` segundos. A detecção e a codificação
+# (get_face_encoding) dos frames do lote rodam em paralelo em `workers`
+# threads (o dlib e o OpenCV liberam o GIL), e a comparação do lote inteiro
+# contra a galeria é uma única operação de matriz.
+class MultiCameraScheduler:
+    def __init__(self, gallery, on_result, tolerance=0.5, latency_budget=0.03,
+                 detection_scale=CONTINUOUS_DETECTION_SCALE, workers=None):
+        self.gallery = gallery
+        self.on_result = on_result
+        self.tolerance = tolerance
+        self.latency_budget = latency_budget
+        self.detection_scale = detection_scale
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self.stats = {}
+        self.batches = 0
+        self._sources = []
+        self._pending = {}
+        self._next_first = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def add_source(self, source):
+        with self._cond:
+            if source not in self.stats:
+                self._sources.append(source)
+                self.stats[source] = SourceStats()
+
+    def submit(self, source, frame):
+        with self._cond:
+            stats = self.stats[source]
+            stats.submitted += 1
+            if source in self._pending:
+                stats.dropped += 1
+            self._pending[source] = (frame, time.monotonic())
+            self._cond.notify()
+
+    def start(self):
+        self._running = True
+        self._pool = ThreadPoolExecutor(min(self.workers, max(len(self._sources), 1)))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+    def _next_batch(self):
+        with self._cond:
+            while self._running:
+                if self._pending:
+                    oldest = min(t for _, t in self._pending.values())
+                    wait = self.latency_budget - (time.monotonic() - oldest)
+                    if len(self._pending) == len(self._sources) or wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait(0.5)
+            if not self._running:
+                return []
+            # rodízio: a cada lote uma fonte diferente é atendida primeiro
+            n = len(self._sources)
+            order = [self._sources[(self._next_first + i) % n] for i in range(n)]
+            self._next_first = (self._next_first + 1) % n
+            batch = [(s,) + self._pending.pop(s) for s in order if s in self._pending]
+            return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._next_batch()
+            if batch:
+                self._process(batch)
+
+    def _encode(self, frame):
+        return get_face_encoding(frame, self.detection_scale)
+
+    def _process(self, batch):
+        frames = [frame for _, frame, _ in batch]
+        if self._pool is not None and len(frames) > 1:
+            results = list(self._pool.map(self._encode, frames))
+        else:
+            results = [self._encode(frame) for frame in frames]
+        found = [encoding is not None for encoding in results]
+        encodings = [encoding for encoding in results if encoding is not None]
+        matches = iter(self.gallery.match_batch(encodings, self.tolerance) if encodings else [])
+        self.batches += 1
+        now = time.monotonic()
+        for (source, frame, submitted_at), has_face in zip(batch, found):
+            match = next(matches) if has_face else None
+            stats = self.stats[source]
+            stats.processed += 1
+            stats.latencies.append(now - submitted_at)
+            if len(stats.latencies) > 5000:
+                del stats.latencies[:-1000]
+            self.on_result(source, has_face, match, frame)
+
+    def report(self):
+        with self._cond:
+            return {source: stats.summary() for source, stats in self.stats.items()}
+
+
+# Adapta o CaptureThread (que publica em uma fila) para entregar ao agendador
+class _SourceFeed:
+    def __init__(self, scheduler, source):
+        self.scheduler = scheduler
+        self.source = source
+
+    def put(self, frame):
+        self.scheduler.submit(self.source, frame)
+
+
+# Uma thread de captura por câmera alimentando o mesmo agendador
+class MultiCameraRunner:
+    def __init__(self, sources, scheduler):
+        self.scheduler = scheduler
+        self.captures = []
+        for source in sources:
+            scheduler.add_source(source)
+            self.captures.append(CaptureThread(_SourceFeed(scheduler, source), source))
+
+    def start(self):
+        self.scheduler.start()
+        for capture in self.captures:
+            capture.start()
+
+    def stop(self):
+        for capture in self.captures:
+            capture.stop()
+        for capture in self.captures:
+            capture.join(timeout=2)
+        self.scheduler.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconhecimento em várias câmeras com lotes agendados.")
+    parser.add_argument("cameras", nargs="+", help="índices das câmeras ou caminhos de vídeo")
+    parser.add_argument("--orcamento-ms", type=float, default=30.0, help="espera máxima para formar um lote")
+    parser.add_argument("--tolerancia", type=float, default=0.5)
+    parser.add_argument("--intervalo", type=float, default=5.0, help="segundos entre relatórios")
+    parser.add_argument("--trabalhadores", type=int, help="threads de detecção/codificação (padrão: núcleos da CPU)")
+    args = parser.parse_args(argv)
+
+    gallery = FaceGallery(*load_known_faces())
+    load_face_index(gallery)
+    sources = [int(c) if c.isdigit() else c for c in args.cameras]
+
+    def on_result(source, has_face, match, frame):
+        if match:
+            print(f"[câmera {source}] {match.name} (distância {match.distance:.3f})")
+
+    scheduler = MultiCameraScheduler(gallery, on_result, args.tolerancia, args.orcamento_ms / 1000.0,
+                                     workers=args.trabalhadores)
+    runner = MultiCameraRunner(sources, scheduler)
+    runner.start()
+    try:
+        while True:
+            time.sleep(args.intervalo)
+            for source, summary in scheduler.report().items():
+                print(f"[câmera {source}] " + ", ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                                                        for k, v in summary.items()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
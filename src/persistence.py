@@ -0,0 +1,125 @@
+import os, time, atexit, threading
+from collections import OrderedDict
+
+
+def _fsync_dir(path):
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Grava em arquivo temporário, fsync e troca pelo definitivo (rename atômico):
+# quem lê o arquivo vê a versão antiga ou a nova inteira, nunca uma truncada
+def atomic_write(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+# Gravações em segundo plano, fora da thread da interface. Cada tarefa tem
+# uma chave (normalmente o arquivo): tarefas "coalescentes" gravam o estado
+# inteiro, então uma nova substitui a pendente de mesma chave; as demais
+# (ex.: anexar ao arquivo da galeria) são executadas todas, em ordem. As
+# pendências são executadas em lote a cada `interval` segundos, em flush() ou
+# no encerramento; erros vão para `on_error`.
+class PersistenceWriter:
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.on_error = None
+        self.writes = 0
+        self.coalesced = 0
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._wake = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, key, fn, coalesce=True):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Gravador de arquivos já encerrado.")
+            tasks = self._pending.setdefault(key, [])
+            if coalesce:
+                self.coalesced += len(tasks)
+                tasks[:] = [fn]
+            else:
+                tasks.append(fn)
+            self._cond.notify_all()
+
+    # Atalho para gravar um arquivo inteiro; `producer` gera os bytes na hora
+    # da gravação (o estado mais recente)
+    def write_file(self, path, producer):
+        self.submit(path, lambda: atomic_write(path, producer()))
+
+    def pending(self):
+        with self._cond:
+            return sum(len(tasks) for tasks in self._pending.values()) + self._busy
+
+    # Grava tudo o que está pendente e espera terminar
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._wake = True
+            self._cond.notify_all()
+            while self._pending or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout=10.0):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # junta as gravações que chegarem durante o intervalo
+                deadline = time.monotonic() + self.interval
+                while not self._wake and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._wake = False
+                batch, self._pending = self._pending, OrderedDict()
+                self._busy = True
+            for key, tasks in batch.items():
+                for fn in tasks:
+                    try:
+                        fn()
+                        self.writes += 1
+                    except Exception as e:
+                        message = f"[ERRO] Falha ao gravar {key}: {e}"
+                        if self.on_error:
+                            self.on_error(message)
+                        else:
+                            print(message)
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+
+# Gravador compartilhado do processo; o que estiver pendente é gravado na saída
+writer = PersistenceWriter()
+atexit.register(writer.close)
@@ -0,0 +1,248 @@
+import threading, time, cv2
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+from .utils import encode_face, compare_faces
+from .tracking import FaceTracker
+from .liveness import FrameHistory, check_liveness, liveness_ok
+from .motion import MotionGate
+from .frames import open_source
+
+# Depois de uma prova de vida reprovada, a mesma trilha é conferida de novo
+# a cada LIVENESS_RETRY_FRAMES frames processados (sem repetir o aviso)
+LIVENESS_RETRY_FRAMES = 5
+
+
+# Fila de um único lugar: o frame mais recente sempre substitui o anterior,
+# então frames são descartados (e contados) quando o reconhecimento atrasa
+class LatestFrameQueue:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self.put_count += 1
+            self._cond.notify()
+
+    # Retorna o frame mais recente ou None em caso de timeout/fechamento
+    def get(self, timeout=None):
+        with self._cond:
+            if self._frame is None and not self._closed:
+                self._cond.wait(timeout)
+            frame, self._frame = self._frame, None
+            return frame
+
+    def clear(self):
+        with self._cond:
+            self._frame = None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+# Thread que apenas lê a câmera (ou vídeo/pasta de imagens, ver
+# frames.open_source) e publica frames na fila
+class CaptureThread(threading.Thread):
+    def __init__(self, frames, source=0):
+        super().__init__(daemon=True)
+        self.frames = frames
+        self.source = source
+        self._stop_event = threading.Event()
+
+    def run(self):
+        cap = open_source(self.source)
+        try:
+            while not self._stop_event.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    time.sleep(0.05)
+                    continue
+                self.frames.put(frame)
+        finally:
+            cap.release()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# Detecta, codifica e compara os frames da fila fora da thread da interface.
+# Um FaceTracker evita redetectar e recodificar quem continua parado na porta.
+# Antes de informar um rosto reconhecido, a prova de vida usa as miniaturas
+# dos frames já processados. Com um MotionGate, frames sem movimento (e sem
+# rostos sendo acompanhados) nem chegam à detecção.
+class RecognitionWorker(QThread):
+    rosto_reconhecido = pyqtSignal(object, object)
+    rosto_desconhecido = pyqtSignal(object)
+    vivacidade_reprovada = pyqtSignal(object, object)
+
+    def __init__(self, frames, gallery, tolerance=0.5, cooldown=5.0, gate=None):
+        super().__init__()
+        self.frames = frames
+        self.gallery = gallery
+        self.tolerance = tolerance
+        self.cooldown = cooldown
+        self.gate = gate
+        self.processed = 0
+        self.tracker = FaceTracker()
+        self.history = FrameHistory()
+        self.liveness_ms = 0.0
+        self._running = True
+        self._paused = threading.Event()
+        self._reset_tracker = False
+        self._last_emit = {}
+
+    def pause(self):
+        self._paused.set()
+
+    def resume(self):
+        self.frames.clear()
+        self._reset_tracker = True
+        self._paused.clear()
+
+    def stop(self):
+        self._running = False
+        self.frames.close()
+
+    # Evita emitir o mesmo resultado repetidamente enquanto a pessoa está parada na porta
+    def _should_emit(self, key):
+        now = time.monotonic()
+        if now - self._last_emit.get(key, float("-inf")) < self.cooldown:
+            return False
+        self._last_emit[key] = now
+        return True
+
+    def run(self):
+        while self._running:
+            frame = self.frames.get(timeout=0.5)
+            if frame is None or self._paused.is_set():
+                continue
+            if self._reset_tracker:
+                self.tracker.reset()
+                self.history.clear()
+                if self.gate is not None:
+                    self.gate.reset()
+                self._reset_tracker = False
+            if self.gate is None:
+                self._process(frame)
+                continue
+            was_active = self.gate.active
+            if not self.gate.should_detect(frame, faces=bool(self.tracker.tracks)):
+                continue
+            # acordou de uma porta parada: frames antigos não servem à prova de vida
+            if not was_active:
+                self.history.clear()
+            t0 = time.perf_counter()
+            self._process(frame)
+            self.gate.record(time.perf_counter() - t0)
+
+    def _process(self, frame):
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        self.history.push(rgb, rgb=True)
+        self.processed += 1
+        for track in self.tracker.update(rgb):
+            if self.tracker.needs_encoding(track):
+                encoding = encode_face(rgb, track.box)
+                if encoding is None:
+                    continue
+                match = compare_faces(self.gallery, encoding, tolerance=self.tolerance)
+                self.tracker.mark_encoded(track, match)
+            # cada trilha é informada uma única vez por identidade
+            if track.reported or track.encoded_at is None:
+                continue
+            match = track.identity
+            if match:
+                # recém-acordado pelo portão de movimento o histórico tem um
+                # único frame: espera o próximo para usar também o movimento
+                if self.processed < track.liveness_retry_at or len(self.history) < 2:
+                    continue
+                liveness = check_liveness(rgb, track.box, self.history)
+                self.liveness_ms += liveness.elapsed_ms
+                if not liveness_ok(liveness):
+                    # reprovada: tenta de novo adiante (uma falha isolada não
+                    # bloqueia a pessoa até ela sair do quadro)
+                    track.liveness_retry_at = self.processed + LIVENESS_RETRY_FRAMES
+                    if not track.liveness_failed:
+                        track.liveness_failed = True
+                        self.vivacidade_reprovada.emit(match, liveness)
+                    continue
+                track.reported = True
+                if self._should_emit(match.name):
+                    self.rosto_reconhecido.emit(match, frame)
+            else:
+                track.reported = True
+                if self._should_emit(None):
+                    self.rosto_desconhecido.emit(frame)
+
+
+# Reconhecimento contínuo: captura -> fila (último frame vence) -> reconhecimento
+class RecognitionPipeline(QObject):
+    rosto_reconhecido = pyqtSignal(object, object)
+    rosto_desconhecido = pyqtSignal(object)
+    vivacidade_reprovada = pyqtSignal(object, object)
+
+    def __init__(self, gallery, source=0, tolerance=0.5, motion_gate=True, parent=None):
+        super().__init__(parent)
+        self.gallery = gallery
+        self.source = source
+        self.tolerance = tolerance
+        self.motion_gate = motion_gate
+        self.frames = None
+        self.capture = None
+        self.worker = None
+
+    @property
+    def running(self):
+        return self.worker is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.frames = LatestFrameQueue()
+        self.capture = CaptureThread(self.frames, self.source)
+        gate = MotionGate() if self.motion_gate else None
+        self.worker = RecognitionWorker(self.frames, self.gallery, self.tolerance, gate=gate)
+        self.worker.rosto_reconhecido.connect(self.rosto_reconhecido)
+        self.worker.rosto_desconhecido.connect(self.rosto_desconhecido)
+        self.worker.vivacidade_reprovada.connect(self.vivacidade_reprovada)
+        self.capture.start()
+        self.worker.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.capture.stop()
+        self.worker.stop()
+        self.capture.join(timeout=2)
+        # sem timeout: destruir o QThread no meio de uma detecção aborta o processo
+        self.worker.wait()
+        self.capture = self.worker = self.frames = None
+
+    def pause(self):
+        if self.worker:
+            self.worker.pause()
+
+    def resume(self):
+        if self.worker:
+            self.worker.resume()
+
+    def stats(self):
+        if not self.running:
+            return {}
+        stats = {
+            "capturados": self.frames.put_count,
+            "descartados": self.frames.dropped,
+            "processados": self.worker.processed,
+            "prova_de_vida_ms": round(self.worker.liveness_ms, 1),
+        }
+        stats.update(self.worker.tracker.stats())
+        if self.worker.gate is not None:
+            stats.update(self.worker.gate.stats())
+        return stats
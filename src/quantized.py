@@ -0,0 +1,304 @@
+import sys, time, argparse, threading
+import numpy as np
+
+from .gallery import FaceGallery, MatchResult, ENCODING_DIM, _locked
+
+QUANTIZATION_MODES = ("int8", "float16")
+# Candidatos da passada aproximada que são reavaliados em float32
+RERANK = 32
+# Linhas convertidas para float32 por vez na passada aproximada (limita a
+# memória temporária a ~32 MB por consulta, independente do tamanho da galeria)
+CHUNK_ROWS = 65536
+
+
+# int8: escala por vetor (maior valor absoluto / 127), 1 byte por dimensão;
+# float16: 2 bytes por dimensão, escala 1
+def quantize(block, mode="int8"):
+    block = np.asarray(block, dtype=np.float32).reshape(-1, ENCODING_DIM)
+    if mode == "float16":
+        return block.astype(np.float16), np.ones(len(block), dtype=np.float32)
+    peak = np.abs(block).max(axis=1)
+    scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    q = np.clip(np.rint(block / scales[:, None]), -127, 127).astype(np.int8)
+    return q, scales
+
+
+def dequantize(q, scales):
+    return q.astype(np.float32) * scales[:, None]
+
+
+# Galeria compacta para centenas de milhares de identidades: as codificações
+# ficam quantizadas (int8 com escala por vetor: 140 bytes por rosto contra 516
+# da FaceGallery; ou float16) junto com a norma exata de cada vetor original.
+# A busca calcula distâncias aproximadas direto na matriz quantizada, em
+# blocos, e reavalia em float32 os RERANK melhores candidatos: com uma
+# referência float (ex.: o np.memmap do arquivo da galeria, que fica no disco
+# e só tem essas linhas lidas) a distância final é exata; sem ela, é a
+# distância ao vetor desquantizado. Mesma interface de busca da FaceGallery.
+class QuantizedGallery:
+    def __init__(self, encodings=(), names=(), mode="int8", rerank=RERANK, reference=None, capacity=64):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Quantização desconhecida: {mode}")
+        self.mode = mode
+        self.rerank = rerank
+        self.index = None
+        self._lock = threading.RLock()
+        self.load(encodings, names, capacity, reference)
+
+    # A matriz recebida não é guardada; se for um np.memmap (galeria lida do
+    # disco), vira a referência float da reavaliação
+    @_locked
+    def load(self, encodings=(), names=(), capacity=64, reference=None):
+        names = list(names)
+        block = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(names) != len(block):
+            raise ValueError("Quantidade de nomes e codificações não confere.")
+        if reference is None and isinstance(encodings, np.memmap) and encodings.dtype == np.float32:
+            reference = encodings
+        self._reference = reference
+        self._names = []
+        self._rows = {}
+        self._count = 0
+        capacity = max(capacity, len(block), 1)
+        self._q = np.empty((capacity, ENCODING_DIM), dtype=np.float16 if self.mode == "float16" else np.int8)
+        self._scales = np.empty(capacity, dtype=np.float32)
+        self._sq_norms = np.empty(capacity, dtype=np.float32)
+        self._ref_rows = np.full(capacity, -1, dtype=np.int32)
+        if len(block):
+            self._append(names, block, 0 if reference is not None else None)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def lock(self):
+        return self._lock
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    # Cópia desquantizada (N, 128) em float32; cara em galerias grandes
+    @property
+    @_locked
+    def encodings(self):
+        return dequantize(self._q[:self._count], self._scales[:self._count])
+
+    @property
+    @_locked
+    def names(self):
+        return list(self._names)
+
+    @_locked
+    def unique_names(self):
+        return list(self._rows)
+
+    @_locked
+    def rows_of(self, name):
+        return list(self._rows.get(name, ()))
+
+    # Bytes ocupados por rosto (matriz quantizada, escala, norma e linha de referência)
+    def bytes_per_face(self):
+        return self._q.itemsize * ENCODING_DIM + self._scales.itemsize + self._sq_norms.itemsize + self._ref_rows.itemsize
+
+    def _reserve(self, extra):
+        needed = self._count + extra
+        capacity = self._q.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for attr in ("_q", "_scales", "_sq_norms", "_ref_rows"):
+            old = getattr(self, attr)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._count] = old[:self._count]
+            setattr(self, attr, new)
+
+    def _append(self, names, block, ref_start=None):
+        self._reserve(len(names))
+        start = self._count
+        for offset in range(0, len(block), CHUNK_ROWS):
+            chunk = np.asarray(block[offset:offset + CHUNK_ROWS], dtype=np.float32)
+            end = start + offset + len(chunk)
+            self._q[start + offset:end], self._scales[start + offset:end] = quantize(chunk, self.mode)
+            self._sq_norms[start + offset:end] = np.einsum("ij,ij->i", chunk, chunk)
+        end = start + len(names)
+        self._ref_rows[start:end] = -1 if ref_start is None else np.arange(ref_start, ref_start + len(names))
+        for offset, name in enumerate(names):
+            self._names.append(name)
+            self._rows.setdefault(name, []).append(start + offset)
+        self._count = end
+
+    @_locked
+    def add(self, name, encoding):
+        self._append([name], FaceGallery._as_vector(encoding)[None, :])
+        return self._count - 1
+
+    @_locked
+    def extend(self, names, encodings):
+        names = list(names)
+        block = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(names) != len(block):
+            raise ValueError("Quantidade de nomes e codificações não confere.")
+        self._append(names, block)
+
+    # Remove as linhas de um usuário movendo a última para o espaço liberado
+    @_locked
+    def remove(self, name):
+        rows = self._rows.pop(name, None)
+        if not rows:
+            return 0
+        for row in sorted(rows, reverse=True):
+            last = self._count - 1
+            if row != last:
+                moved = self._names[last]
+                for arr in (self._q, self._scales, self._sq_norms, self._ref_rows):
+                    arr[row] = arr[last]
+                self._names[row] = moved
+                moved_rows = self._rows[moved]
+                moved_rows[moved_rows.index(last)] = row
+            self._names.pop()
+            self._count -= 1
+        return len(rows)
+
+    # Passada aproximada: os k candidatos mais próximos de cada consulta
+    # (B, 128), percorrendo a matriz quantizada em blocos. Retorna (linhas,
+    # distâncias ao quadrado aproximadas), ambas (B, k).
+    def _candidates(self, queries, k):
+        k = min(k, self._count)
+        query_sq = np.einsum("ij,ij->i", queries, queries)[:, None]
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_sq = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self._count, CHUNK_ROWS):
+            end = min(self._count, start + CHUNK_ROWS)
+            dots = queries @ self._q[start:end].astype(np.float32).T
+            if self.mode == "int8":
+                dots *= self._scales[start:end]
+            sq = self._sq_norms[start:end] + query_sq - 2.0 * dots
+            if sq.shape[1] > k:
+                idx = np.argpartition(sq, k - 1, axis=1)[:, :k]
+                sq = np.take_along_axis(sq, idx, axis=1)
+            else:
+                idx = np.broadcast_to(np.arange(end - start), sq.shape)
+            best_rows = np.concatenate([best_rows, idx + start], axis=1)
+            best_sq = np.concatenate([best_sq, sq], axis=1)
+            if best_rows.shape[1] > k:
+                keep = np.argpartition(best_sq, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_sq = np.take_along_axis(best_sq, keep, axis=1)
+        return best_rows, best_sq
+
+    # Vetores float32 das linhas: da referência quando existir, senão desquantizados
+    def _float_rows(self, rows):
+        vectors = dequantize(self._q[rows], self._scales[rows])
+        if self._reference is not None:
+            refs = self._ref_rows[rows]
+            have = refs >= 0
+            if have.any():
+                vectors[have] = self._reference[refs[have]]
+        return vectors
+
+    def _rerank(self, query, rows, approx_sq, tolerance):
+        dists = np.linalg.norm(self._float_rows(rows) - query, axis=1)
+        best = int(np.argmin(dists))
+        best_dist = float(dists[best])
+        if best_dist > tolerance:
+            return None
+        row = int(rows[best])
+        name = self._names[row]
+        others = ~np.isin(rows, self._rows[name])
+        if others.any():
+            margin = float(dists[others].min()) - best_dist
+        else:
+            # todos os candidatos são do mesmo usuário: o próximo colocado
+            # está além do pior candidato da passada aproximada
+            margin = float(np.sqrt(max(float(approx_sq.max()), 0.0))) - best_dist
+        return MatchResult(name, best_dist, margin, row)
+
+    @_locked
+    def match(self, encoding, tolerance=0.5):
+        return self.match_batch([FaceGallery._as_vector(encoding)], tolerance)[0]
+
+    # Várias consultas de uma vez: a passada aproximada percorre a matriz uma
+    # única vez para o lote inteiro
+    @_locked
+    def match_batch(self, queries, tolerance=0.5):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if not self._count:
+            return [None] * len(queries)
+        rows, approx_sq = self._candidates(queries, self.rerank)
+        return [self._rerank(q, r, s, tolerance) for q, r, s in zip(queries, rows, approx_sq)]
+
+
+# Compara a galeria quantizada com a busca float (FaceGallery) nas mesmas
+# consultas: concordância do usuário escolhido e da decisão de liberar, erro
+# das distâncias, memória por rosto e tempo por consulta
+def accuracy_report(matrix, names, queries, mode="int8", tolerance=0.5, rerank=RERANK, reference=False, batch=64):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    baseline = FaceGallery(matrix.copy(), names)
+    quantized = QuantizedGallery(matrix, names, mode, rerank, reference=matrix if reference else None)
+
+    def run(gallery):
+        t0 = time.perf_counter()
+        results = []
+        for start in range(0, len(queries), batch):
+            results.extend(gallery.match_batch(queries[start:start + batch], tolerance))
+        return results, 1000 * (time.perf_counter() - t0) / max(len(queries), 1)
+
+    expected, float_ms = run(baseline)
+    got, quant_ms = run(quantized)
+    same_user = sum((a.name if a else None) == (b.name if b else None) for a, b in zip(expected, got))
+    same_decision = sum((a is None) == (b is None) for a, b in zip(expected, got))
+    errors = [abs(a.distance - b.distance) for a, b in zip(expected, got) if a and b and a.name == b.name]
+    return {
+        "modo": mode + (" + referência float" if reference else ""),
+        "consultas": len(queries),
+        "mesmo_usuario_%": 100.0 * same_user / max(len(queries), 1),
+        "mesma_decisao_%": 100.0 * same_decision / max(len(queries), 1),
+        "erro_distancia_medio": float(np.mean(errors)) if errors else 0.0,
+        "erro_distancia_max": float(np.max(errors)) if errors else 0.0,
+        "bytes_por_rosto": quantized.bytes_per_face(),
+        "bytes_por_rosto_float": np.dtype(np.float32).itemsize * (ENCODING_DIM + 1),
+        "ms_por_consulta": quant_ms,
+        "ms_por_consulta_float": float_ms,
+    }
+
+
+def format_report(report):
+    return (
+        f"[{report['modo']}] {report['consultas']} consultas: "
+        f"mesmo usuário {report['mesmo_usuario_%']:.2f}%, mesma decisão {report['mesma_decisao_%']:.2f}%, "
+        f"erro de distância médio {report['erro_distancia_medio']:.4f} (máx {report['erro_distancia_max']:.4f}), "
+        f"{report['bytes_por_rosto']} bytes/rosto (float: {report['bytes_por_rosto_float']}), "
+        f"{report['ms_por_consulta']:.2f} ms/consulta (float: {report['ms_por_consulta_float']:.2f})"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precisão da galeria quantizada em relação à busca float.")
+    parser.add_argument("--tamanho", type=int, default=100000, help="rostos da galeria sintética")
+    parser.add_argument("--galeria", action="store_true", help="usa a galeria gravada em faces/ em vez da sintética")
+    parser.add_argument("--consultas", type=int, default=1000)
+    parser.add_argument("--modos", nargs="+", default=list(QUANTIZATION_MODES), choices=QUANTIZATION_MODES)
+    parser.add_argument("--tolerancia", type=float, default=0.5)
+    parser.add_argument("--reavaliar", type=int, default=RERANK, help="candidatos reavaliados em float32")
+    args = parser.parse_args(argv)
+
+    from .bench import synthetic_gallery, synthetic_queries
+    if args.galeria:
+        from .utils import load_known_faces
+        matrix, names = load_known_faces()
+        if not len(names):
+            print("[ERRO] Galeria vazia.")
+            return 1
+    else:
+        matrix, names = synthetic_gallery(args.tamanho)
+    queries = synthetic_queries(np.asarray(matrix, dtype=np.float32), args.consultas)
+    for mode in args.modos:
+        for reference in (False, True):
+            print(format_report(accuracy_report(matrix, names, queries, mode, args.tolerancia,
+                                                args.reavaliar, reference)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
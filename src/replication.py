@@ -0,0 +1,749 @@
+import os, sys, json, time, uuid, queue, base64, shutil, secrets, sqlite3, argparse, tempfile, threading, \
+    subprocess, socketserver
+import numpy as np
+
+from .gallery import FaceGallery
+from .access_log import AccessLog, STATUS_BY_ACTION
+from .client import RecognitionClient, ReplayGuard, send_message, read_message, sign, verify
+from .utils import (
+    check_name, faces_dir, card_registry, load_known_faces, append_known_faces, remove_known_face, save_face_index
+)
+
+REPLICATION_FILE = os.path.join(faces_dir, "replication.db")
+DEFAULT_REPLICATION_PORT = 5066
+# Intervalo entre rodadas de sincronização com cada par (s)
+SYNC_INTERVAL = 1.0
+PULL_LIMIT = 500
+# Alterações mantidas no log por nó de origem; um par mais atrasado que isso
+# recebe um retrato completo em vez do delta
+LOG_RETENTION = 10000
+# Segredo compartilhado entre os quiosques: toda mensagem (pedido e resposta)
+# é assinada com ele (client.sign/verify)
+SECRET_ENV = "PFR_REPLICACAO_SEGREDO"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS changes (
+    node TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (node, seq)
+);
+CREATE TABLE IF NOT EXISTS clock (
+    node TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    compacted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS versions (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    ts REAL NOT NULL,
+    node TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+_NO_VERSION = (0.0, "")
+
+
+def _file_time(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return time.time()
+
+
+# Codificações viajam como bytes float32 em base64 (cerca de 1/4 do JSON
+# com floats); listas de floats, de logs e nós antigos, ainda são aceitas
+def encode_matrix(encodings):
+    block = np.ascontiguousarray(encodings, dtype="<f4").reshape(-1, 128)
+    return base64.b64encode(block.tobytes()).decode("ascii")
+
+
+def decode_matrix(data):
+    if isinstance(data, str):
+        return np.frombuffer(base64.b64decode(data), dtype="<f4").astype(np.float32).reshape(-1, 128)
+    return np.asarray(data, dtype=np.float32).reshape(-1, 128)
+
+
+def parse_peer(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+# Replicação entre quiosques. Cada nó numera as próprias alterações (cadastro,
+# remoção, cartão, acesso) com uma sequência crescente e guarda num log
+# SQLite as suas e as recebidas; o relógio {nó: última sequência aplicada}
+# diz o que falta a cada par, que busca só o delta (e repassa adiante, então
+# os nós não precisam estar todos ligados entre si).
+# Conflitos: cadastro/remoção e cartão de um usuário são registros "último
+# a escrever vence", pela versão (horário, nó); o status dentro/fora segue o
+# evento de acesso mais recente (AccessLog), e eventos atrasados que teriam
+# mudado o status são contados em `conflicts`. Um par mais atrasado que o log
+# guardado, ou que ainda não conhece este nó, recebe um retrato completo e
+# depois continua pelos deltas.
+# As alterações locais (avisadas pela interface, cartões e diário de acessos)
+# só ganham horário e versão na hora; a gravação no log fica com uma thread
+# própria, para que quem as avisa nunca espere pela replicação.
+class Replica:
+    def __init__(self, gallery, cards, access_log, path=REPLICATION_FILE, node=None, retention=LOG_RETENTION):
+        self.gallery = gallery
+        self.cards = cards
+        self.access_log = access_log
+        self.retention = retention
+        self.on_applied = None
+        self.on_error = None
+        self.applied = 0
+        self.conflicts = 0
+        self.snapshots = 0
+        self.peer_online = {}
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._ts_lock = threading.Lock()
+        self._pending_versions = {}
+        self._local = queue.Queue()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'node'").fetchone()
+        self.node = node or (row[0] if row else uuid.uuid4().hex[:12])
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('node', ?)", (self.node,))
+        self._clock = {n: [seq, compacted] for n, seq, compacted in self._conn.execute("SELECT * FROM clock")}
+        self._versions = {
+            (kind, key): ((ts, node), bool(deleted))
+            for kind, key, ts, node, deleted in self._conn.execute("SELECT * FROM versions")
+        }
+        self._last_ts = max((v[0][0] for v in self._versions.values()), default=0.0)
+        if self.node not in self._clock:
+            self._clock[self.node] = [0, 0]
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO clock (node, seq, compacted) VALUES (?, 0, 0)", (self.node,))
+        self._seed_versions()
+        self._logger = threading.Thread(target=self._run_log, daemon=True)
+        self._logger.start()
+        cards.on_change = self.card_changed
+        if access_log is not None:
+            access_log.on_record = self.accessed
+
+    # Usuários e cartões que já existiam antes da replicação (ou que voltaram
+    # sem passar por ela) ganham uma versão real: o horário do arquivo e este
+    # nó. Eles não entram no log: chegam aos pares pelo retrato que todo par
+    # que ainda não conhece este nó recebe.
+    def _seed_versions(self):
+        with self._lock, self._conn:
+            for kind, names, path_of in (
+                ("user", self.gallery.unique_names(), lambda name: os.path.join(faces_dir, name)),
+                ("card", [name for name, _ in self.cards.items()], lambda name: self.cards.path),
+            ):
+                for name in names:
+                    version, deleted = self._versions.get((kind, name), (None, True))
+                    if not deleted:
+                        continue
+                    ts = _file_time(path_of(name))
+                    if version is not None:
+                        ts = max(ts, version[0] + 1e-6)
+                    self._set_version(kind, name, (ts, self.node))
+                    self._last_ts = max(self._last_ts, ts)
+
+    def clock(self):
+        with self._lock:
+            return {node: seq for node, (seq, _) in self._clock.items()}
+
+    def _report(self, message):
+        if self.on_error:
+            self.on_error(message)
+        else:
+            print(message)
+
+    # Versão atual de um registro, incluindo alterações locais ainda na fila
+    def _version(self, kind, key):
+        version = self._versions.get((kind, key), (_NO_VERSION, False))[0]
+        with self._ts_lock:
+            pending = self._pending_versions.get((kind, key))
+        return max(version, pending) if pending is not None else version
+
+    # Horário de uma alteração local: nunca volta para trás em relação ao que
+    # já foi visto, para que ela vença as anteriores
+    def _next_ts(self, version_key=None):
+        with self._ts_lock:
+            ts = max(time.time(), self._last_ts + 1e-6)
+            self._last_ts = ts
+            if version_key is not None:
+                self._pending_versions[version_key] = (ts, self.node)
+            return ts
+
+    def _see_ts(self, ts):
+        with self._ts_lock:
+            self._last_ts = max(self._last_ts, ts)
+
+    def _set_version(self, kind, key, version, deleted=False):
+        self._versions[(kind, key)] = (tuple(version), deleted)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO versions (kind, key, ts, node, deleted) VALUES (?, ?, ?, ?, ?)",
+            (kind, key, version[0], version[1], int(deleted)),
+        )
+
+    def _store_change(self, node, seq, ts, kind, payload):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO changes (node, seq, ts, kind, payload) VALUES (?, ?, ?, ?, ?)",
+            (node, seq, ts, kind, json.dumps(payload, ensure_ascii=False)),
+        )
+        entry = self._clock.setdefault(node, [0, 0])
+        entry[0] = seq
+        self._conn.execute(
+            "INSERT OR REPLACE INTO clock (node, seq, compacted) VALUES (?, ?, ?)", (node, seq, entry[1])
+        )
+
+    # --- alterações locais ---
+
+    # Enfileira uma alteração deste nó (chamado na thread de quem a fez)
+    def _queue_change(self, kind, payload, version_key=None, deleted=False, ts=None):
+        if ts is None:
+            ts = self._next_ts(version_key)
+        self._local.put((kind, payload, version_key, deleted, ts))
+
+    def enrolled(self, name, encodings, image_path=None):
+        payload = {"name": name, "encodings": encode_matrix(encodings)}
+        if image_path:
+            payload["image_path"] = image_path
+        self._queue_change("enroll", payload, ("user", name))
+
+    def removed(self, name):
+        self._queue_change("remove", {"name": name}, ("user", name), deleted=True)
+
+    def card_changed(self, name, uid):
+        self._queue_change("card", {"name": name, "uid": uid}, ("card", name), deleted=uid is None)
+
+    def accessed(self, ts, name, action, uid, detail):
+        self._queue_change("access", {"name": name, "action": action, "uid": uid, "detail": detail, "ts": ts})
+
+    # Thread de registro: grava as alterações enfileiradas no log, em lote
+    def _run_log(self):
+        running = True
+        while running:
+            batch = [self._local.get()]
+            while batch[-1] is not None:
+                try:
+                    batch.append(self._local.get_nowait())
+                except queue.Empty:
+                    break
+            changes = [c for c in batch if c is not None]
+            running = len(changes) == len(batch)
+            try:
+                self._log(changes)
+            except Exception as e:
+                self._report(f"[ERRO] Falha ao registrar alterações para a replicação: {e}")
+            for _ in batch:
+                self._local.task_done()
+
+    def _log(self, changes):
+        if not changes:
+            return
+        with self._lock, self._conn:
+            for kind, payload, version_key, deleted, ts in changes:
+                image_path = payload.pop("image_path", None)
+                if image_path and os.path.exists(image_path):
+                    with open(image_path, "rb") as f:
+                        payload["image"] = base64.b64encode(f.read()).decode("ascii")
+                seq = self._clock.get(self.node, [0, 0])[0] + 1
+                self._store_change(self.node, seq, ts, kind, payload)
+                if version_key is None:
+                    continue
+                if (ts, self.node) >= self._versions.get(version_key, (_NO_VERSION, False))[0]:
+                    self._set_version(version_key[0], version_key[1], (ts, self.node), deleted)
+                with self._ts_lock:
+                    if self._pending_versions.get(version_key) == (ts, self.node):
+                        del self._pending_versions[version_key]
+
+    # Espera até que as alterações locais enfileiradas estejam no log
+    def flush(self):
+        self._local.join()
+
+    # --- aplicação de alterações de outros nós ---
+
+    def _notify(self, kind, name):
+        self.applied += 1
+        if self.on_applied:
+            self.on_applied(kind, name)
+
+    def _apply_user(self, name, encodings, version, deleted, image=None):
+        check_name(name)
+        if tuple(version) <= self._version("user", name):
+            return
+        if self.gallery.remove(name):
+            remove_known_face(name)
+        img_path = os.path.join(faces_dir, name)
+        if deleted:
+            if os.path.exists(img_path):
+                os.remove(img_path)
+        else:
+            encodings = decode_matrix(encodings)
+            self.gallery.extend([name] * len(encodings), encodings)
+            append_known_faces([name] * len(encodings), encodings)
+            if image:
+                os.makedirs(faces_dir, exist_ok=True)
+                with open(img_path, "wb") as f:
+                    f.write(base64.b64decode(image))
+        if isinstance(self.gallery, FaceGallery):
+            save_face_index(self.gallery)
+        self._set_version("user", name, version, deleted)
+        self._notify("remove" if deleted else "enroll", name)
+
+    def _apply_card(self, name, uid, version):
+        check_name(name)
+        version = tuple(version)
+        if version <= self._version("card", name):
+            return
+        if uid is None:
+            self.cards.unbind(name, notify=False)
+        else:
+            owner = self.cards.owner_of(uid)
+            if owner is not None and owner != name:
+                # o mesmo cartão associado a duas pessoas: vence a associação mais recente
+                self.conflicts += 1
+                if version <= self._version("card", owner):
+                    return
+                self.cards.unbind(owner, notify=False)
+                self._set_version("card", owner, version, True)
+            self.cards.bind(name, uid, notify=False)
+        self._set_version("card", name, version, uid is None)
+        self._notify("card", name)
+
+    def _apply_access(self, name, action, uid, detail, ts):
+        check_name(name)
+        if self.access_log is None:
+            return
+        status = STATUS_BY_ACTION.get(action)
+        last = self.access_log.last_access(name)
+        if status is not None and last is not None and ts < last and self.access_log.status(name) != status:
+            self.conflicts += 1
+        self.access_log.record(name, action, uid, detail, ts=ts, notify=False)
+        self._notify("access", name)
+
+    def _apply(self, change):
+        p, version = change["payload"], (change["ts"], change["node"])
+        kind = change["kind"]
+        if kind == "enroll":
+            self._apply_user(p["name"], p["encodings"], version, False, p.get("image"))
+        elif kind == "remove":
+            self._apply_user(p["name"], None, version, True)
+        elif kind == "card":
+            self._apply_card(p["name"], p["uid"], version)
+        elif kind == "access":
+            self._apply_access(p["name"], p["action"], p["uid"], p["detail"], p["ts"])
+
+    # Aplica alterações recebidas, na ordem de cada nó de origem; as que já
+    # foram vistas são ignoradas e uma falha não trava a replicação
+    def apply_changes(self, changes):
+        count = 0
+        for change in changes:
+            with self._lock, self._conn:
+                node, seq = change["node"], change["seq"]
+                current = self._clock.get(node, [0, 0])[0]
+                if seq != current + 1:
+                    continue
+                try:
+                    self._apply(change)
+                except Exception as e:
+                    self._report(f"[ERRO] Falha ao aplicar alteração {node}/{seq} ({change['kind']}): {e}")
+                self._see_ts(change["ts"])
+                self._store_change(node, seq, change["ts"], change["kind"], change["payload"])
+                count += 1
+        return count
+
+    # --- lado que serve os pares ---
+
+    # Alterações que o par (com o relógio `clock`) ainda não tem, ou None
+    # se ele está atrás do que o log ainda guarda ou não conhece este nó
+    # (precisa de um retrato)
+    def changes_since(self, clock, limit=PULL_LIMIT):
+        with self._lock:
+            if self.node not in clock:
+                return None, False
+            changes = []
+            for node, (seq, compacted) in self._clock.items():
+                since = clock.get(node, 0)
+                if since >= seq:
+                    continue
+                if since < compacted:
+                    return None, False
+                rows = self._conn.execute(
+                    "SELECT seq, ts, kind, payload FROM changes WHERE node = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (node, since, limit - len(changes)),
+                ).fetchall()
+                changes.extend(
+                    {"node": node, "seq": s, "ts": ts, "kind": kind, "payload": json.loads(payload)}
+                    for s, ts, kind, payload in rows
+                )
+                if len(changes) >= limit:
+                    return changes, True
+            return changes, False
+
+    # Estado completo deste nó: usuários (com as codificações), remoções,
+    # cartões e status, cada um com a sua versão, mais o relógio
+    def snapshot(self):
+        with self._lock, self.gallery.lock:
+            matrix = self.gallery.encodings
+            users = {
+                name: {"encodings": encode_matrix(matrix[self.gallery.rows_of(name)]),
+                       "version": self._version("user", name)}
+                for name in self.gallery.unique_names()
+            }
+            cards = {name: {"uid": uid, "version": self._version("card", name)} for name, uid in self.cards.items()}
+            removed = {"user": {}, "card": {}}
+            for (kind, key), (version, deleted) in self._versions.items():
+                if deleted:
+                    removed[kind][key] = version
+            states = self.access_log.states() if self.access_log is not None else {}
+            return {
+                "node": self.node,
+                "clock": self.clock(),
+                "users": users,
+                "cards": cards,
+                "removed_users": removed["user"],
+                "removed_cards": removed["card"],
+                "status": {name: list(state) for name, state in states.items()},
+            }
+
+    # Junta um retrato ao estado local (vence a versão mais recente de cada
+    # registro; o que só existe aqui é mantido e será enviado aos pares)
+    def apply_snapshot(self, snapshot):
+        with self._lock, self._conn:
+            for name, entry in snapshot["users"].items():
+                self._apply_user(name, entry["encodings"], entry["version"], False)
+            for name, version in snapshot["removed_users"].items():
+                self._apply_user(name, None, version, True)
+            for name, entry in snapshot["cards"].items():
+                self._apply_card(name, entry["uid"], entry["version"])
+            for name, version in snapshot["removed_cards"].items():
+                self._apply_card(name, None, version)
+            if self.access_log is not None:
+                for name, (status, ts) in snapshot["status"].items():
+                    self.access_log.merge_state(name, status, ts)
+            # sem o log anterior a este ponto: pares mais atrasados também
+            # precisarão de um retrato
+            for node, seq in snapshot["clock"].items():
+                entry = self._clock.get(node)
+                if entry is None or seq > entry[0]:
+                    self._clock[node] = [seq, seq]
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO clock (node, seq, compacted) VALUES (?, ?, ?)", (node, seq, seq)
+                    )
+            self.snapshots += 1
+
+    # Descarta do log o que passou da retenção (por nó de origem)
+    def compact(self):
+        with self._lock, self._conn:
+            for node, entry in self._clock.items():
+                cutoff = entry[0] - self.retention
+                if cutoff > entry[1]:
+                    self._conn.execute("DELETE FROM changes WHERE node = ? AND seq <= ?", (node, cutoff))
+                    entry[1] = cutoff
+                    self._conn.execute("UPDATE clock SET compacted = ? WHERE node = ?", (cutoff, node))
+
+    # --- sincronização com os pares ---
+
+    def sync_with(self, client):
+        while True:
+            reply = client.call("pull", clock=self.clock(), limit=PULL_LIMIT)
+            if "snapshot" in reply:
+                self.apply_snapshot(reply["snapshot"])
+                continue
+            self.apply_changes(reply["changes"])
+            if not reply["more"]:
+                return
+
+    def start(self, peers, secret, interval=SYNC_INTERVAL):
+        if self._thread is not None:
+            return
+        clients = [(f"{host}:{port}", PeerClient(host, port, secret)) for host, port in peers]
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(clients, interval), daemon=True)
+        self._thread.start()
+
+    def _run(self, clients, interval):
+        while not self._stop_event.is_set():
+            for address, client in clients:
+                try:
+                    self.sync_with(client)
+                    online = True
+                except (OSError, RuntimeError, ValueError, PermissionError) as e:
+                    client.close()
+                    online = False
+                    if self.peer_online.get(address, True):
+                        self._report(f"[AVISO] Par de replicação {address} indisponível: {e}")
+                if online and not self.peer_online.get(address, False):
+                    self._report(f"Replicação: sincronizado com {address}")
+                self.peer_online[address] = online
+            self.compact()
+            self._stop_event.wait(interval)
+        for _, client in clients:
+            client.close()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._logger.is_alive():
+            self._local.put(None)
+            self._logger.join(timeout=5)
+
+    def stats(self):
+        return {
+            "no": self.node,
+            "relogio": self.clock(),
+            "aplicadas": self.applied,
+            "conflitos": self.conflicts,
+            "retratos": self.snapshots,
+        }
+
+
+# Cliente de um par: assina os pedidos e confere a assinatura das respostas
+class PeerClient(RecognitionClient):
+    def __init__(self, host, port, secret, timeout=30.0):
+        super().__init__(host, port, timeout, secret)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = read_message(self.rfile)
+            except ValueError:
+                send_message(self.wfile, {"ok": False, "error": "Mensagem inválida."})
+                continue
+            if message is None:
+                return
+            try:
+                reply = self.server.handle_message(message)
+                reply["ok"] = True
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            reply["id"] = message.get("id")
+            send_message(self.wfile, reply)
+
+
+# Atende os pares (mesmo protocolo de linhas JSON do serviço de
+# reconhecimento); `extra` trata operações adicionais (ex.: nó de teste).
+# Por padrão só escuta em 127.0.0.1; entre máquinas, informe o endereço da
+# rede dos quiosques. Mensagens sem a assinatura do segredo são recusadas.
+class ReplicationServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, replica, secret, host="127.0.0.1", port=DEFAULT_REPLICATION_PORT, extra=None):
+        if not secret:
+            raise ValueError(f"A replicação exige um segredo compartilhado ({SECRET_ENV}).")
+        super().__init__((host, port), _Handler)
+        self.replica = replica
+        self.secret = secret
+        self.extra = extra
+        self.replay_guard = ReplayGuard()
+
+    def handle_message(self, message):
+        verify(self.secret, message, self.replay_guard)
+        return sign(self.secret, self._dispatch(message))
+
+    def _dispatch(self, message):
+        op = message.get("op")
+        if op == "pull":
+            changes, more = self.replica.changes_since(message.get("clock", {}), message.get("limit", PULL_LIMIT))
+            if changes is None:
+                return {"snapshot": self.replica.snapshot()}
+            return {"changes": changes, "more": more}
+        if op == "ping":
+            return {"node": self.replica.node}
+        if self.extra is not None:
+            return self.extra(message)
+        raise ValueError(f"Operação desconhecida: {op}")
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+# --- nó sem interface, para testes com vários nós na mesma máquina ---
+
+# Operações de teste do nó: cadastro, remoção, cartão, acesso e estado
+class HeadlessNode:
+    def __init__(self, host, port, peers, secret, retention=LOG_RETENTION, interval=SYNC_INTERVAL):
+        self.gallery = FaceGallery(*load_known_faces())
+        self.access_log = AccessLog(os.path.join(faces_dir, "access_log.db"), flush_interval=0.05)
+        self.replica = Replica(self.gallery, card_registry, self.access_log, retention=retention)
+        self.server = ReplicationServer(self.replica, secret, host, port, extra=self.handle)
+        self.peers = peers
+        self.secret = secret
+        self.interval = interval
+
+    def run(self):
+        self.server.start()
+        self.replica.start(self.peers, self.secret, self.interval)
+        try:
+            self._stopped = threading.Event()
+            self._stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.replica.stop()
+            self.server.shutdown()
+            self.access_log.close()
+
+    def handle(self, message):
+        op = message["op"]
+        name = message.get("name")
+        if name is not None:
+            check_name(name)
+        if op == "enroll":
+            encodings = decode_matrix(message["encodings"])
+            if self.gallery.remove(name):
+                remove_known_face(name)
+            self.gallery.extend([name] * len(encodings), encodings)
+            append_known_faces([name] * len(encodings), encodings)
+            self.replica.enrolled(name, encodings)
+            return {}
+        if op == "remove":
+            if self.gallery.remove(name):
+                remove_known_face(name)
+                card_registry.unbind(name)
+                self.replica.removed(name)
+            return {}
+        if op == "card":
+            card_registry.bind(name, message["uid"])
+            return {}
+        if op == "access":
+            self.access_log.record(name, message["action"], message.get("uid"), ts=message.get("ts"))
+            return {}
+        if op == "state":
+            return {
+                "users": sorted(self.gallery.unique_names()),
+                "cards": dict(card_registry.items()),
+                "status": {n: s for n, (s, _) in self.access_log.states().items()},
+                "stats": self.replica.stats(),
+            }
+        raise ValueError(f"Operação desconhecida: {op}")
+
+
+def _spawn(workdir, index, base_port, peers, retention, interval, secret):
+    node_dir = os.path.join(workdir, f"no{index}")
+    os.makedirs(node_dir, exist_ok=True)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    env[SECRET_ENV] = secret
+    args = [sys.executable, "-m", "src.replication", "no", "--porta", str(base_port + index),
+            "--retencao", str(retention), "--intervalo", str(interval), "--pares"]
+    args += [f"127.0.0.1:{base_port + p}" for p in peers]
+    return subprocess.Popen(args, cwd=node_dir, env=env)
+
+
+def _wait_online(clients, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    for client in clients:
+        while True:
+            try:
+                client.call("ping")
+                break
+            except (OSError, RuntimeError):
+                client.close()
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+
+def _converged(clients, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        states = [client.call("state") for client in clients]
+        views = [(s["users"], s["cards"], s["status"]) for s in states]
+        if all(v == views[0] for v in views) or time.monotonic() > deadline:
+            return all(v == views[0] for v in views), states
+        time.sleep(0.3)
+
+
+# Sobe vários nós em processos separados (cada um com a sua pasta faces/),
+# faz alterações em nós diferentes — incluindo entradas simultâneas da mesma
+# pessoa em duas portas e um nó novo que só alcança os demais por retrato —
+# e confere se todos convergem para o mesmo estado
+def demo(nodes=3, base_port=5301, retention=5, interval=0.3):
+    workdir = tempfile.mkdtemp(prefix="pfr_repl_")
+    secret = secrets.token_hex(16)
+    procs = []
+    clients = []
+    try:
+        for i in range(nodes):
+            procs.append(_spawn(workdir, i, base_port, [p for p in range(nodes) if p != i], retention, interval, secret))
+        clients = [PeerClient("127.0.0.1", base_port + i, secret) for i in range(nodes)]
+        _wait_online(clients)
+        rng = np.random.default_rng(0)
+        users = [f"usuario{i}.png" for i in range(6)]
+        for i, name in enumerate(users):
+            clients[i % nodes].call("enroll", name=name, encodings=encode_matrix(rng.normal(0, 0.1, (3, 128))))
+            clients[(i + 1) % nodes].call("card", name=name, uid=f"{0xA0B0C000 + i:08X}")
+        ok, _ = _converged(clients, 15.0)
+        now = time.time()
+        # a mesma pessoa entra por duas portas quase ao mesmo tempo e sai por uma terceira
+        clients[0].call("access", name=users[0], action="ENTRADA", ts=now)
+        clients[1 % nodes].call("access", name=users[0], action="ENTRADA", ts=now + 0.01)
+        clients[2 % nodes].call("access", name=users[0], action="SAÍDA", ts=now + 0.02)
+        clients[1 % nodes].call("remove", name=users[5])
+        for k in range(3 * retention):
+            clients[0].call("access", name=users[1], action="ENTRADA" if k % 2 == 0 else "SAÍDA")
+        converged, states = _converged(clients, 15.0)
+        ok = ok and converged and len(states[0]["users"]) == len(users) - 1
+        ok = ok and states[0]["status"] == {users[0]: "fora", users[1]: "dentro"}
+        print(f"{nodes} nós convergiram: {'sim' if ok else 'NÃO'}; {len(states[0]['users'])} usuários, "
+              f"{len(states[0]['cards'])} cartões, status {states[0]['status']}")
+        # nó novo: o log dos outros já foi compactado, então chega por retrato
+        procs.append(_spawn(workdir, nodes, base_port, list(range(nodes)), retention, interval, secret))
+        clients.append(PeerClient("127.0.0.1", base_port + nodes, secret))
+        _wait_online(clients[-1:])
+        late_ok, states = _converged(clients, 15.0)
+        print(f"Nó novo alcançou os demais: {'sim' if late_ok else 'NÃO'} "
+              f"(retratos recebidos: {states[-1]['stats']['retratos']})")
+        for state in states:
+            stats = state["stats"]
+            print(f"  nó {stats['no']}: aplicadas {stats['aplicadas']}, conflitos {stats['conflitos']}, "
+                  f"retratos {stats['retratos']}")
+        return 0 if ok and late_ok else 1
+    finally:
+        for client in clients:
+            client.close()
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replicação de galeria, cartões e acessos entre quiosques.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    node = sub.add_parser("no", help="nó sem interface (usa a pasta faces/ do diretório atual)")
+    node.add_argument("--endereco", default="127.0.0.1", help="endereço em que o nó escuta")
+    node.add_argument("--porta", type=int, default=DEFAULT_REPLICATION_PORT)
+    node.add_argument("--segredo", default=os.environ.get(SECRET_ENV),
+                      help=f"segredo compartilhado entre os nós (padrão: variável {SECRET_ENV})")
+    node.add_argument("--pares", nargs="*", default=[], metavar="HOST:PORTA")
+    node.add_argument("--retencao", type=int, default=LOG_RETENTION)
+    node.add_argument("--intervalo", type=float, default=SYNC_INTERVAL)
+    test = sub.add_parser("demo", help="sobe vários nós nesta máquina e confere a convergência")
+    test.add_argument("--nos", type=int, default=3)
+    test.add_argument("--porta-base", type=int, default=5301)
+    args = parser.parse_args(argv)
+
+    if args.comando == "demo":
+        return demo(args.nos, args.porta_base)
+    if not args.segredo:
+        parser.error(f"informe o segredo compartilhado (--segredo ou {SECRET_ENV})")
+    peers = [parse_peer(p) for p in args.pares]
+    HeadlessNode(args.endereco, args.porta, peers, args.segredo, args.retencao, args.intervalo).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
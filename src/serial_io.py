@@ -0,0 +1,161 @@
+import re, threading
+
+from .arduino import conectar_arduino
+
+
+# --- Eventos recebidos do Arduino (protocolo de linhas do index.ino) ---
+class SerialEvent:
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.raw!r})"
+
+
+# Cartão RFID aproximado do leitor
+class CardEvent(SerialEvent):
+    def __init__(self, raw, uid):
+        super().__init__(raw)
+        self.uid = uid
+
+
+# "[DEBUG] Porta aberta" / "[DEBUG] Porta fechada"
+class DoorEvent(SerialEvent):
+    def __init__(self, raw, aberta):
+        super().__init__(raw)
+        self.aberta = aberta
+
+
+# Qualquer outra linha de depuração do Arduino
+class DebugEvent(SerialEvent):
+    def __init__(self, raw, text):
+        super().__init__(raw)
+        self.text = text
+
+
+# Conexão com o hardware estabelecida ou perdida
+class ConnectionEvent(SerialEvent):
+    def __init__(self, conectado, porta=None):
+        super().__init__("")
+        self.conectado = conectado
+        self.porta = porta
+
+
+UID_PATTERN = re.compile(r"^[0-9A-Fa-f]{2}(?:[:\-\. ]?[0-9A-Fa-f]{2}){3,9}$")
+
+
+def parse_line(line):
+    if line.startswith("[DEBUG]"):
+        text = line[len("[DEBUG]"):].strip()
+        if text == "Porta aberta":
+            return DoorEvent(line, True)
+        if text == "Porta fechada":
+            return DoorEvent(line, False)
+        return DebugEvent(line, text)
+    if UID_PATTERN.match(line):
+        return CardEvent(line, line)
+    return DebugEvent(line, line)
+
+
+# Leitura da serial em uma thread dedicada: cada linha vira um evento tipado
+# entregue aos inscritos; a reconexão também acontece nessa thread, então a
+# interface nunca fica bloqueada esperando o Arduino.
+class SerialLink:
+    def __init__(self, connect=conectar_arduino, retry_interval=5.0):
+        self._connect = connect
+        self.retry_interval = retry_interval
+        self._serial = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def connected(self):
+        return self._serial is not None
+
+    # Inscreve `callback` para eventos do tipo `event_type` (ou subclasses).
+    # O callback roda na thread de leitura; retorna uma função para cancelar.
+    def subscribe(self, event_type, callback):
+        entry = (event_type, callback)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    def _publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event_type, callback in subscribers:
+            if isinstance(event, event_type):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print("[ERRO] Falha ao tratar evento serial:", e)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=3)
+            self._thread = None
+        self._disconnect(notify=False)
+
+    # Envia um comando ao Arduino; retorna False se não houver conexão
+    def write(self, data):
+        with self._write_lock:
+            port = self._serial
+            if port is None:
+                return False
+            try:
+                port.write(data)
+                return True
+            except Exception:
+                pass
+        self._disconnect()
+        return False
+
+    def _disconnect(self, notify=True):
+        port, self._serial = self._serial, None
+        if port is None:
+            return
+        try:
+            port.close()
+        except Exception:
+            pass
+        if notify:
+            self._publish(ConnectionEvent(False))
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            if self._serial is None:
+                port = self._connect()
+                if port is None:
+                    self._stop_event.wait(self.retry_interval)
+                    continue
+                try:
+                    port.reset_input_buffer()
+                except Exception:
+                    pass
+                self._serial = port
+                self._publish(ConnectionEvent(True, getattr(port, "port", None)))
+                continue
+            try:
+                raw = self._serial.readline()
+            except Exception:
+                self._disconnect()
+                continue
+            line = raw.decode(errors="ignore").strip()
+            if line:
+                self._publish(parse_line(line))
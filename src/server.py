@@ -0,0 +1,229 @@
+import os, sys, time, queue, argparse, threading, socketserver
+from concurrent.futures import Future
+import cv2, numpy as np
+
+from .gallery import FaceGallery
+from .quantized import QuantizedGallery, QUANTIZATION_MODES
+from .client import (
+    DEFAULT_HOST, DEFAULT_PORT, SECRET_ENV, ReplayGuard, send_message, read_message, decode_image, sign, verify,
+    is_loopback
+)
+from .utils import (
+    check_name, faces_dir, load_known_faces, remove_known_face,
+    append_known_faces, get_face_encoding, load_face_index, save_face_index
+)
+from .enrollment import select_templates
+
+
+# Junta consultas de vários quiosques que chegam dentro de uma pequena janela
+# e compara todas contra a galeria com uma única operação de matriz
+class BatchMatcher:
+    def __init__(self, gallery, tolerance=0.5, window=0.005, max_batch=64):
+        self.gallery = gallery
+        self.tolerance = tolerance
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def match(self, encoding, tolerance=None):
+        future = Future()
+        self._queue.put((np.asarray(encoding, dtype=np.float32), tolerance, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            tolerance = max(t if t is not None else self.tolerance for _, t, _ in batch)
+            try:
+                results = self.gallery.match_batch(np.stack([e for e, _, _ in batch]), tolerance)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.requests += len(batch)
+            self.batches += 1
+            for (_, t, future), result in zip(batch, results):
+                # consultas com tolerância menor que a do lote são filtradas aqui
+                if result is not None and t is not None and result.distance > t:
+                    result = None
+                future.set_result(result)
+
+
+# Serviço sem interface: carrega a galeria uma vez e atende identify/enroll/remove.
+# Com `quantization` ("int8"/"float16") a galeria em memória é a compacta
+# (QuantizedGallery), sem o índice aproximado; o arquivo em disco não muda.
+class RecognitionService:
+    def __init__(self, tolerance=0.5, window=0.005, quantization=None):
+        if quantization:
+            self.gallery = QuantizedGallery(*load_known_faces(), mode=quantization)
+        else:
+            self.gallery = FaceGallery(*load_known_faces())
+            load_face_index(self.gallery)
+        self.matcher = BatchMatcher(self.gallery, tolerance, window)
+        self._write_lock = threading.Lock()
+
+    def _encoding_from(self, message):
+        if message.get("encoding") is not None:
+            return np.asarray(message["encoding"], dtype=np.float32), None
+        frame = decode_image(message["image"])
+        if frame is None:
+            raise ValueError("Imagem inválida.")
+        return get_face_encoding(frame), frame
+
+    def identify(self, message):
+        encoding, _ = self._encoding_from(message)
+        if encoding is None:
+            return {"face": False, "match": None}
+        match = self.matcher.match(encoding, message.get("tolerance"))
+        return {"face": True, "match": match._asdict() if match else None}
+
+    # Rajada de imagens do cadastro -> (modelos, frame mais nítido aproveitado)
+    def _templates_from(self, message):
+        frames = [decode_image(data) for data in message["images"]]
+        frames = [f for f in frames if f is not None]
+        templates, best = select_templates([cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in frames])
+        return templates, frames[best] if templates else None
+
+    # Nome do usuário na galeria (nome do arquivo da foto, com .png)
+    @staticmethod
+    def _user_name(message):
+        name = check_name(message.get("name")).strip()
+        if not name.lower().endswith(".png"):
+            name += ".png"
+        return name
+
+    def enroll(self, message):
+        name = self._user_name(message)
+        if message.get("images"):
+            templates, frame = self._templates_from(message)
+        else:
+            encoding, frame = self._encoding_from(message)
+            templates = [encoding] if encoding is not None else []
+        if not templates:
+            return {"face": False}
+        with self._write_lock:
+            if frame is not None:
+                cv2.imwrite(os.path.join(faces_dir, name), frame)
+            if self.gallery.remove(name):
+                remove_known_face(name)
+            self.gallery.extend([name] * len(templates), templates)
+            append_known_faces([name] * len(templates), templates)
+            self._save_index()
+        return {"face": True, "name": name, "templates": len(templates)}
+
+    def remove(self, message):
+        name = self._user_name(message)
+        with self._write_lock:
+            removed = self.gallery.remove(name)
+            if removed:
+                remove_known_face(name)
+                self._save_index()
+                img_path = os.path.join(faces_dir, name)
+                if os.path.exists(img_path):
+                    os.remove(img_path)
+        return {"removed": bool(removed)}
+
+    def _save_index(self):
+        if isinstance(self.gallery, FaceGallery):
+            save_face_index(self.gallery)
+
+    def handle(self, message):
+        op = message.get("op")
+        if op == "identify":
+            return self.identify(message)
+        if op == "enroll":
+            return self.enroll(message)
+        if op == "remove":
+            return self.remove(message)
+        if op == "names":
+            return {"names": self.gallery.unique_names()}
+        if op == "stats":
+            return {"stats": {
+                "rostos": len(self.gallery),
+                "consultas": self.matcher.requests,
+                "lotes": self.matcher.batches,
+            }}
+        if op == "ping":
+            return {}
+        raise ValueError(f"Operação desconhecida: {op}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = read_message(self.rfile)
+            except ValueError:
+                send_message(self.wfile, {"ok": False, "error": "Mensagem inválida."})
+                continue
+            if message is None:
+                return
+            try:
+                if self.server.secret:
+                    verify(self.server.secret, message, self.server.replay_guard)
+                reply = self.server.service.handle(message)
+                if self.server.secret:
+                    sign(self.server.secret, reply)
+                reply["ok"] = True
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            reply["id"] = message.get("id")
+            send_message(self.wfile, reply)
+
+
+# Sem segredo o serviço só aceita escutar na própria máquina; com segredo,
+# pedidos sem a assinatura dele são recusados
+class RecognitionServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, service, host=DEFAULT_HOST, port=DEFAULT_PORT, secret=None):
+        if not secret and not is_loopback(host):
+            raise ValueError(f"Para escutar em {host} o serviço exige um segredo ({SECRET_ENV}).")
+        super().__init__((host, port), _Handler)
+        self.service = service
+        self.secret = secret
+        self.replay_guard = ReplayGuard()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço de reconhecimento facial sem interface gráfica.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="endereço de escuta (padrão: apenas local)")
+    parser.add_argument("--porta", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--segredo", default=os.environ.get(SECRET_ENV),
+                        help=f"segredo dos clientes; obrigatório fora de 127.0.0.1 (padrão: variável {SECRET_ENV})")
+    parser.add_argument("--tolerancia", type=float, default=0.5)
+    parser.add_argument("--janela-ms", type=float, default=5.0, help="janela para agrupar consultas simultâneas")
+    parser.add_argument("--quantizacao", choices=QUANTIZATION_MODES,
+                        help="mantém a galeria quantizada na memória (galerias muito grandes)")
+    args = parser.parse_args(argv)
+    if not args.segredo and not is_loopback(args.host):
+        parser.error(f"para escutar em {args.host} informe o segredo (--segredo ou {SECRET_ENV})")
+
+    service = RecognitionService(args.tolerancia, args.janela_ms / 1000.0, args.quantizacao)
+    server = RecognitionServer(service, args.host, args.porta, args.segredo)
+    print(f"Serviço de reconhecimento em {args.host}:{args.porta} ({len(service.gallery)} rostos)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
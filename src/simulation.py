@@ -0,0 +1,463 @@
+import os, sys, json, time, zlib, heapq, queue, random, shutil, argparse, tempfile, itertools, threading
+from collections import Counter, namedtuple
+import cv2, numpy as np
+
+from .gallery import FaceGallery
+from .cards import CardRegistry, normalize_uid
+from .access_log import AccessLog
+from .persistence import PersistenceWriter
+from .serial_io import SerialLink, CardEvent, DoorEvent
+from .frames import IMAGE_EXTENSIONS, open_source
+from .liveness import FrameHistory, liveness_ok
+from .access import verify_liveness, check_card
+from .utils import faces_dir, locate_and_encode, compare_faces
+
+# Tempos do index.ino (ms): som de confirmação (80 + 80 + 250) e LED
+# piscando 3x (3 * 2 * 200) antes de abrir; porta aberta por 3000 ms mais o
+# som de fechamento; delay(200) depois de cada leitura de cartão
+OPEN_DELAY_MS = 80 + 80 + 250 + 3 * 2 * 200
+DOOR_OPEN_MS = 3000 + 150
+CARD_READ_DELAY_MS = 200
+
+# Tempo que a pessoa leva para aproximar o cartão depois de reconhecida (s)
+CARD_DELAY = (0.5, 1.5)
+CARD_TIMEOUT = 10.0
+
+
+# Arduino simulado, com a interface do pyserial usada pelo SerialLink
+# (readline, write, reset_input_buffer, close) e o protocolo de linhas do
+# index.ino. Enquanto a porta está abrindo/aberta o laço do Arduino está
+# parado em delay(), então cartões e comandos só são atendidos depois.
+# `speed` acelera todos os tempos físicos (10 = dez vezes mais rápido).
+class FakeArduino:
+    def __init__(self, port="SIM0", speed=1.0, timeout=1.0):
+        self.port = port
+        self.speed = speed
+        self.timeout = timeout
+        self.commands = []
+        self._lines = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._rx = ""
+        self._busy_until = 0.0
+        self._closed = False
+        self._emit(time.monotonic(), "Arduino pronto para receber comandos...")
+
+    # Para SerialLink(connect=device.connect)
+    def connect(self):
+        with self._cond:
+            self._closed = False
+        return self
+
+    def _scale(self, ms):
+        return ms / 1000.0 / self.speed
+
+    def _emit(self, due, line):
+        with self._cond:
+            heapq.heappush(self._lines, (due, next(self._seq), line))
+            self._cond.notify_all()
+
+    # Cartão aproximado do leitor daqui a `delay` segundos (tempo real); o
+    # UID sai em hexadecimal maiúsculo, como no index.ino
+    def tap(self, uid, delay=0.0):
+        with self._cond:
+            at = max(time.monotonic() + delay, self._busy_until)
+            self._busy_until = at + self._scale(CARD_READ_DELAY_MS)
+            self._emit(at, normalize_uid(uid))
+
+    # Reproduz cartões gravados: [(segundos desde o início, uid), ...]
+    def replay(self, taps):
+        for t, uid in taps:
+            self.tap(uid, t / self.speed)
+
+    def write(self, data):
+        with self._cond:
+            if self._closed:
+                raise OSError("Porta serial simulada fechada.")
+            self._rx += data.decode(errors="ignore")
+            while "\n" in self._rx:
+                command, self._rx = self._rx.split("\n", 1)
+                command = command.strip()
+                self.commands.append(command)
+                self._handle(command)
+        return len(data)
+
+    def _handle(self, command):
+        at = max(time.monotonic(), self._busy_until)
+        if command == "OPEN":
+            self._emit(at, "[DEBUG] Comando OPEN recebido")
+            opened = at + self._scale(OPEN_DELAY_MS)
+            closed = opened + self._scale(DOOR_OPEN_MS)
+            self._emit(opened, "[DEBUG] Porta aberta")
+            self._emit(closed, "[DEBUG] Porta fechada")
+            self._busy_until = closed
+        elif command.startswith("LOG"):
+            self._emit(at, "Log recebido: " + command)
+        else:
+            self._emit(at, "[DEBUG] Comando desconhecido: " + command)
+
+    def readline(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                if self._lines and self._lines[0][0] <= now:
+                    return (heapq.heappop(self._lines)[2] + "\r\n").encode()
+                if now >= deadline:
+                    return b""
+                due = self._lines[0][0] if self._lines else deadline
+                self._cond.wait(min(due, deadline) - now)
+        return b""
+
+    # Descarta o que já chegou e não foi lido (como o buffer de entrada real)
+    def reset_input_buffer(self):
+        with self._cond:
+            now = time.monotonic()
+            self._lines = [entry for entry in self._lines if entry[0] > now]
+            heapq.heapify(self._lines)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+# Uma chegada do roteiro: instante (s, tempo simulado), usuário, foto usada
+# como frame da câmera e o cartão que a pessoa aproxima
+Arrival = namedtuple("Arrival", ["t", "name", "image", "uid"])
+
+# Resultado de uma chegada; os tempos em ms são reais
+Outcome = namedtuple("Outcome", ["arrival", "expected", "result", "latency_ms", "wait_ms", "recognition_ms"])
+
+
+# UID fixo por usuário (4 bytes, como os cartões MIFARE do leitor)
+def card_uid(name):
+    return f"{zlib.crc32(name.encode('utf-8')):08X}"
+
+
+# Chegadas de Poisson com `per_minute` pessoas por minuto; uma fração delas
+# aproxima o cartão de outra pessoa (o acesso deve ser negado)
+def generate_arrivals(users, count, per_minute, wrong_card=0.02, seed=0):
+    rng = random.Random(seed)
+    names = sorted(users)
+    arrivals, t = [], 0.0
+    for _ in range(count):
+        t += rng.expovariate(per_minute / 60.0)
+        name = rng.choice(names)
+        uid = card_uid(name)
+        if len(names) > 1 and rng.random() < wrong_card:
+            uid = card_uid(rng.choice([n for n in names if n != name]))
+        arrivals.append(Arrival(round(t, 3), name, users[name], uid))
+    return arrivals
+
+
+def save_arrivals(path, arrivals):
+    with open(path, "w", encoding="utf-8") as f:
+        for arrival in arrivals:
+            f.write(json.dumps(arrival._asdict(), ensure_ascii=False) + "\n")
+
+
+def load_arrivals(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [Arrival(**json.loads(line)) for line in f if line.strip()]
+
+
+# Cadastra as fotos de uma pasta numa galeria em memória (o nome do usuário
+# é o nome do arquivo). Retorna (galeria, {nome: caminho}, {nome: motivo}).
+def enroll_photos(folder):
+    gallery, users, failures = FaceGallery(), {}, {}
+    for fname in sorted(os.listdir(folder)):
+        if not fname.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(folder, fname)
+        image = cv2.imread(path)
+        if image is None:
+            failures[fname] = "ilegivel"
+            continue
+        _, encoding = locate_and_encode(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        if encoding is None:
+            failures[fname] = "sem_rosto"
+            continue
+        gallery.add(fname, encoding)
+        users[fname] = path
+    return gallery, users, failures
+
+
+# Porta simulada: Arduino falso + SerialLink de verdade, com os eventos
+# entregues numa fila para a thread que atende as chegadas
+class SimulatedDoor:
+    def __init__(self, index, speed):
+        self.device = FakeArduino(f"SIM{index}", speed)
+        self.link = SerialLink(connect=self.device.connect, retry_interval=0.1)
+        self.events = queue.Queue()
+        self.link.subscribe(CardEvent, self.events.put)
+        self.link.subscribe(DoorEvent, self.events.put)
+
+    def drain(self):
+        while True:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                return
+
+    def wait_for(self, predicate, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                event = self.events.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if predicate(event):
+                return event
+
+
+# Empurra um roteiro de chegadas por reconhecimento, prova de vida,
+# validação do cartão e gravação (diário de acessos e cadastro de cartões)
+# com as mesmas regras do App (src.access), mas sem interface. Cada chegada é
+# uma única foto, então a prova de vida só tem a pista de textura (sem
+# histórico de movimento); `liveness=False` a desliga para imagens
+# sintéticas. Cada porta atende uma pessoa por vez; a latência de ponta a
+# ponta vai da chegada até a porta abrir (ou a negação) e inclui a fila.
+class LoadDriver:
+    def __init__(self, gallery, cards, access_log, doors=1, speed=1.0, tolerance=0.5,
+                 card_delay=CARD_DELAY, card_timeout=CARD_TIMEOUT, seed=0, liveness=True):
+        self.gallery = gallery
+        self.cards = cards
+        self.access_log = access_log
+        self.speed = speed
+        self.tolerance = tolerance
+        self.liveness = liveness
+        self.card_delay = card_delay
+        self.card_timeout = card_timeout
+        self.doors = [SimulatedDoor(i, speed) for i in range(doors)]
+        self.outcomes = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._frames = {}
+
+    def _frame(self, path):
+        frame = self._frames.get(path)
+        if frame is None:
+            frame = self._frames[path] = cv2.imread(path)
+        return frame
+
+    def run(self, arrivals, progress=None):
+        for door in self.doors:
+            door.link.start()
+        pending = queue.Queue()
+        threads = [threading.Thread(target=self._serve, args=(door, pending), daemon=True) for door in self.doors]
+        for thread in threads:
+            thread.start()
+        start = time.monotonic()
+        try:
+            for i, arrival in enumerate(arrivals):
+                due = start + arrival.t / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                pending.put((arrival, due))
+                if progress and (i + 1) % 50 == 0:
+                    progress(f"{i + 1}/{len(arrivals)} chegadas")
+        finally:
+            for _ in threads:
+                pending.put(None)
+            for thread in threads:
+                thread.join()
+            for door in self.doors:
+                door.link.stop()
+        return self.outcomes
+
+    def _serve(self, door, pending):
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            arrival, due = item
+            try:
+                outcome = self._attend(door, arrival, due)
+            except Exception as e:
+                outcome = Outcome(arrival, self._expected(arrival), f"erro: {e}", None, None, None)
+            with self._lock:
+                self.outcomes.append(outcome)
+
+    def _expected(self, arrival):
+        return "liberado" if self.cards.uid_of(arrival.name) == normalize_uid(arrival.uid) else "negado"
+
+    def _attend(self, door, arrival, due):
+        started = time.monotonic()
+        elapsed = lambda: 1000 * (time.monotonic() - due)
+        expected = self._expected(arrival)
+        wait_ms = 1000 * (started - due)
+        rgb = cv2.cvtColor(self._frame(arrival.image), cv2.COLOR_BGR2RGB)
+        location, encoding = locate_and_encode(rgb)
+        match = compare_faces(self.gallery, encoding, tolerance=self.tolerance)
+        recognition_ms = 1000 * (time.monotonic() - started)
+        result = lambda name: Outcome(arrival, expected, name, elapsed(), wait_ms, recognition_ms)
+        if match is None:
+            return result("nao_reconhecido")
+        if match.name != arrival.name:
+            return result("identidade_errada")
+        if self.liveness:
+            history = FrameHistory()
+            history.push(rgb, rgb=True)
+            if not liveness_ok(verify_liveness(self.access_log, match.name, rgb, location, history)):
+                return result("prova_de_vida")
+        door.drain()
+        door.device.tap(arrival.uid, self._rng.uniform(*self.card_delay) / self.speed)
+        event = door.wait_for(lambda e: isinstance(e, CardEvent), self.card_timeout / self.speed)
+        if event is None:
+            return result("sem_cartao")
+        decision = check_card(self.cards, self.access_log, match.name, event.uid)
+        if decision.result != "liberado":
+            # sem cartão cadastrado o App ofereceria o cadastro; aqui todos têm cartão
+            return result("negado")
+        door.link.write(b"OPEN\n")
+        door_timeout = (OPEN_DELAY_MS + DOOR_OPEN_MS) / 1000.0 / self.speed + 2.0
+        if door.wait_for(lambda e: isinstance(e, DoorEvent) and e.aberta, door_timeout) is None:
+            return result("porta_sem_resposta")
+        outcome = result("liberado")
+        # a próxima pessoa só passa depois que a porta fecha
+        door.wait_for(lambda e: isinstance(e, DoorEvent) and not e.aberta, door_timeout)
+        return outcome
+
+
+def _percentiles(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return "sem dados"
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return f"p50 {p50:.0f} ms, p95 {p95:.0f} ms, p99 {p99:.0f} ms, máx {max(values):.0f} ms"
+
+
+# Resumo: contagem por resultado, divergências do esperado e percentis
+def format_report(outcomes, duration, flush_ms=None):
+    counts = Counter(o.result for o in outcomes)
+    failures = [o for o in outcomes if o.result != o.expected]
+    lines = [
+        f"{len(outcomes)} chegada(s) em {duration:.1f} s reais ({60 * len(outcomes) / max(duration, 1e-9):.0f}/min)",
+        "Resultados: " + ", ".join(f"{name}={n}" for name, n in sorted(counts.items())),
+        f"Falhas (resultado diferente do esperado): {len(failures)}",
+        "Ponta a ponta: " + _percentiles([o.latency_ms for o in outcomes]),
+        "Espera na fila: " + _percentiles([o.wait_ms for o in outcomes]),
+        "Reconhecimento: " + _percentiles([o.recognition_ms for o in outcomes]),
+    ]
+    if flush_ms is not None:
+        lines.append(f"Gravação pendente no fim: {flush_ms:.0f} ms")
+    for o in failures[:10]:
+        lines.append(f"  [FALHA] {os.path.splitext(o.arrival.name)[0]} em t={o.arrival.t:.1f} s: "
+                     f"esperado {o.expected}, obtido {o.result}")
+    return "\n".join(lines)
+
+
+# Grava uma sessão real para reprodução: frames da câmera numa pasta e os
+# cartões lidos pelo Arduino (com o instante de cada leitura) em cartoes.jsonl
+def record_session(folder, seconds, source=0, link=None):
+    frames_dir = os.path.join(folder, "frames")
+    os.makedirs(frames_dir, exist_ok=True)
+    start = time.monotonic()
+    cards_file = open(os.path.join(folder, "cartoes.jsonl"), "a", encoding="utf-8")
+    lock = threading.Lock()
+
+    def on_card(event):
+        with lock:
+            cards_file.write(json.dumps({"t": round(time.monotonic() - start, 3), "uid": normalize_uid(event.uid)}) + "\n")
+            cards_file.flush()
+
+    unsubscribe = link.subscribe(CardEvent, on_card) if link else None
+    cap = open_source(source)
+    count = 0
+    try:
+        while time.monotonic() - start < seconds:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            count += 1
+            cv2.imwrite(os.path.join(frames_dir, f"{count:06d}.jpg"), frame)
+    finally:
+        cap.release()
+        if unsubscribe:
+            unsubscribe()
+        cards_file.close()
+    return count
+
+
+def load_card_taps(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [(entry["t"], entry["uid"]) for entry in map(json.loads, filter(str.strip, f))]
+
+
+def run_load(args):
+    progress = lambda message: print(f"... {message}", file=sys.stderr)
+    gallery, users, failures = enroll_photos(args.fotos)
+    for fname, reason in failures.items():
+        print(f"[AVISO] {fname} ignorada: {reason}")
+    if not users:
+        print("[ERRO] Nenhuma foto utilizável em", args.fotos)
+        return 1
+    if args.roteiro and os.path.exists(args.roteiro):
+        arrivals = load_arrivals(args.roteiro)
+    else:
+        arrivals = generate_arrivals(users, args.chegadas, args.por_minuto, args.cartao_errado, args.semente)
+        if args.roteiro:
+            save_arrivals(args.roteiro, arrivals)
+    workdir = tempfile.mkdtemp(prefix="pfr_sim_")
+    writer = PersistenceWriter()
+    try:
+        cards = CardRegistry(os.path.join(workdir, "cards.pkl"), writer)
+        for name in users:
+            cards.bind(name, card_uid(name))
+        access_log = AccessLog(os.path.join(workdir, "access_log.db"))
+        driver = LoadDriver(gallery, cards, access_log, args.portas, args.velocidade, seed=args.semente,
+                            liveness=not args.sem_prova_de_vida)
+        progress(f"{len(users)} usuário(s), {len(arrivals)} chegada(s), {args.portas} porta(s), velocidade {args.velocidade}x")
+        started = time.monotonic()
+        outcomes = driver.run(arrivals, progress)
+        duration = time.monotonic() - started
+        t0 = time.monotonic()
+        access_log.close()
+        writer.close()
+        flush_ms = 1000 * (time.monotonic() - t0)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(format_report(outcomes, duration, flush_ms))
+    return 1 if any(o.result != o.expected for o in outcomes) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulação do fluxo de acesso sem câmera nem Arduino.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    carga = sub.add_parser("carga", help="chegadas simuladas: reconhecimento, cartão e gravação")
+    carga.add_argument("--fotos", default=faces_dir, help="pasta com uma foto por usuário (nome do arquivo = usuário)")
+    carga.add_argument("--chegadas", type=int, default=300)
+    carga.add_argument("--por-minuto", type=float, default=300.0, help="ritmo médio de chegadas (tempo simulado)")
+    carga.add_argument("--portas", type=int, default=1, help="quiosques atendendo em paralelo")
+    carga.add_argument("--velocidade", type=float, default=1.0,
+                       help="acelera os tempos físicos (Arduino, pessoas e chegadas)")
+    carga.add_argument("--cartao-errado", type=float, default=0.02, help="fração de chegadas com o cartão de outra pessoa")
+    carga.add_argument("--roteiro", help="arquivo JSONL de chegadas: reproduzido se existir, gravado caso contrário")
+    carga.add_argument("--semente", type=int, default=0)
+    carga.add_argument("--sem-prova-de-vida", action="store_true",
+                       help="não aplica a prova de vida (fotos sintéticas sem textura de rosto)")
+    gravar = sub.add_parser("gravar", help="grava frames da câmera e cartões lidos para reprodução")
+    gravar.add_argument("saida")
+    gravar.add_argument("--segundos", type=float, default=60.0)
+    gravar.add_argument("--camera", default="0")
+    args = parser.parse_args(argv)
+
+    if args.comando == "carga":
+        return run_load(args)
+    link = SerialLink()
+    link.start()
+    try:
+        count = record_session(args.saida, args.segundos, args.camera, link)
+    finally:
+        link.stop()
+    print(f"{count} frame(s) gravados em {os.path.join(args.saida, 'frames')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
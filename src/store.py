@@ -0,0 +1,287 @@
+import os, json, pickle, struct, threading
+from contextlib import contextmanager
+import numpy as np
+
+# Formato em disco da galeria:
+#   <base>.bin   -> cabeçalho fixo + matriz float32 (count, dim), uma linha por codificação
+#   <base>.names -> tabela de nomes em JSON lines; a primeira linha guarda a geração
+#                   e as seguintes registram inclusões ({"row", "name"}) e remoções
+#                   ({"row", "removed"}) das linhas da matriz
+MAGIC = b"PFRG"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII12x")
+HEADER_SIZE = HEADER.size
+_COUNT_OFFSET = 8
+
+# Compacta em segundo plano quando as linhas removidas passam desta fração
+COMPACT_RATIO = 0.25
+COMPACT_MIN_ROWS = 64
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+# Trava exclusiva entre processos (ex.: src.enroll_batch rodando com o App
+# aberto), num arquivo .lock ao lado da galeria
+@contextmanager
+def _file_lock(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "posix":
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if os.name == "posix":
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Armazenamento binário, versionado e mapeável em memória das codificações
+class EncodingStore:
+    def __init__(self, base_path, dim=128):
+        self.bin_path = base_path + ".bin"
+        self.names_path = base_path + ".names"
+        self.lock_path = base_path + ".lock"
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._row_names = []
+        self._removed = set()
+        self._generation = 0
+        self._names_size = 0
+        self._loaded = False
+        self._compactor = None
+        self.on_error = None
+
+    @property
+    def row_bytes(self):
+        return 4 * self.dim
+
+    def exists(self):
+        return os.path.exists(self.bin_path) and os.path.exists(self.names_path)
+
+    def _read_header(self, f):
+        raw = f.read(HEADER_SIZE)
+        if len(raw) < HEADER_SIZE:
+            raise ValueError("Cabeçalho da galeria incompleto.")
+        magic, version, dim, count, generation = HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ValueError("Arquivo de galeria inválido.")
+        if version > VERSION:
+            raise ValueError(f"Versão da galeria não suportada: {version}")
+        if dim != self.dim:
+            raise ValueError(f"Dimensão da galeria {dim} diferente da esperada {self.dim}")
+        # linhas cujo conteúdo não chegou inteiro ao disco são descartadas
+        size = os.fstat(f.fileno()).st_size
+        count = min(count, (size - HEADER_SIZE) // self.row_bytes)
+        return count, generation
+
+    # Conclui uma compactação interrompida entre as duas trocas de arquivo
+    def _recover(self):
+        bin_tmp, names_tmp = self.bin_path + ".tmp", self.names_path + ".tmp"
+        if os.path.exists(names_tmp) and os.path.exists(self.bin_path) and not os.path.exists(bin_tmp):
+            with open(self.bin_path, "rb") as f:
+                _, generation = self._read_header(f)
+            with open(names_tmp, "r", encoding="utf-8") as f:
+                first = json.loads(f.readline() or "{}")
+            if first.get("generation") == generation:
+                os.replace(names_tmp, self.names_path)
+        for tmp in (bin_tmp, names_tmp):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _read_names(self, count):
+        row_names = [None] * count
+        removed = set()
+        generation = None
+        with open(self.names_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        if content and not content.endswith("\n"):
+            # completa a linha truncada para que as próximas inclusões não se misturem a ela
+            with open(self.names_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+        for line in content.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # linha final truncada por uma queda durante a gravação
+                continue
+            if "generation" in entry:
+                generation = entry["generation"]
+                continue
+            row = entry.get("row", -1)
+            if not 0 <= row < count:
+                continue
+            if entry.get("removed"):
+                removed.add(row)
+            else:
+                row_names[row] = entry["name"]
+                removed.discard(row)
+        removed.update(i for i, n in enumerate(row_names) if n is None)
+        return row_names, removed, generation
+
+    # Carrega a galeria: retorna (matriz, nomes). Sem linhas removidas a matriz
+    # é um np.memmap copy-on-write do próprio arquivo, sem cópia na memória.
+    def load(self):
+        with self._lock, _file_lock(self.lock_path):
+            self._loaded = False
+            self._refresh()
+            row_names, removed, count = self._row_names, self._removed, len(self._row_names)
+            if not count:
+                return np.empty((0, self.dim), dtype=np.float32), []
+            matrix = np.memmap(self.bin_path, dtype=np.float32, mode="c",
+                               offset=HEADER_SIZE, shape=(count, self.dim))
+            if not removed:
+                return matrix, list(row_names)
+            live = [i for i in range(count) if i not in removed]
+            return np.array(matrix[live]), [row_names[i] for i in live]
+
+    # Relê o estado do disco se outro processo alterou os arquivos (cabeçalho,
+    # geração ou tamanho da tabela de nomes diferentes do último visto);
+    # deve ser chamado com a trava de arquivo
+    def _refresh(self):
+        if not self.exists():
+            self._row_names, self._removed, self._generation, self._names_size = [], set(), 0, 0
+            self._loaded = True
+            return
+        self._recover()
+        with open(self.bin_path, "rb") as f:
+            count, generation = self._read_header(f)
+        names_size = os.path.getsize(self.names_path)
+        if (self._loaded and generation == self._generation and count == len(self._row_names)
+                and names_size == self._names_size):
+            return
+        row_names, removed, names_generation = self._read_names(count)
+        if names_generation != generation:
+            raise ValueError("Tabela de nomes não corresponde ao arquivo da galeria.")
+        self._row_names, self._removed, self._generation = row_names, removed, generation
+        self._names_size = os.path.getsize(self.names_path)
+        self._loaded = True
+
+    # Acrescenta codificações ao final do arquivo (dados, nomes e por último o
+    # contador do cabeçalho, de modo que uma queda no meio não corrompe nada)
+    def extend(self, names, encodings):
+        names = list(names)
+        block = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if len(names) != len(block):
+            raise ValueError("Quantidade de nomes e codificações não confere.")
+        if not names:
+            return
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh()
+            if not self.exists():
+                self._write_full(block, names)
+                return
+            start = len(self._row_names)
+            with open(self.bin_path, "r+b") as f:
+                f.seek(HEADER_SIZE + start * self.row_bytes)
+                f.write(block.tobytes())
+                _fsync(f)
+                with open(self.names_path, "a", encoding="utf-8") as nf:
+                    for offset, name in enumerate(names):
+                        nf.write(json.dumps({"row": start + offset, "name": name}, ensure_ascii=False) + "\n")
+                    _fsync(nf)
+                f.seek(_COUNT_OFFSET)
+                f.write(struct.pack("<I", start + len(names)))
+                _fsync(f)
+            self._row_names.extend(names)
+            self._names_size = os.path.getsize(self.names_path)
+
+    def append(self, name, encoding):
+        self.extend([name], [encoding])
+
+    # Marca as linhas do usuário como removidas; a compactação é feita depois
+    def remove(self, name):
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh()
+            rows = [i for i, n in enumerate(self._row_names) if n == name and i not in self._removed]
+            if not rows:
+                return 0
+            with open(self.names_path, "a", encoding="utf-8") as nf:
+                for row in rows:
+                    nf.write(json.dumps({"row": row, "removed": True}) + "\n")
+                _fsync(nf)
+            self._names_size = os.path.getsize(self.names_path)
+            self._removed.update(rows)
+            if len(self._removed) >= COMPACT_MIN_ROWS and len(self._removed) > COMPACT_RATIO * len(self._row_names):
+                self.compact_async()
+            return len(rows)
+
+    # Regrava toda a galeria de forma atômica (arquivos temporários + rename)
+    def rewrite(self, encodings, names):
+        block = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh()
+            self._write_full(block, list(names))
+
+    def _write_full(self, block, names):
+        generation = self._generation + 1
+        bin_tmp, names_tmp = self.bin_path + ".tmp", self.names_path + ".tmp"
+        with open(bin_tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.dim, len(names), generation))
+            f.write(block.tobytes())
+            _fsync(f)
+        with open(names_tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"generation": generation, "version": VERSION}) + "\n")
+            for row, name in enumerate(names):
+                f.write(json.dumps({"row": row, "name": name}, ensure_ascii=False) + "\n")
+            _fsync(f)
+        os.replace(bin_tmp, self.bin_path)
+        os.replace(names_tmp, self.names_path)
+        self._row_names, self._removed, self._generation = list(names), set(), generation
+        self._names_size = os.path.getsize(self.names_path)
+        self._loaded = True
+
+    # Remove fisicamente as linhas marcadas como removidas
+    def compact(self):
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh()
+            if not self._removed:
+                return
+            live = [i for i in range(len(self._row_names)) if i not in self._removed]
+            with open(self.bin_path, "rb") as f:
+                matrix = np.fromfile(f, dtype=np.float32, count=len(self._row_names) * self.dim,
+                                     offset=HEADER_SIZE).reshape(-1, self.dim)
+            self._write_full(matrix[live], [self._row_names[i] for i in live])
+
+    def compact_async(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_safely, daemon=True)
+        self._compactor.start()
+
+    def _compact_safely(self):
+        try:
+            self.compact()
+        except Exception as e:
+            # ex.: no Windows o arquivo pode estar mapeado; tenta na próxima remoção
+            message = f"[ERRO] Falha ao compactar a galeria: {e}"
+            if self.on_error:
+                self.on_error(message)
+            else:
+                print(message)
+
+    # Migração única do antigo encodings.pkl para o formato binário
+    def migrate_from_pickle(self, pickle_path):
+        if self.exists() or not os.path.exists(pickle_path):
+            return False
+        with open(pickle_path, "rb") as f:
+            data = pickle.load(f)
+        encodings, names = [], []
+        for e, n in zip(data.get("encodings", []), data.get("names", [])):
+            arr = np.asarray(e, dtype=np.float32)
+            if arr.shape == (self.dim,):
+                encodings.append(arr)
+                names.append(n)
+        self.rewrite(np.array(encodings, dtype=np.float32).reshape(-1, self.dim), names)
+        os.replace(pickle_path, pickle_path + ".migrated")
+        return True
@@ -0,0 +1,146 @@
+import itertools, cv2, numpy as np
+
+from .utils import detect_faces, CONTINUOUS_DETECTION_SCALE
+
+
+# Interseção sobre união de duas caixas no formato (top, right, bottom, left)
+def iou(a, b):
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+# Rosto acompanhado entre frames, com a identidade decidida em cache
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.identity = None
+        self.encoded_at = None
+        self.misses = 0
+        self.reported = False
+        self.liveness_failed = False
+        self.liveness_retry_at = 0
+
+
+# Rastreador leve: a detecção HOG roda a cada `detect_every` frames e, entre
+# elas, as caixas são deslocadas por fluxo óptico (Lucas-Kanade) numa imagem
+# cinza reduzida. A codificação 128-d só é refeita a cada `encode_every`
+# frames por trilha ou quando uma trilha nova aparece.
+class FaceTracker:
+    def __init__(self, detect_every=5, encode_every=15, iou_threshold=0.3,
+                 max_misses=2, detection_scale=CONTINUOUS_DETECTION_SCALE):
+        self.detect_every = detect_every
+        self.encode_every = encode_every
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.detection_scale = min(detection_scale, 1.0)
+        self.tracks = []
+        self.frame_index = 0
+        self.detections = 0
+        self.encodings = 0
+        self._ids = itertools.count(1)
+        self._prev_gray = None
+        self._force_detect = True
+
+    def reset(self):
+        self.tracks = []
+        self._prev_gray = None
+        self._force_detect = True
+
+    # Atualiza as trilhas com um novo frame RGB e retorna as trilhas ativas
+    def update(self, rgb_frame):
+        self.frame_index += 1
+        s = self.detection_scale
+        small = rgb_frame if s >= 1.0 else cv2.resize(rgb_frame, (0, 0), fx=s, fy=s, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+        if self._force_detect or not self.tracks or self.frame_index % self.detect_every == 0:
+            self._detect(rgb_frame)
+        else:
+            self._propagate(gray, rgb_frame.shape)
+        self._prev_gray = gray
+        return list(self.tracks)
+
+    def _detect(self, rgb_frame):
+        self.detections += 1
+        self._force_detect = False
+        boxes = detect_faces(rgb_frame, self.detection_scale)
+        pairs = sorted(
+            ((iou(t.box, b), ti, bi) for ti, t in enumerate(self.tracks) for bi, b in enumerate(boxes)),
+            reverse=True,
+        )
+        used_tracks, used_boxes = set(), set()
+        for score, ti, bi in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti in used_tracks or bi in used_boxes:
+                continue
+            used_tracks.add(ti)
+            used_boxes.add(bi)
+            self.tracks[ti].box = boxes[bi]
+            self.tracks[ti].misses = 0
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        for bi, box in enumerate(boxes):
+            if bi not in used_boxes:
+                self.tracks.append(Track(next(self._ids), box))
+
+    def _propagate(self, gray, shape):
+        for track in self.tracks:
+            box = self._flow(track.box, gray, shape)
+            if box is None:
+                # trilha perdida: força uma nova detecção no próximo frame
+                track.misses += 1
+                self._force_detect = True
+            else:
+                track.box = box
+
+    def _flow(self, box, gray, shape):
+        if self._prev_gray is None:
+            return None
+        s = self.detection_scale
+        top, right, bottom, left = (int(v * s) for v in box)
+        roi = self._prev_gray[top:bottom, left:right]
+        if roi.size == 0:
+            return None
+        points = cv2.goodFeaturesToTrack(roi, maxCorners=30, qualityLevel=0.01, minDistance=3)
+        if points is None or len(points) < 5:
+            return None
+        points = points.astype(np.float32) + np.array([left, top], dtype=np.float32)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None)
+        ok = status.ravel() == 1
+        if ok.sum() < 5:
+            return None
+        dx, dy = np.median((moved[ok] - points[ok]).reshape(-1, 2), axis=0) / s
+        height, width = shape[:2]
+        top, right, bottom, left = box
+        if not (0 <= left + dx and right + dx <= width and 0 <= top + dy and bottom + dy <= height):
+            return None
+        return (round(top + dy), round(right + dx), round(bottom + dy), round(left + dx))
+
+    def needs_encoding(self, track):
+        return track.encoded_at is None or self.frame_index - track.encoded_at >= self.encode_every
+
+    def mark_encoded(self, track, identity):
+        old_name = track.identity.name if track.identity else None
+        if old_name != (identity.name if identity else None):
+            track.reported = False
+            track.liveness_failed = False
+            track.liveness_retry_at = 0
+        track.identity = identity
+        track.encoded_at = self.frame_index
+        self.encodings += 1
+
+    def stats(self):
+        return {
+            "frames": self.frame_index,
+            "deteccoes": self.detections,
+            "codificacoes": self.encodings,
+            "trilhas": len(self.tracks),
+        }
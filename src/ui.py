@@ -1,72 +1,80 @@
 # Importação dos módulos do PyQt5 para interface gráfica e widgets
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QHBoxLayout, QPushButton,
-    QFileDialog, QMessageBox, QInputDialog, QTextEdit, QListWidget,
-    QListWidgetItem, QLineEdit, QDialog, QDialogButtonBox
+    QFileDialog, QMessageBox, QInputDialog, QTextEdit, QListView,
+    QLineEdit, QDialog, QDialogButtonBox
 )
 from PyQt5.QtGui import QPixmap, QColor, QPainter
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
 
 # Importação de módulos padrão do Python
-import os, cv2, json, numpy as np
+import os, time, cv2, numpy as np
 from datetime import datetime
 
 # Importação de funções personalizadas do projeto
-from .arduino import conectar_arduino
 from .utils import (
-    load_known_faces, save_known_faces, get_face_encoding, compare_faces,
-    load_cards, save_cards, faces_dir
+    load_known_faces, append_known_faces, remove_known_face, locate_and_encode, compare_faces,
+    card_registry, normalize_uid, faces_dir, load_face_index, save_face_index, warm_up,
+    face_store, persistence, check_name
 )
-from .dialogs import CaptureDialog, aguardar_cartao_dialog
-
-# Definição de arquivos JSON para armazenar últimos acessos e status dos usuários
+from .dialogs import CaptureDialog, SerialBridge, aguardar_cartao_dialog
+from .serial_io import ConnectionEvent, DoorEvent, DebugEvent
+from .gallery import FaceGallery
+from .access_log import AccessLog, format_ts
+from .pipeline import RecognitionPipeline
+from .enrollment import ENROLL_BURST, select_templates, sharpest
+from .liveness import liveness_ok
+from .access import verify_liveness, check_card, register_card
+from .metrics import metrics, span, observe
+from .directory import UserListModel, ThumbnailCache, LIST_ICON_SIZE
+from .replication import Replica, ReplicationServer
+
+# Diário de acessos (SQLite) e arquivos JSON antigos, importados uma única vez
+ACCESS_LOG_FILE = os.path.join(faces_dir, "access_log.db")
 LAST_ACCESS_FILE = os.path.join(faces_dir, "last_access.json")
 STATUS_FILE = os.path.join(faces_dir, "status.json")
 
+# Trechos do fluxo de desbloqueio resumidos no painel de logs
+UNLOCK_SPANS = (
+    "desbloqueio", "captura", "identificacao_remota", "conversao", "deteccao", "codificacao",
+    "comparacao", "prova_de_vida", "espera_cartao", "registro_acesso", "gravacao_cartoes",
+)
 
-# Função para carregar os últimos acessos dos usuários
-def load_last_access():
-    if os.path.exists(LAST_ACCESS_FILE):
-        try:
-            with open(LAST_ACCESS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
-
+# Meta de inicialização a frio: tempo até a janela aparecer
+STARTUP_TARGET_MS = 1000
+# Quanto o fechamento da janela espera por uma carga de modelos ainda em andamento
+WARMUP_CLOSE_TIMEOUT_MS = 3000
 
-# Função para salvar os últimos acessos dos usuários
-def save_last_access(data):
-    try:
-        with open(LAST_ACCESS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print("[ERRO] Não foi possível salvar last_access:", e)
+# Cargas que não terminaram a tempo ao fechar: ficam referenciadas aqui (sem
+# janela mãe) para que o QThread não seja destruído ainda rodando
+_abandoned_threads = []
 
 
-# Função para carregar o status atual (dentro/fora) dos usuários
-def load_status():
-    if os.path.exists(STATUS_FILE):
-        try:
-            with open(STATUS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
+# Carrega a galeria, o índice aproximado e os modelos do dlib fora da thread
+# da interface; a janela aparece antes e os botões são liberados no fim
+class WarmupThread(QThread):
+    pronto = pyqtSignal()
+    falhou = pyqtSignal(str)
 
+    def __init__(self, gallery, parent=None):
+        super().__init__(parent)
+        self.gallery = gallery
 
-# Função para salvar o status atual dos usuários
-def save_status(data):
-    try:
-        with open(STATUS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print("[ERRO] Não foi possível salvar status:", e)
+    def run(self):
+        try:
+            self.gallery.load(*load_known_faces())
+            load_face_index(self.gallery)
+            warm_up()
+        except Exception as e:
+            self.falhou.emit(str(e))
+            return
+        self.pronto.emit()
 
 
 # Classe para exibir detalhes de um usuário em um diálogo
+# (a foto chega já reduzida, do cache de miniaturas)
 class UserDialog(QDialog):
-    def __init__(self, name, img_path, last_access, status, parent=None):
+    def __init__(self, name, thumbnail, last_access, status, history=(), parent=None):
         super().__init__(parent)
         self.setWindowTitle("Detalhes do Usuário")
 
@@ -81,10 +89,9 @@ class UserDialog(QDialog):
         layout.setAlignment(Qt.AlignCenter)
 
         # Exibe imagem
-        if os.path.exists(img_path):
-            pixmap = QPixmap(img_path).scaled(200, 200, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        if thumbnail is not None:
             img_label = QLabel()
-            img_label.setPixmap(pixmap)
+            img_label.setPixmap(QPixmap.fromImage(thumbnail))
             img_label.setAlignment(Qt.AlignCenter)
             layout.addWidget(img_label)
 
@@ -135,6 +142,13 @@ class UserDialog(QDialog):
         status_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(status_label)
 
+        # Últimos eventos registrados no diário de acessos
+        if history:
+            history_label = QLabel("\n".join(f"{format_ts(ts)}  {action}" for ts, _, action, _, _ in history))
+            history_label.setAlignment(Qt.AlignCenter)
+            history_label.setStyleSheet("color: #94a3b8; font-size: 12px;")
+            layout.addWidget(history_label)
+
         # Botão OK
         buttons = QDialogButtonBox(QDialogButtonBox.Ok)
         buttons.accepted.connect(self.accept)
@@ -144,9 +158,25 @@ class UserDialog(QDialog):
 
 # Classe principal da aplicação de controle de acesso
 class App(QWidget):
-    def __init__(self, arduino):
+    # Falhas das gravações em segundo plano (vêm de outras threads)
+    erro_gravacao = pyqtSignal(str)
+    # Alterações aplicadas pela replicação (tipo, nome do usuário)
+    replicado = pyqtSignal(str, str)
+
+    def __init__(self, serial_link, client=None, started_at=None, source=0, replication=None):
         super().__init__()
-        self.arduino = arduino
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        # Com um RecognitionClient o App é um cliente leve: a galeria e o
+        # reconhecimento ficam no serviço (python -m src.server)
+        self.client = client
+        # câmera, arquivo de vídeo ou pasta de imagens (frames.open_source)
+        self.source = source
+        # (endereço, porta, [(host, porta) dos pares], segredo) para replicar
+        # com outros quiosques
+        self.replication = replication
+        self.replica = None
+        self.replication_server = None
+        self.arduino = SerialBridge(serial_link, self)
         self.setWindowTitle("Controle de Acesso RFID + Rosto")
         self.setGeometry(400, 200, 1000, 600)
 
@@ -156,10 +186,21 @@ class App(QWidget):
         self.status_label.setStyleSheet("border-radius: 10px; background-color: red;")
         self.status_label.setToolTip("Hardware desconectado")
 
+        # Indicador de prontidão (galeria e modelos carregados)
+        self.ready_label = QLabel("⏳ Carregando...")
+        self.ready_label.setStyleSheet("color: #facc15; font-size: 13px;")
+        self.ready = False
+
         # Inicializa variáveis de controle
         self.logs_visible = False
-        self.last_access = load_last_access()
-        self.status = load_status()
+        self.access_log = AccessLog(ACCESS_LOG_FILE)
+        if self.access_log.is_new:
+            self.access_log.import_json(LAST_ACCESS_FILE, STATUS_FILE)
+        self.erro_gravacao.connect(self.add_log)
+        persistence.on_error = self.erro_gravacao.emit
+        face_store.on_error = self.erro_gravacao.emit
+        self.access_log.on_error = self.erro_gravacao.emit
+        self.replicado.connect(self.on_replicado)
 
         # Define o estilo da interface
         self.setStyleSheet("""
@@ -168,7 +209,7 @@ class App(QWidget):
             QPushButton { background-color: #1e293b; border: 2px solid #334155; border-radius: 10px; padding: 10px 16px; font-size: 15px; font-weight: bold; color: #e2e8f0; }
             QPushButton:hover { background-color: #2563eb; border: 2px solid #1d4ed8; }
             QLineEdit { background-color: #1e293b; border: 2px solid #334155; border-radius: 8px; padding: 8px; font-size: 14px; color: #e2e8f0; }
-            QListWidget { background-color: #1e293b; border-radius: 8px; padding: 5px; font-size: 15px; }
+            QListView { background-color: #1e293b; border-radius: 8px; padding: 5px; font-size: 15px; }
             QTextEdit { background-color: #1e293b; color: #e2e8f0; border: 2px solid #334155; border-radius: 8px; padding: 8px; font-size: 14px; }
         """)
 
@@ -186,23 +227,28 @@ class App(QWidget):
         self.label.setObjectName("title")
         self.label.setAlignment(Qt.AlignCenter)
         top_layout.addWidget(self.label)
+        top_layout.addWidget(self.ready_label)
 
         left_layout.addLayout(top_layout)
 
         # Botões de controle
         btn_layout = QHBoxLayout()
-        btn_unlock = QPushButton("Desbloquear")
-        btn_unlock.clicked.connect(self.unlock)
-        btn_layout.addWidget(btn_unlock)
+        self.btn_unlock = QPushButton("Desbloquear")
+        self.btn_unlock.clicked.connect(self.unlock)
+        btn_layout.addWidget(self.btn_unlock)
 
-        btn_add_face = QPushButton("Adicionar Rosto + Cartão")
-        btn_add_face.clicked.connect(self.add_face)
-        btn_layout.addWidget(btn_add_face)
+        self.btn_add_face = QPushButton("Adicionar Rosto + Cartão")
+        self.btn_add_face.clicked.connect(self.add_face)
+        btn_layout.addWidget(self.btn_add_face)
 
         btn_remove_face = QPushButton("Remover Rosto")
         btn_remove_face.clicked.connect(self.remove_face)
         btn_layout.addWidget(btn_remove_face)
 
+        self.btn_continuo = QPushButton("Iniciar Modo Contínuo")
+        self.btn_continuo.clicked.connect(self.toggle_continuous)
+        btn_layout.addWidget(self.btn_continuo)
+
         btn_logs = QPushButton("Mostrar/Ocultar Logs")
         btn_logs.clicked.connect(self.toggle_logs)
         btn_layout.addWidget(btn_logs)
@@ -215,9 +261,15 @@ class App(QWidget):
         self.search_box.textChanged.connect(self.filter_users)
         left_layout.addWidget(self.search_box)
 
-        # Lista de usuários
-        self.user_list = QListWidget()
-        self.user_list.itemClicked.connect(self.show_user_details)
+        # Lista de usuários (modelo virtualizado com busca indexada e
+        # miniaturas geradas em segundo plano)
+        self.thumbnails = ThumbnailCache(faces_dir, parent=self)
+        self.users = UserListModel(self.thumbnails, self)
+        self.user_list = QListView()
+        self.user_list.setModel(self.users)
+        self.user_list.setUniformItemSizes(True)
+        self.user_list.setIconSize(LIST_ICON_SIZE)
+        self.user_list.clicked.connect(self.show_user_details)
         left_layout.addWidget(self.user_list)
 
         main_layout.addLayout(left_layout)
@@ -231,50 +283,128 @@ class App(QWidget):
 
         self.setLayout(main_layout)
 
-        # Carrega rostos conhecidos
-        self.known_encodings, self.known_names = load_known_faces()
-        self.refresh_user_list()
+        # Rostos conhecidos e modelos carregam em segundo plano (a galeria é
+        # preenchida no lugar); no modo cliente eles ficam no serviço
+        self.gallery = FaceGallery()
+        self.warmup = None
+        if self.client is None:
+            self.warmup = WarmupThread(self.gallery, self)
+            self.warmup.pronto.connect(self.on_pronto)
+            self.warmup.falhou.connect(self.on_falha_preparo)
+            self.set_ready(False)
+        else:
+            self.btn_continuo.setEnabled(False)
+            self.btn_continuo.setToolTip("Indisponível no modo cliente")
+            self.refresh_user_list()
 
-        # Timer para atualizar status do Arduino a cada 10 segundos
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.atualizar_status_arduino)
-        self.timer.start(10000)
-        self.atualizar_status_arduino()
+        # Reconhecimento contínuo em segundo plano (câmera da porta)
+        self.pipeline = RecognitionPipeline(self.gallery, self.source, parent=self)
+        self.pipeline.rosto_reconhecido.connect(self.on_rosto_reconhecido)
+        self.pipeline.rosto_desconhecido.connect(self.on_rosto_desconhecido)
+        self.pipeline.vivacidade_reprovada.connect(self.on_vivacidade_reprovada)
+        self.acesso_em_andamento = False
 
+        # Eventos do Arduino chegam pela thread de leitura serial
+        self.arduino.evento.connect(self.on_evento_serial)
+        self.atualizar_status_arduino(self.arduino.connected)
 
-    # Atualiza o status de conexão do Arduino
-    def atualizar_status_arduino(self):
+        QTimer.singleShot(0, self.on_janela_exibida)
+        if self.warmup is not None:
+            self.warmup.start()
+        else:
+            self.on_pronto()
+
+
+    # Libera (ou bloqueia) os botões que dependem da galeria e dos modelos
+    def set_ready(self, ready):
+        self.ready = ready
+        self.btn_unlock.setEnabled(ready)
+        self.btn_add_face.setEnabled(ready)
+        if self.client is None:
+            self.btn_continuo.setEnabled(ready)
+
+
+    # Primeira volta do laço de eventos: a janela já está na tela
+    def on_janela_exibida(self):
+        elapsed = time.perf_counter() - self.started_at
+        observe("inicializacao_janela", elapsed)
+        message = f"Inicialização: janela exibida em {1000 * elapsed:.0f} ms"
+        if 1000 * elapsed > STARTUP_TARGET_MS:
+            message += f" (acima da meta de {STARTUP_TARGET_MS} ms)"
+        print(message)
+        self.add_log(message)
+
+
+    def on_pronto(self):
+        elapsed = time.perf_counter() - self.started_at
+        observe("inicializacao_pronto", elapsed)
+        self.set_ready(True)
+        self.ready_label.setText("✅ Pronto")
+        self.ready_label.setStyleSheet("color: #4ade80; font-size: 13px;")
+        if self.client is None:
+            self.refresh_user_list()
+            message = f"Inicialização: galeria ({len(self.gallery)} rostos) e modelos prontos em {1000 * elapsed:.0f} ms"
+            print(message)
+            self.add_log(message)
+            if self.replication is not None:
+                self.start_replication()
+
+
+    # Replicação com os outros quiosques (src.replication); só começa com a
+    # galeria carregada, para que as alterações recebidas não se percam
+    def start_replication(self):
+        host, port, peers, secret = self.replication
+        self.replica = Replica(self.gallery, card_registry, self.access_log)
+        self.replica.on_error = self.erro_gravacao.emit
+        self.replica.on_applied = self.replicado.emit
         try:
-            arduino_conectado = False
-            if self.arduino:
-                try:
-                    # tenta escrever algo mínimo
-                    self.arduino.write(b"\n")
-                    arduino_conectado = True
-                except Exception:
-                    arduino_conectado = False
-
-            if arduino_conectado:
-                self.status_label.setStyleSheet("border-radius: 10px; background-color: green;")
-                self.status_label.setToolTip("Hardware conectado")
-            else:
-                # tenta reconectar
-                novo_arduino = conectar_arduino()
-                if novo_arduino:
-                    self.arduino = novo_arduino
-                    self.status_label.setStyleSheet("border-radius: 10px; background-color: green;")
-                    self.status_label.setToolTip("Hardware conectado")
-                    self.add_log("🟢 Hardware conectado com sucesso.")
-                else:
-                    self.status_label.setStyleSheet("border-radius: 10px; background-color: red;")
-                    self.status_label.setToolTip("Hardware desconectado")
-                    self.add_log("🔴 Hardware desconectado ou não encontrado.")
-                    self.arduino = None 
-        except Exception as e:
+            self.replication_server = ReplicationServer(self.replica, secret, host, port)
+        except OSError as e:
+            self.add_log(f"[ERRO] Replicação: porta {port} indisponível: {e}")
+        else:
+            self.replication_server.start()
+        self.replica.start(peers, secret)
+        self.add_log(f"Replicação: nó {self.replica.node} em {host}:{port}, {len(peers)} par(es)")
+
+
+    def on_replicado(self, kind, name):
+        user = os.path.splitext(name)[0]
+        if kind == "enroll":
+            self.users.add(name)
+            self.add_log(f"Replicação: usuário {user} cadastrado em outro quiosque")
+        elif kind == "remove":
+            self.users.remove(name)
+            self.add_log(f"Replicação: usuário {user} removido em outro quiosque")
+
+
+    def on_falha_preparo(self, message):
+        self.ready_label.setText("❌ Falha ao carregar")
+        self.ready_label.setStyleSheet("color: #f87171; font-size: 13px;")
+        self.add_log(f"[ERRO] Falha ao carregar a galeria ou os modelos: {message}")
+
+
+    # Atualiza o indicador de conexão do Arduino
+    def atualizar_status_arduino(self, conectado):
+        if conectado:
+            self.status_label.setStyleSheet("border-radius: 10px; background-color: green;")
+            self.status_label.setToolTip("Hardware conectado")
+        else:
             self.status_label.setStyleSheet("border-radius: 10px; background-color: red;")
             self.status_label.setToolTip("Hardware desconectado")
-            self.arduino = None
-            self.add_log(f"[ERRO] Falha ao atualizar status do Hardware: {e}")
+
+
+    # Trata os eventos recebidos do Arduino (exceto cartões, tratados no diálogo)
+    def on_evento_serial(self, event):
+        if isinstance(event, ConnectionEvent):
+            self.atualizar_status_arduino(event.conectado)
+            if event.conectado:
+                self.add_log("🟢 Hardware conectado com sucesso.")
+            else:
+                self.add_log("🔴 Hardware desconectado; tentando reconectar em segundo plano.")
+        elif isinstance(event, DoorEvent):
+            self.add_log("🚪 Porta aberta" if event.aberta else "🚪 Porta fechada")
+        elif isinstance(event, DebugEvent):
+            self.add_log(f"[Arduino] {event.text}")
 
     # Alterna a visibilidade do painel de logs
     def toggle_logs(self):
@@ -284,34 +414,32 @@ class App(QWidget):
 
     # Atualiza a lista de usuários exibida
     def refresh_user_list(self):
-        self.user_list.clear()
-        for name in self.known_names:
-            display = os.path.splitext(name)[0]
-            self.user_list.addItem(QListWidgetItem(display))
+        if self.client:
+            try:
+                names = self.client.names()
+            except Exception as e:
+                names = []
+                self.add_log(f"[ERRO] Serviço de reconhecimento indisponível: {e}")
+        else:
+            names = self.gallery.unique_names()
+        self.users.set_names(names)
 
 
     # Filtra usuários na lista conforme texto digitado na caixa de busca
     def filter_users(self, text):
-        for i in range(self.user_list.count()):
-            item = self.user_list.item(i)
-            item.setHidden(text.lower() not in item.text().lower())
+        self.users.set_filter(text)
 
 
     # Exibe o diálogo de detalhes do usuário selecionado
-    def show_user_details(self, item):
-        display_name = item.text()
-        matched = None
-        for fname in self.known_names:
-            if os.path.splitext(fname)[0] == display_name:
-                matched = fname
-                break
+    def show_user_details(self, index):
+        matched = self.users.name_at(index.row())
         if not matched:
             QMessageBox.warning(self, "Erro", "Arquivo do usuário não encontrado.")
             return
-        img_path = os.path.join(faces_dir, matched)
-        last = self.last_access.get(matched, self.last_access.get(os.path.splitext(matched)[0], "Nunca"))
-        status = self.status.get(matched, "fora")
-        dlg = UserDialog(matched, img_path, last, status, self)
+        last = self.access_log.last_access_str(matched)
+        status = self.access_log.status(matched)
+        history = self.access_log.events(name=matched, limit=5)
+        dlg = UserDialog(matched, self.thumbnails.get_now(matched), last, status, history, self)
         dlg.exec_()
 
 
@@ -324,47 +452,135 @@ class App(QWidget):
         self.log_panel.verticalScrollBar().setValue(self.log_panel.verticalScrollBar().maximum())
 
 
+    # Liga/desliga o reconhecimento contínuo
+    def toggle_continuous(self):
+        if self.pipeline.running:
+            self.add_log(f"Modo contínuo encerrado {self.pipeline.stats()}")
+            self.pipeline.stop()
+            self.btn_continuo.setText("Iniciar Modo Contínuo")
+        else:
+            self.pipeline.start()
+            self.btn_continuo.setText("Parar Modo Contínuo")
+            self.add_log("Modo contínuo iniciado.")
+
+
+    # Rosto reconhecido pelo modo contínuo: segue para a validação do cartão
+    def on_rosto_reconhecido(self, match, frame):
+        if self.acesso_em_andamento:
+            return
+        display_name = os.path.splitext(match.name)[0]
+        self.add_log(f"Rosto reconhecido: {display_name} (distância {match.distance:.3f}, margem {match.margin:.3f})")
+        self.processar_acesso(match.name)
+
+
+    def on_rosto_desconhecido(self, frame):
+        if self.acesso_em_andamento:
+            return
+        self.add_log("Rosto não reconhecido na câmera.")
+
+
+    def on_vivacidade_reprovada(self, match, liveness):
+        if self.acesso_em_andamento:
+            return
+        display_name = os.path.splitext(match.name)[0]
+        self.add_log(f"Prova de vida reprovada para {display_name}: {liveness.reason} ({liveness.elapsed_ms:.1f} ms)")
+
+
+    # Abre a pré-visualização liberando a câmera do modo contínuo, se ativo.
+    # Retorna a lista de frames aceitos, cada um em BGR e em RGB (já
+    # convertido pelo diálogo), e o histórico de miniaturas da prévia;
+    # ([], None) se cancelado
+    def capturar_frame(self, burst=1):
+        was_running = self.pipeline.running
+        self.pipeline.stop()
+        try:
+            dialog = CaptureDialog(burst, self.source)
+            if dialog.exec_() != dialog.Accepted:
+                return [], None
+            return dialog.captured, dialog.history
+        finally:
+            if was_running:
+                self.pipeline.start()
+
+
     # Função principal de desbloqueio: verifica rosto + cartão
     def unlock(self):
-        dialog = CaptureDialog()
-        if dialog.exec_() != dialog.Accepted:
+        started = metrics.mark() if metrics.enabled else None
+        with span("captura"):
+            frames, history = self.capturar_frame()
+        if not frames:
             return
-        frame = dialog.captured_frame
-        encoding = get_face_encoding(frame)
-        if encoding is None:
+        with span("desbloqueio"):
+            self._unlock(*frames[-1], history)
+        if metrics.enabled:
+            self.add_log(f"Métricas: {metrics.summary(UNLOCK_SPANS, since=started)}")
+
+
+    def _unlock(self, frame, rgb, history):
+        if self.client:
+            try:
+                with span("identificacao_remota"):
+                    face_found, match = self.client.identify(frame)
+            except Exception as e:
+                QMessageBox.critical(self, "Erro", f"Falha ao consultar o serviço de reconhecimento: {e}")
+                return
+        else:
+            timings = {}
+            location, encoding = locate_and_encode(rgb, timings=timings)
+            self.add_log(
+                f"Tempos: detecção {timings['deteccao']:.0f} ms, "
+                f"codificação {timings['codificacao']:.0f} ms, total {timings['total']:.0f} ms"
+            )
+            face_found = encoding is not None
+            match = compare_faces(self.gallery, encoding)
+        if not face_found:
             QMessageBox.warning(self, "Falha", "Nenhum rosto detectado.")
             return
-        user_name = compare_faces(self.known_encodings, self.known_names, encoding)
-        if not user_name:
+        if not match:
             QMessageBox.warning(self, "Falha", "Rosto não reconhecido.")
             return
+        display_name = os.path.splitext(match.name)[0]
+        self.add_log(f"Rosto reconhecido: {display_name} (distância {match.distance:.3f}, margem {match.margin:.3f})")
+        # Prova de vida antes do cartão, com os frames já lidos pela prévia
+        # (no modo cliente a detecção é feita no serviço e ela não é aplicada)
+        if self.client is None:
+            liveness = verify_liveness(self.access_log, match.name, rgb, location, history)
+            self.add_log(f"Prova de vida: {liveness.reason} ({liveness.elapsed_ms:.1f} ms)")
+            if not liveness_ok(liveness):
+                QMessageBox.critical(self, "Falha", "Prova de vida não confirmada. Olhe para a câmera e tente novamente.")
+                return
+        self.processar_acesso(match.name)
+
+
+    # Validação do cartão e registro de entrada/saída de um rosto reconhecido.
+    # O modo contínuo fica pausado até o atendimento terminar.
+    def processar_acesso(self, user_name):
+        self.acesso_em_andamento = True
+        self.pipeline.pause()
+        try:
+            self._processar_acesso(user_name)
+        finally:
+            self.acesso_em_andamento = False
+            self.pipeline.resume()
+
+
+    def _processar_acesso(self, user_name):
         display_name = os.path.splitext(user_name)[0]
-        cards = load_cards()
         uid = aguardar_cartao_dialog(self, self.arduino, f"Rosto reconhecido: {display_name}\nAproxime o cartão do leitor")
         if not uid:
             QMessageBox.warning(self, "Falha", "Nenhum cartão detectado.")
             return
         # Valida cartão existente e atualiza status de entrada/saída
-        if user_name in cards:
-            expected_uid = cards[user_name]
-            if expected_uid == uid:
-                if self.arduino:
-                    self.arduino.write(b"OPEN\n")
-                current_status = self.status.get(user_name, "fora")
-                if current_status == "fora":
-                    action = "ENTRADA"
-                    self.status[user_name] = "dentro"
-                else:
-                    action = "SAÍDA"
-                    self.status[user_name] = "fora"
-                QMessageBox.information(self, "Sucesso", f"{action} registrada para {display_name}")
-                self.add_log(f"{action} de {display_name}")
-                self.last_access[user_name] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-                save_last_access(self.last_access)
-                save_status(self.status)
-            else:
-                QMessageBox.critical(self, "Erro", "Cartão não corresponde ao rosto! Ação negada.")
-                self.add_log(f"Tentativa com cartão inválido para {display_name} (UID detectado: {uid}, esperado: {expected_uid})")
+        decision = check_card(card_registry, self.access_log, user_name, uid)
+        uid = decision.uid
+        if decision.result == "liberado":
+            self.arduino.write(b"OPEN\n")
+            self.add_log(f"{decision.action} de {display_name}")
+            QMessageBox.information(self, "Sucesso", f"{decision.action} registrada para {display_name}")
+            return
+        if decision.result == "negado":
+            QMessageBox.critical(self, "Erro", "Cartão não corresponde ao rosto! Ação negada.")
+            self.add_log(f"Tentativa com cartão inválido para {display_name} (UID detectado: {uid}, esperado: {decision.expected_uid})")
             return
         # Registro de novo cartão para usuário
         reply = QMessageBox.question(
@@ -375,86 +591,134 @@ class App(QWidget):
         if reply != QMessageBox.Yes:
             QMessageBox.information(self, "Cancelado", "Registro de cartão cancelado.")
             return
-        existing_owner = None
-        for k, v in cards.items():
-            if v == uid:
-                existing_owner = k
-                break
-        if existing_owner:
-            owner_display = os.path.splitext(existing_owner)[0]
+        decision = register_card(card_registry, self.access_log, user_name, uid)
+        if decision.result == "cartao_de_outro":
+            owner_display = os.path.splitext(decision.owner)[0]
             QMessageBox.critical(self, "Erro", f"Este cartão (UID {uid}) já está associado ao usuário '{owner_display}'.")
             self.add_log(f"Tentativa de registrar cartão já associado (UID {uid}) para {display_name}; proprietário: {owner_display}")
             return
-        # Salva novo cartão e registra entrada
-        cards[user_name] = uid
-        save_cards(cards)
-        QMessageBox.information(self, "Sucesso", f"Cartão registrado e ENTRADA registrada para {display_name}")
+        self.arduino.write(b"OPEN\n")
         self.add_log(f"Cartão registrado e ENTRADA de {display_name} (UID: {uid})")
-        if self.arduino:
-            self.arduino.write(b"OPEN\n")
-        self.last_access[user_name] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        self.status[user_name] = "dentro"
-        save_last_access(self.last_access)
-        save_status(self.status)
+        QMessageBox.information(self, "Sucesso", f"Cartão registrado e ENTRADA registrada para {display_name}")
 
 
     # Remove um rosto/usuário existente
     def remove_face(self):
-        item = self.user_list.currentItem()
-        if not item:
+        index = self.user_list.currentIndex()
+        if not index.isValid():
             QMessageBox.warning(self, "Erro", "Selecione um usuário para remover.")
             return
-        user = item.text()
-        fname = None
-        for name in self.known_names:
-            if os.path.splitext(name)[0] == user:
-                fname = name
-                break
+        fname = self.users.name_at(index.row())
         if not fname:
             QMessageBox.warning(self, "Erro", "Arquivo do usuário não encontrado.")
             return
+        user = os.path.splitext(fname)[0]
         reply = QMessageBox.question(self, "Confirmação", f"Tem certeza que deseja remover {user}?", QMessageBox.Yes | QMessageBox.No)
         if reply != QMessageBox.Yes:
             return
         try:
-            os.remove(os.path.join(faces_dir, fname))
-            self.known_names.remove(fname)
-            self.known_encodings = [enc for enc, n in zip(self.known_encodings, self.known_names) if n != fname]
-            save_known_faces(self.known_encodings, self.known_names)
-            self.refresh_user_list()
+            img_path = os.path.join(faces_dir, fname)
+            if os.path.exists(img_path):
+                os.remove(img_path)
+            if self.client:
+                self.client.remove(fname)
+            else:
+                self.gallery.remove(fname)
+                remove_known_face(fname)
+                save_face_index(self.gallery)
+                if self.replica is not None:
+                    self.replica.removed(fname)
+            card_registry.unbind(fname)
+            self.users.remove(fname)
             self.add_log(f"Usuário removido: {user}")
         except Exception as e:
             QMessageBox.critical(self, "Erro", f"Falha ao remover: {e}")
 
 
     # Adiciona um novo rosto/usuário
+    # Captura uma rajada de frames: os borrados são descartados e até
+    # MAX_TEMPLATES codificações do mesmo rosto ficam como modelos do usuário
     def add_face(self):
-        dialog = CaptureDialog()
-        if dialog.exec_() != dialog.Accepted:
-            return
-        frame = dialog.captured_frame
-        encoding = get_face_encoding(frame)
-        if encoding is None:
-            QMessageBox.warning(self, "Erro", "Nenhum rosto detectado.")
+        frames, _ = self.capturar_frame(burst=ENROLL_BURST)
+        if not frames:
             return
+        templates = []
+        if self.client is None:
+            templates, best = select_templates([rgb for _, rgb in frames])
+            if not templates:
+                QMessageBox.warning(self, "Erro", "Nenhum rosto nítido detectado. Tente novamente com o rosto parado.")
+                return
+        else:
+            best = sharpest([rgb for _, rgb in frames])
+        frame = frames[best][0]
+        burst = [bgr for bgr, _ in frames]
         name, ok = QInputDialog.getText(self, "Novo Usuário", "Digite o nome do usuário:")
         if not ok or not name.strip():
             return
         name = name.strip() + ".png"
+        try:
+            check_name(name)
+        except ValueError:
+            QMessageBox.warning(self, "Erro", "Nome inválido: não use barras nem \"..\".")
+            return
+        # recadastrar um nome existente substitui a foto e os modelos dele
+        if name in self.users or (self.client is None and name in self.gallery):
+            reply = QMessageBox.question(
+                self, "Confirmação",
+                f"O usuário {os.path.splitext(name)[0]} já está cadastrado. Substituir a foto e os modelos de rosto dele?",
+                QMessageBox.Yes | QMessageBox.No,
+            )
+            if reply != QMessageBox.Yes:
+                return
+        if self.client:
+            try:
+                if not self.client.enroll(name, frames=burst):
+                    QMessageBox.warning(self, "Erro", "Nenhum rosto detectado.")
+                    return
+            except Exception as e:
+                QMessageBox.critical(self, "Erro", f"Falha ao cadastrar no serviço de reconhecimento: {e}")
+                return
         img_path = os.path.join(faces_dir, name)
         cv2.imwrite(img_path, frame)
-        self.known_encodings.append(encoding)
-        self.known_names.append(name)
-        save_known_faces(self.known_encodings, self.known_names)
-        self.refresh_user_list()
+        if self.client is None:
+            if self.gallery.remove(name):
+                remove_known_face(name)
+            self.gallery.extend([name] * len(templates), templates)
+            append_known_faces([name] * len(templates), templates)
+            save_face_index(self.gallery)
+            if self.replica is not None:
+                self.replica.enrolled(name, templates, img_path)
+            self.add_log(f"{len(templates)} modelo(s) de rosto cadastrados para {os.path.splitext(name)[0]}")
+        self.users.add(name)
         uid = aguardar_cartao_dialog(self, self.arduino, f"Associe um cartão ao usuário {os.path.splitext(name)[0]}")
         if not uid:
             QMessageBox.warning(self, "Erro", "Nenhum cartão detectado. O usuário foi cadastrado sem cartão.")
             return
-        cards = load_cards()
-        if uid in cards.values():
+        uid = normalize_uid(uid)
+        owner = card_registry.owner_of(uid)
+        if owner is not None and owner != name:
             QMessageBox.critical(self, "Erro", f"Este cartão já está associado a outro usuário.")
             return
-        cards[name] = uid
-        save_cards(cards)
+        card_registry.bind(name, uid)
         self.add_log(f"Usuário {os.path.splitext(name)[0]} registrado (UID: {uid})")
+
+
+    # Encerra a câmera e as threads de reconhecimento ao fechar a janela
+    def closeEvent(self, event):
+        if self.warmup is not None and not self.warmup.wait(WARMUP_CLOSE_TIMEOUT_MS):
+            print("[AVISO] Carga da galeria/modelos não terminou; encerrando sem esperar.")
+            self.warmup.pronto.disconnect()
+            self.warmup.falhou.disconnect()
+            self.warmup.setParent(None)
+            _abandoned_threads.append(self.warmup)
+        self.pipeline.stop()
+        self.thumbnails.close()
+        if self.replica is not None:
+            self.replica.stop()
+        if self.replication_server is not None:
+            self.replication_server.shutdown()
+        self.access_log.close()
+        if not persistence.flush(timeout=10.0):
+            print("[ERRO] Gravações pendentes não terminaram antes do encerramento.")
+        persistence.on_error = None
+        super().closeEvent(event)
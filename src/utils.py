@@ -1,56 +1,192 @@
-import os, pickle, cv2, face_recognition, numpy as np
+import os, time, cv2, numpy as np
 
+from .ann_index import IVFIndex
+from .store import EncodingStore
+from .cards import CardRegistry, normalize_uid
+from .metrics import span, observe, inc
+from .persistence import writer as persistence
+
+# face_recognition (dlib + modelos) é importado só no primeiro uso, e a pasta
+# faces/ só é criada quando algo for gravado nela
 faces_dir = "faces"
-os.makedirs(faces_dir, exist_ok=True)
 encodings_file = os.path.join(faces_dir, "encodings.pkl")
 cards_file = os.path.join(faces_dir, "cards.pkl")
+index_file = os.path.join(faces_dir, "encodings.ivf.npz")
+face_store = EncodingStore(os.path.join(faces_dir, "encodings"))
+card_registry = CardRegistry(cards_file, persistence)
+
+# A partir deste número de rostos a busca passa a usar o índice aproximado;
+# ANN_N_PROBE controla o equilíbrio entre recall e latência
+ANN_MIN_FACES = 20000
+ANN_N_PROBE = 8
+
+# Nomes de usuário viram nomes de arquivo em faces/: recusa caminhos
+# (separadores, "..", absolutos) vindos da rede ou de outro nó
+def check_name(name):
+    if not isinstance(name, str) or not name.strip() or name in (".", "..") \
+            or "/" in name or "\\" in name or os.path.basename(name) != name or os.path.isabs(name):
+        raise ValueError(f"Nome de usuário inválido: {name!r}")
+    return name
+
+def ensure_faces_dir():
+    os.makedirs(faces_dir, exist_ok=True)
 
 def load_known_faces():
-    encodings, names = [], []
-    if os.path.exists(encodings_file):
-        with open(encodings_file, "rb") as f:
-            data = pickle.load(f)
-            raw_encodings = data.get("encodings", [])
-            raw_names = data.get("names", [])
-            for e, n in zip(raw_encodings, raw_names):
-                arr = np.array(e)
-                if arr.shape == (128,):
-                    encodings.append(arr)
-                    names.append(n)
-    return encodings, names
+    with span("galeria_carregar"):
+        persistence.flush()
+        ensure_faces_dir()
+        if not face_store.exists():
+            face_store.migrate_from_pickle(encodings_file)
+        return face_store.load()
+
+# As alterações da galeria em disco são feitas pelo gravador em segundo
+# plano, na mesma ordem em que foram pedidas (a galeria em memória já está
+# atualizada quando estas funções retornam)
+def _store_task(method, *args):
+    def task():
+        with span("galeria_gravar"):
+            ensure_faces_dir()
+            method(*args)
+    persistence.submit("galeria", task, coalesce=False)
 
 def save_known_faces(encodings, names):
-    serializable_encodings = [e.tolist() for e in encodings]
-    with open(encodings_file, "wb") as f:
-        pickle.dump({"encodings": serializable_encodings, "names": names}, f)
+    _store_task(face_store.rewrite, np.array(encodings, dtype=np.float32), list(names))
 
-def get_face_encoding(image):
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    face_locations = face_recognition.face_locations(rgb_image, model="hog")
+def append_known_face(name, encoding):
+    append_known_faces([name], [encoding])
+
+def append_known_faces(names, encodings):
+    _store_task(face_store.extend, list(names), np.array(encodings, dtype=np.float32))
+
+def remove_known_face(name):
+    _store_task(face_store.remove, name)
+
+# Escala da cópia em que roda a detecção (HOG); a codificação usa sempre o
+# recorte em resolução original. O padrão é a imagem inteira (rostos pequenos
+# ou distantes continuam sendo encontrados); o reconhecimento contínuo, que
+# detecta em muitos frames, usa a cópia reduzida CONTINUOUS_DETECTION_SCALE.
+# FACE_SELECTION escolhe qual rosto usar quando há mais de um: "first",
+# "largest" ou "central".
+DETECTION_SCALE = 1.0
+CONTINUOUS_DETECTION_SCALE = 0.5
+FACE_SELECTION = "first"
+
+def detect_faces(rgb_image, detection_scale=DETECTION_SCALE):
+    import face_recognition
+    if detection_scale >= 1.0:
+        return face_recognition.face_locations(rgb_image, model="hog")
+    small = cv2.resize(rgb_image, (0, 0), fx=detection_scale, fy=detection_scale, interpolation=cv2.INTER_AREA)
+    height, width = rgb_image.shape[:2]
+    locations = []
+    for top, right, bottom, left in face_recognition.face_locations(small, model="hog"):
+        locations.append((
+            max(0, int(top / detection_scale)),
+            min(width, int(right / detection_scale)),
+            min(height, int(bottom / detection_scale)),
+            max(0, int(left / detection_scale)),
+        ))
+    return locations
+
+def select_face(face_locations, image_shape, select=FACE_SELECTION):
     if not face_locations:
         return None
-    encodings = face_recognition.face_encodings(rgb_image, known_face_locations=face_locations)
+    if select == "largest":
+        return max(face_locations, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))
+    if select == "central":
+        cy, cx = image_shape[0] / 2, image_shape[1] / 2
+        return min(face_locations, key=lambda loc: ((loc[0] + loc[2]) / 2 - cy) ** 2 + ((loc[1] + loc[3]) / 2 - cx) ** 2)
+    return face_locations[0]
+
+# `timings`, se informado, recebe o tempo de cada etapa em milissegundos
+def get_face_encoding(image, detection_scale=DETECTION_SCALE, select=FACE_SELECTION, timings=None):
+    t0 = time.perf_counter()
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    conversion = time.perf_counter() - t0
+    observe("conversao", conversion)
+    encoding = get_face_encoding_rgb(rgb_image, detection_scale, select, timings)
+    if timings is not None:
+        timings["conversao"] = 1000 * conversion
+        timings["total"] += 1000 * conversion
+    return encoding
+
+# Igual a get_face_encoding para um frame que já está em RGB (ex.: o buffer
+# da pré-visualização), sem uma segunda conversão de cor
+def get_face_encoding_rgb(rgb_image, detection_scale=DETECTION_SCALE, select=FACE_SELECTION, timings=None):
+    return locate_and_encode(rgb_image, detection_scale, select, timings)[1]
+
+# (localização, codificação) do rosto escolhido num frame RGB; (None, None) sem rosto
+def locate_and_encode(rgb_image, detection_scale=DETECTION_SCALE, select=FACE_SELECTION, timings=None):
+    t1 = time.perf_counter()
+    face_locations = detect_faces(rgb_image, detection_scale)
+    t2 = time.perf_counter()
+    location = select_face(face_locations, rgb_image.shape, select)
+    encoding = encode_face(rgb_image, location) if location is not None else None
+    t3 = time.perf_counter()
+    observe("deteccao", t2 - t1)
+    observe("codificacao", t3 - t2)
+    inc("rostos_detectados", len(face_locations))
+    if timings is not None:
+        timings.update({
+            "conversao": 0.0,
+            "deteccao": 1000 * (t2 - t1),
+            "codificacao": 1000 * (t3 - t2),
+            "total": 1000 * (t3 - t1),
+            "rostos": len(face_locations),
+        })
+    return location, encoding
+
+# Codificação 128-d de um rosto já localizado numa imagem RGB
+def encode_face(rgb_image, location):
+    import face_recognition
+    encodings = face_recognition.face_encodings(rgb_image, known_face_locations=[location])
     return encodings[0] if encodings else None
 
-def compare_faces(known_encodings, known_names, encoding, tolerance=0.5):
-    if not known_encodings or encoding is None:
+# Carrega o face_recognition e os modelos do dlib (a primeira detecção e a
+# primeira codificação são lentas); o App chama isto em segundo plano
+def warm_up():
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    with span("aquecimento"):
+        detect_faces(image, 1.0)
+        encode_face(image, (8, 56, 56, 8))
+
+def compare_faces(gallery, encoding, tolerance=0.5):
+    if encoding is None or not len(gallery):
+        return None
+    encoding = np.asarray(encoding)
+    if encoding.shape != (128,):
         return None
-    known_encodings = [np.array(e) for e in known_encodings if np.array(e).shape == (128,)]
-    encoding = np.array(encoding)
-    if encoding.shape != (128,) or not known_encodings:
+    with span("comparacao"):
+        return gallery.match(encoding, tolerance=tolerance)
+
+# Carrega (ou constrói) o índice aproximado e o associa à galeria
+def load_face_index(gallery, min_faces=ANN_MIN_FACES, n_probe=ANN_N_PROBE):
+    if len(gallery) < min_faces:
+        gallery.detach_index()
         return None
-    results = face_recognition.compare_faces(known_encodings, encoding, tolerance=tolerance)
-    if any(results):
-        index = results.index(True)
-        return known_names[index]
-    return None
-
-def load_cards():
-    if os.path.exists(cards_file):
-        with open(cards_file, "rb") as f:
-            return pickle.load(f)
-    return {}
-
-def save_cards(cards):
-    with open(cards_file, "wb") as f:
-        pickle.dump(cards, f)
+    persistence.flush()
+    index = IVFIndex.load(index_file, gallery.names, gallery.encodings)
+    rebuilt = index is None or index.needs_rebuild(len(gallery))
+    if rebuilt:
+        index = IVFIndex(n_probe=n_probe).build(gallery.encodings)
+    index.n_probe = n_probe
+    gallery.attach_index(index)
+    if rebuilt:
+        _save_index(gallery, index)
+    return index
+
+# Grava o índice em segundo plano; gravações seguidas viram uma só
+def _save_index(gallery, index):
+    def task():
+        with gallery.lock:
+            if gallery.index is not index:
+                return
+            ensure_faces_dir()
+            index.save(index_file, gallery.names)
+    persistence.submit(index_file, task)
+
+def save_face_index(gallery):
+    index = gallery.index
+    if index is None or index.needs_rebuild(len(gallery)):
+        return load_face_index(gallery)
+    _save_index(gallery, index)
+    return index
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from src.access import check_card, register_card, verify_liveness
+from src.access_log import AccessLog
+from src.cards import CardRegistry
+from src.liveness import FrameHistory
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = AccessLog(str(tmp_path / "acessos.db"), flush_interval=0.01)
+    yield log
+    log.close()
+
+
+@pytest.fixture
+def cards(tmp_path):
+    return CardRegistry(str(tmp_path / "cards.pkl"))
+
+
+def actions(log):
+    log.flush()
+    return [(name, action, uid) for _, name, action, uid, _ in reversed(log.events())]
+
+
+def test_card_flow(cards, log):
+    assert check_card(cards, log, "ana.png", "aa bb").result == "sem_cartao"
+    assert register_card(cards, log, "ana.png", "aa bb").action == "ENTRADA"
+    assert cards.uid_of("ana.png") == "AABB"
+    assert check_card(cards, log, "ana.png", "AABB").action == "SAÍDA"
+    assert check_card(cards, log, "ana.png", "AABB").action == "ENTRADA"
+    denied = check_card(cards, log, "ana.png", "ccdd")
+    assert (denied.result, denied.expected_uid) == ("negado", "AABB")
+    taken = register_card(cards, log, "bia.png", "AABB")
+    assert (taken.result, taken.owner) == ("cartao_de_outro", "ana.png")
+    assert cards.uid_of("bia.png") is None
+    assert actions(log) == [
+        ("ana.png", "ENTRADA", "AABB"), ("ana.png", "SAÍDA", "AABB"), ("ana.png", "ENTRADA", "AABB"),
+        ("ana.png", "NEGADO", "CCDD"), ("bia.png", "NEGADO", "AABB"),
+    ]
+    assert log.status("ana.png") == "dentro"
+
+
+# Uma foto lisa não tem a textura fina de um rosto: negada e registrada
+def test_liveness_denial_is_recorded(log):
+    flat = np.full((120, 120, 3), 90, dtype=np.uint8)
+    history = FrameHistory()
+    history.push(flat, rgb=True)
+    result = verify_liveness(log, "ana.png", flat, (10, 110, 110, 10), history)
+    assert result.live is False
+    assert actions(log) == [("ana.png", "NEGADO", None)]
+
+    textured = np.random.default_rng(0).integers(0, 255, (120, 120, 3), dtype=np.uint8)
+    assert verify_liveness(log, "ana.png", textured, (10, 110, 110, 10), history).live
+    assert len(actions(log)) == 1
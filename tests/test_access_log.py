@@ -0,0 +1,136 @@
+import json, threading
+
+import pytest
+
+from src.access_log import AccessLog
+
+
+@pytest.fixture
+def make_log(tmp_path):
+    logs = []
+
+    def make(flush_interval=0.01):
+        log = AccessLog(str(tmp_path / "acessos.db"), flush_interval=flush_interval)
+        logs.append(log)
+        return log
+
+    yield make
+    for log in logs:
+        try:
+            log.close()
+        except Exception:
+            pass
+
+
+def test_new_database(make_log):
+    log = make_log()
+    assert log.is_new
+    assert log.status("a.png") == "fora"
+    assert log.last_access_str("a.png") == "Nunca"
+
+
+def test_out_of_order_events_keep_latest_status(make_log):
+    log = make_log()
+    log.record("a.png", "ENTRADA", ts=200.0)
+    log.record("a.png", "SAÍDA", ts=100.0)
+    log.record("a.png", "NEGADO", ts=300.0)
+    assert log.status("a.png") == "dentro"
+    assert log.last_access("a.png") == 200.0
+    log.close()
+
+    reopened = make_log()
+    assert not reopened.is_new
+    assert reopened.states() == {"a.png": ("dentro", 200.0)}
+    assert [e[2] for e in reopened.events()] == ["NEGADO", "ENTRADA", "SAÍDA"]
+
+
+def test_events_are_visible_before_they_are_written(make_log):
+    log = make_log(flush_interval=60)
+    log.record("a.png", "ENTRADA", ts=10.0)
+    log.record("b.png", "ENTRADA", ts=20.0)
+    assert [e[1] for e in log.events()] == ["b.png", "a.png"]
+    assert log.events(name="a.png") == [(10.0, "a.png", "ENTRADA", None, None)]
+    assert log.events(start=15.0) == [(20.0, "b.png", "ENTRADA", None, None)]
+
+
+# Evento já gravado no banco mas ainda na lista de pendentes (o gravador
+# está entre o INSERT e a limpeza da lista): deve aparecer uma única vez
+def test_events_merges_pending_and_written_without_duplicates(make_log, monkeypatch):
+    written, release = threading.Event(), threading.Event()
+    original = AccessLog._write
+
+    def slow_write(conn, events):
+        original(conn, events)
+        written.set()
+        release.wait(5)
+
+    monkeypatch.setattr(AccessLog, "_write", staticmethod(slow_write))
+    log = make_log()
+    log.record("a.png", "ENTRADA", ts=10.0)
+    assert written.wait(5)
+    log.record("a.png", "SAÍDA", ts=20.0)
+    try:
+        events = log.events()
+        assert events == [(20.0, "a.png", "SAÍDA", None, None), (10.0, "a.png", "ENTRADA", None, None)]
+        assert log.events(limit=1) == events[:1]
+    finally:
+        release.set()
+    log.flush()
+    assert log.events() == events
+
+
+def test_flush_writes_and_close_drains_queue(make_log):
+    log = make_log(flush_interval=60)
+    for i in range(5):
+        log.record("a.png", "ENTRADA" if i % 2 == 0 else "SAÍDA", ts=float(i))
+    log.close()
+
+    reopened = make_log()
+    assert len(reopened.events()) == 5
+    assert reopened.states() == {"a.png": ("dentro", 4.0)}
+
+    reopened.record("b.png", "NEGADO", ts=9.0)
+    reopened.flush()
+    assert not reopened._pending
+    assert reopened.events(name="b.png") == [(9.0, "b.png", "NEGADO", None, None)]
+
+
+def test_on_record_and_notify(make_log):
+    log = make_log()
+    seen = []
+    log.on_record = lambda *event: seen.append(event)
+    log.record("a.png", "ENTRADA", uid="01AB", ts=1.0)
+    log.record("b.png", "ENTRADA", ts=2.0, notify=False)
+    assert seen == [(1.0, "a.png", "ENTRADA", "01AB", None)]
+
+
+def test_merge_state_only_applies_newer(make_log):
+    log = make_log()
+    log.record("a.png", "ENTRADA", ts=100.0)
+    assert not log.merge_state("a.png", "fora", 50.0)
+    assert log.merge_state("a.png", "fora", 150.0)
+    assert log.status("a.png") == "fora"
+
+
+def test_import_json(make_log, tmp_path):
+    last_access = tmp_path / "last_access.json"
+    status = tmp_path / "status.json"
+    last_access.write_text(json.dumps({"a.png": "01/02/2024 08:30:00", "b.png": "data ruim"}), encoding="utf-8")
+    status.write_text(json.dumps({"a.png": "dentro", "c.png": "fora"}), encoding="utf-8")
+
+    log = make_log()
+    assert log.import_json(str(last_access), str(status)) == 3
+    assert log.status("a.png") == "dentro"
+    assert log.last_access_str("a.png") == "01/02/2024 08:30:00"
+    assert log.states()["b.png"] == ("fora", None)
+    assert log.states()["c.png"] == ("fora", None)
+    log.close()
+
+    assert make_log().states()["a.png"][0] == "dentro"
+
+
+def test_import_json_missing_or_invalid_files(make_log, tmp_path):
+    broken = tmp_path / "status.json"
+    broken.write_text("{", encoding="utf-8")
+    log = make_log()
+    assert log.import_json(str(tmp_path / "nao_existe.json"), str(broken)) == 0
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from src.gallery import FaceGallery, ENCODING_DIM
+from src.ann_index import IVFIndex
+
+
+def vector(*values):
+    v = np.zeros(ENCODING_DIM, dtype=np.float32)
+    v[:len(values)] = values
+    return v
+
+
+# Referência: distância para todas as linhas, sem centroides nem índice
+def brute_force(names, matrix, query, tolerance):
+    dists = np.linalg.norm(matrix - query, axis=1)
+    best = int(np.argmin(dists))
+    if dists[best] > tolerance:
+        return None
+    others = np.array([n != names[best] for n in names])
+    margin = float(dists[others].min() - dists[best]) if others.any() else float("inf")
+    return names[best], float(dists[best]), margin
+
+
+def synthetic(n_users, per_user, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.3, (n_users, ENCODING_DIM)).astype(np.float32)
+    names, rows = [], []
+    for u, center in enumerate(centers):
+        for _ in range(per_user):
+            names.append(f"u{u}.png")
+            rows.append(center + rng.normal(0, 0.03, ENCODING_DIM))
+    return names, np.asarray(rows, dtype=np.float32), centers, rng
+
+
+def test_returns_best_match_not_first_within_tolerance():
+    gallery = FaceGallery()
+    gallery.add("longe.png", vector(0.4))
+    gallery.add("perto.png", vector(0.1))
+    match = gallery.match(vector(0.0), tolerance=0.5)
+    assert match.name == "perto.png"
+    assert match.distance == pytest.approx(0.1)
+    assert match.margin == pytest.approx(0.3)
+
+
+def test_tolerance_is_inclusive():
+    gallery = FaceGallery()
+    gallery.add("a.png", vector(0.5))
+    assert gallery.match(vector(0.0), tolerance=0.5).name == "a.png"
+    assert gallery.match(vector(0.0), tolerance=0.4999) is None
+
+
+def test_empty_gallery():
+    gallery = FaceGallery()
+    assert gallery.match(vector(0.0)) is None
+    assert gallery.match_batch(np.zeros((3, ENCODING_DIM))) == [None, None, None]
+
+
+def test_single_user_has_infinite_margin():
+    gallery = FaceGallery()
+    gallery.add("a.png", vector(0.1))
+    gallery.add("a.png", vector(0.2))
+    assert gallery.match(vector(0.0)).margin == float("inf")
+
+
+def test_remove_moves_last_row_into_the_gap():
+    gallery = FaceGallery()
+    gallery.add("a.png", vector(1.0))
+    gallery.add("b.png", vector(2.0))
+    gallery.add("c.png", vector(3.0))
+    assert gallery.remove("a.png") == 1
+    assert len(gallery) == 2
+    assert "a.png" not in gallery
+    assert gallery.rows_of("c.png") == [0]
+    assert gallery.names == ["c.png", "b.png"]
+    np.testing.assert_array_equal(gallery.encodings[0], vector(3.0))
+    match = gallery.match(vector(3.0))
+    assert (match.name, match.row) == ("c.png", 0)
+    assert gallery.remove("a.png") == 0
+
+
+def test_remove_user_with_several_rows():
+    gallery = FaceGallery()
+    gallery.extend(["a.png", "b.png", "a.png", "c.png", "a.png"],
+                   [vector(1.0), vector(2.0), vector(1.1), vector(3.0), vector(1.2)])
+    assert gallery.remove("a.png") == 3
+    assert sorted(gallery.names) == ["b.png", "c.png"]
+    for name, value in (("b.png", 2.0), ("c.png", 3.0)):
+        (row,) = gallery.rows_of(name)
+        assert gallery.encodings[row][0] == pytest.approx(value)
+        assert gallery.match(vector(value)).name == name
+
+
+def test_match_batch_equals_repeated_match():
+    names, matrix, centers, rng = synthetic(50, 1)
+    gallery = FaceGallery(matrix, names)
+    queries = centers + rng.normal(0, 0.2, centers.shape).astype(np.float32)
+    assert gallery.match_batch(queries, 0.6) == [gallery.match(q, 0.6) for q in queries]
+
+
+@pytest.mark.parametrize("noise", [0.02, 0.1, 0.3])
+def test_centroid_path_matches_brute_force(noise):
+    names, matrix, centers, rng = synthetic(40, 4, seed=1)
+    gallery = FaceGallery(matrix, names)
+    assert gallery.index is None and len(gallery) >= 2 * len(gallery.unique_names())
+    for query in centers + rng.normal(0, noise, centers.shape).astype(np.float32):
+        expected = brute_force(names, matrix, query, 0.6)
+        result = gallery.match(query, 0.6)
+        if expected is None:
+            assert result is None
+            continue
+        assert result.name == expected[0]
+        assert result.distance == pytest.approx(expected[1], abs=1e-4)
+        # limite inferior para os usuários descartados: nunca maior que a margem real
+        assert result.margin <= expected[2] + 1e-4
+
+
+def test_ivf_path_probing_every_list_matches_brute_force():
+    names, matrix, centers, rng = synthetic(60, 1, seed=2)
+    gallery = FaceGallery(matrix, names)
+    gallery.attach_index(IVFIndex(n_lists=6, n_probe=6).build(gallery.encodings))
+    gallery.add("novo.png", centers[0] + 0.01)
+    gallery.remove("u5.png")
+    names, matrix = gallery.names, np.array(gallery.encodings)
+    queries = centers + rng.normal(0, 0.05, centers.shape).astype(np.float32)
+    for query in queries:
+        expected = brute_force(names, matrix, query, 0.6)
+        result = gallery.match(query, 0.6)
+        if expected is None:
+            assert result is None
+            continue
+        assert result.name == expected[0]
+        assert result.distance == pytest.approx(expected[1], abs=1e-4)
+        assert result.margin == pytest.approx(expected[2], abs=1e-4)
+    assert gallery.match_batch(queries, 0.6) == [gallery.match(q, 0.6) for q in queries]
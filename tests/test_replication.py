@@ -0,0 +1,76 @@
+import socket, threading
+
+import numpy as np
+import pytest
+
+from src import client as protocol
+from src.client import ReplayGuard, sign, verify, send_message, read_message
+from src.persistence import writer as persistence
+from src.replication import encode_matrix, decode_matrix
+from src.server import RecognitionService, RecognitionServer
+
+
+def test_signed_message_verifies_once_per_guard():
+    guard = ReplayGuard()
+    message = sign("s", {"op": "pull", "clock": {"a": 3}})
+    verify("s", message, guard)
+    with pytest.raises(PermissionError, match="repetida"):
+        verify("s", dict(message), guard)
+    verify("s", sign("s", {"op": "pull", "clock": {"a": 3}}), guard)
+
+
+@pytest.mark.parametrize("field, value", [("auth_id", "outro"), ("clock", {"a": 4}), ("auth_ts", 0.0)])
+def test_tampered_message_is_rejected(field, value):
+    message = sign("s", {"op": "pull", "clock": {"a": 3}})
+    message[field] = value
+    with pytest.raises(PermissionError):
+        verify("s", message)
+
+
+def test_unsigned_id_is_rejected():
+    message = sign("s", {"op": "pull"})
+    del message["auth_id"]
+    with pytest.raises(PermissionError):
+        verify("s", message)
+
+
+def test_guard_forgets_ids_after_window(monkeypatch):
+    guard = ReplayGuard(window=10.0)
+    now = [1000.0]
+    monkeypatch.setattr(protocol.time, "time", lambda: now[0])
+    guard.check("a", 1000.0)
+    now[0] = 1011.0
+    guard.check("b", 1011.0)
+    assert "a" not in guard._seen
+    with pytest.raises(PermissionError):
+        guard.check("b", 1011.0)
+
+
+def test_matrix_codec_round_trip():
+    matrix = np.random.default_rng(0).normal(0, 0.1, (3, 128)).astype(np.float32)
+    data = encode_matrix(matrix)
+    assert isinstance(data, str)
+    assert len(data) < len(str(matrix.tolist())) / 3
+    np.testing.assert_array_equal(decode_matrix(data), matrix)
+    np.testing.assert_array_equal(decode_matrix(matrix.tolist()), matrix)
+    assert decode_matrix(encode_matrix(np.empty((0, 128)))).shape == (0, 128)
+
+
+# Uma mensagem assinada capturada e reenviada ao serviço é recusada
+def test_server_rejects_replayed_request(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    srv = RecognitionServer(RecognitionService(), "127.0.0.1", 0, "s")
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        with socket.create_connection(srv.server_address, timeout=5) as sock:
+            f = sock.makefile("rwb")
+            message = sign("s", {"op": "names", "id": 1})
+            send_message(f, message)
+            assert read_message(f)["ok"]
+            send_message(f, message)
+            reply = read_message(f)
+            assert not reply["ok"] and "repetida" in reply["error"]
+    finally:
+        srv.shutdown()
+        srv.server_close()
+        persistence.flush()
@@ -0,0 +1,95 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.client import RecognitionClient
+from src.persistence import writer as persistence
+from src.server import RecognitionService, RecognitionServer
+from src.utils import check_name
+
+
+def encoding(value):
+    v = np.zeros(128, dtype=np.float32)
+    v[0] = value
+    return v
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    servers = []
+
+    def start(secret=None, host="127.0.0.1"):
+        srv = RecognitionServer(RecognitionService(), host, 0, secret)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        servers.append(srv)
+        return srv
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+    persistence.flush()
+
+
+def client_for(srv, secret=None):
+    return RecognitionClient(*srv.server_address, timeout=5.0, secret=secret)
+
+
+def test_identify_enroll_remove_round_trip(server):
+    client = client_for(server())
+    try:
+        assert client.identify(encoding=encoding(0.1)) == (True, None)
+        assert client.enroll("ana", encoding=encoding(0.1))
+        assert client.names() == ["ana.png"]
+        face, match = client.identify(encoding=encoding(0.15))
+        assert face and match.name == "ana.png"
+        assert match.distance == pytest.approx(0.05, abs=1e-5)
+        assert client.remove("ana")
+        assert not client.remove("ana")
+        assert client.identify(encoding=encoding(0.1)) == (True, None)
+        assert client.stats()["rostos"] == 0
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize("name", ["../../x", "../x.png", "/tmp/x", "a/b", "a\\b", "..", " "])
+def test_rejects_path_names(server, name):
+    client = client_for(server())
+    try:
+        with pytest.raises(RuntimeError, match="inválido"):
+            client.enroll(name, encoding=encoding(0.1))
+        with pytest.raises(RuntimeError, match="inválido"):
+            client.remove(name)
+        assert client.names() == []
+    finally:
+        client.close()
+
+
+def test_check_name():
+    assert check_name("ana.png") == "ana.png"
+    for name in ("../ana.png", "/ana.png", "a/../b", ".", "", None):
+        with pytest.raises(ValueError):
+            check_name(name)
+
+
+def test_secret_is_required_off_loopback(server):
+    with pytest.raises(ValueError):
+        server(host="0.0.0.0")
+
+
+def test_signed_round_trip(server):
+    srv = server(secret="s3gredo")
+    client = client_for(srv, secret="s3gredo")
+    unsigned = client_for(srv)
+    wrong = client_for(srv, secret="outro")
+    try:
+        assert client.enroll("ana", encoding=encoding(0.1))
+        assert client.identify(encoding=encoding(0.1))[1].name == "ana.png"
+        for other in (unsigned, wrong):
+            with pytest.raises(RuntimeError, match="assinatura"):
+                other.names()
+    finally:
+        for c in (client, unsigned, wrong):
+            c.close()
@@ -0,0 +1,137 @@
+import json, os, pickle, struct
+
+import numpy as np
+import pytest
+
+from src import store
+from src.store import EncodingStore, HEADER_SIZE
+
+
+def rows(n, start=0, dim=128):
+    return (np.arange(start, start + n, dtype=np.float32)[:, None] + np.zeros(dim, dtype=np.float32))
+
+
+@pytest.fixture
+def base(tmp_path):
+    return str(tmp_path / "galeria")
+
+
+def test_extend_and_load_round_trip(base):
+    s = EncodingStore(base)
+    s.extend(["a.png", "b.png"], rows(2))
+    s.append("c.png", rows(1, start=2)[0])
+    matrix, names = EncodingStore(base).load()
+    assert isinstance(matrix, np.memmap)
+    assert names == ["a.png", "b.png", "c.png"]
+    np.testing.assert_array_equal(matrix, rows(3))
+
+
+def test_rejects_mismatched_names(base):
+    with pytest.raises(ValueError):
+        EncodingStore(base).extend(["a.png"], rows(2))
+
+
+# Queda depois de gravar dados e nomes, mas antes do contador do cabeçalho
+def test_recovers_from_half_written_extend(base):
+    s = EncodingStore(base)
+    s.extend(["a.png", "b.png"], rows(2))
+    with open(s.bin_path, "r+b") as f:
+        f.seek(HEADER_SIZE + 2 * s.row_bytes)
+        f.write(rows(1, start=9).tobytes()[:s.row_bytes // 2])
+    with open(s.names_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"row": 2, "name": "perdido.png"}) + "\n")
+        f.write('{"row": 3, "na')
+
+    matrix, names = EncodingStore(base).load()
+    assert names == ["a.png", "b.png"]
+    np.testing.assert_array_equal(matrix, rows(2))
+
+    s = EncodingStore(base)
+    s.extend(["c.png", "d.png"], rows(2, start=2))
+    matrix, names = EncodingStore(base).load()
+    assert names == ["a.png", "b.png", "c.png", "d.png"]
+    np.testing.assert_array_equal(matrix, rows(4))
+
+
+def test_count_header_limited_by_file_size(base):
+    s = EncodingStore(base)
+    s.extend(["a.png", "b.png"], rows(2))
+    with open(s.bin_path, "r+b") as f:
+        f.truncate(HEADER_SIZE + s.row_bytes + 10)
+    assert EncodingStore(base).load()[1] == ["a.png"]
+
+
+def test_remove_then_compact(base):
+    s = EncodingStore(base)
+    s.extend(["a.png", "b.png", "a.png", "c.png"], rows(4))
+    assert s.remove("a.png") == 2
+    assert s.remove("a.png") == 0
+
+    matrix, names = EncodingStore(base).load()
+    assert names == ["b.png", "c.png"]
+    np.testing.assert_array_equal(matrix, rows(4)[[1, 3]])
+
+    size = os.path.getsize(s.bin_path)
+    s.compact()
+    assert os.path.getsize(s.bin_path) == size - 2 * s.row_bytes
+    assert not os.path.exists(s.bin_path + ".tmp")
+    matrix, names = EncodingStore(base).load()
+    assert isinstance(matrix, np.memmap)
+    assert names == ["b.png", "c.png"]
+    np.testing.assert_array_equal(matrix, rows(4)[[1, 3]])
+
+    s.extend(["d.png"], rows(1, start=7))
+    assert EncodingStore(base).load()[1] == ["b.png", "c.png", "d.png"]
+
+
+def test_remove_triggers_background_compaction(base, monkeypatch):
+    monkeypatch.setattr(store, "COMPACT_MIN_ROWS", 2)
+    s = EncodingStore(base)
+    s.extend(["a.png", "a.png", "b.png"], rows(3))
+    s.remove("a.png")
+    s._compactor.join(5)
+    assert os.path.getsize(s.bin_path) == HEADER_SIZE + s.row_bytes
+    assert EncodingStore(base).load()[1] == ["b.png"]
+
+
+# Queda entre as duas trocas de arquivo da compactação: a tabela de nomes
+# temporária já corresponde ao .bin novo e deve ser adotada
+def test_recovers_interrupted_compaction(base):
+    s = EncodingStore(base)
+    s.extend(["a.png", "b.png"], rows(2))
+    s.remove("a.png")
+    with open(s.names_path, encoding="utf-8") as f:
+        old_names = f.read()
+    s.compact()
+    os.replace(s.names_path, s.names_path + ".tmp")
+    with open(s.names_path, "w", encoding="utf-8") as f:
+        f.write(old_names)
+    matrix, names = EncodingStore(base).load()
+    assert names == ["b.png"]
+    assert not os.path.exists(s.names_path + ".tmp")
+
+
+def test_mismatched_generation_is_rejected(base):
+    s = EncodingStore(base)
+    s.extend(["a.png"], rows(1))
+    with open(s.bin_path, "r+b") as f:
+        f.seek(12)
+        f.write(struct.pack("<I", 99))
+    with pytest.raises(ValueError):
+        EncodingStore(base).load()
+
+
+def test_migrates_pickle(tmp_path, base):
+    pickle_path = str(tmp_path / "encodings.pkl")
+    encodings = [rows(1, start=1)[0].astype(np.float64), np.zeros(5), rows(1, start=3)[0]]
+    with open(pickle_path, "wb") as f:
+        pickle.dump({"encodings": encodings, "names": ["a.png", "ruim.png", "b.png"]}, f)
+
+    s = EncodingStore(base)
+    assert s.migrate_from_pickle(pickle_path)
+    assert not os.path.exists(pickle_path)
+    assert os.path.exists(pickle_path + ".migrated")
+    matrix, names = EncodingStore(base).load()
+    assert names == ["a.png", "b.png"]
+    np.testing.assert_array_equal(matrix, np.stack([rows(1, start=1)[0], rows(1, start=3)[0]]))
+    assert not EncodingStore(base).migrate_from_pickle(pickle_path)